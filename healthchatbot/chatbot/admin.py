@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine, ChatSession, ChatMessage, URLSource
+from .models import Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine, ChatSession, ChatMessage, ArchivedSession, URLSource, KnowledgeUpdateJob, TrustedSource
 
 class DiseaseSymptomInline(admin.TabularInline):
     model = DiseaseSymptom
@@ -12,8 +12,9 @@ class DiseaseAdmin(admin.ModelAdmin):
     list_filter = ('is_contagious',)
 
 class SymptomAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'is_canonical')
     search_fields = ['name', 'description']
+    list_filter = ('is_canonical',)
 
 class ChatMessageInline(admin.TabularInline):
     model = ChatMessage
@@ -26,25 +27,49 @@ class ChatSessionAdmin(admin.ModelAdmin):
     inlines = [ChatMessageInline]
     readonly_fields = ('session_id', 'created_at', 'updated_at')
 
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'message_count', 'updated_at', 'archived_at', 'archive_file')
+    search_fields = ('session_id',)
+    readonly_fields = ('session_id', 'archive_file', 'offset', 'length', 'message_count', 'created_at',
+                       'updated_at', 'archived_at')
+
+class TrustedSourceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'domain', 'category', 'reliability', 'update_frequency')
+    list_filter = ('category', 'reliability', 'update_frequency')
+    search_fields = ('name', 'domain')
+
 class URLSourceAdmin(admin.ModelAdmin):
-    list_display = ('url', 'last_updated', 'success_count', 'active')
-    list_filter = ('active', 'last_updated')
-    search_fields = ('url',)
+    list_display = ('url', 'trusted_source', 'last_updated', 'success_count', 'last_check_status', 'active')
+    list_filter = ('active', 'last_updated', 'trusted_source__reliability')
+    list_select_related = ('trusted_source',)
+    search_fields = ('url', 'domain')
+    readonly_fields = ('domain', 'trusted_source', 'last_checked_at', 'last_check_status',
+                       'quality_score', 'quality_reliability', 'quality_checked_at')
     actions = ['update_from_urls']
     
     def update_from_urls(self, request, queryset):
-        from .nlp_processor import NLPProcessor
-        processor = NLPProcessor()
+        from .knowledge_jobs import enqueue_knowledge_update
         
         urls = [source.url for source in queryset.filter(active=True)]
-        count = processor.fetch_and_update_knowledge_base(urls)
+        if not urls:
+            self.message_user(request, "Không có URL đang hoạt động nào được chọn.")
+            return
         
-        self.message_user(request, f"Đã cập nhật thành công {count} bệnh từ {len(urls)} URL.")
+        job = enqueue_knowledge_update(urls)
+        
+        self.message_user(request, f"Đã đưa {len(urls)} URL vào hàng đợi cập nhật (job #{job.pk}).")
     
     update_from_urls.short_description = "Cập nhật dữ liệu từ các URL đã chọn"
 
+class KnowledgeUpdateJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'imported_diseases', 'worker', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('urls', 'progress', 'imported_diseases', 'error', 'worker', 'created_at', 'started_at', 'finished_at')
+
 # Đăng ký model mới
 admin.site.register(URLSource, URLSourceAdmin)
+admin.site.register(TrustedSource, TrustedSourceAdmin)
+admin.site.register(KnowledgeUpdateJob, KnowledgeUpdateJobAdmin)
 
 admin.site.register(Disease, DiseaseAdmin)
 admin.site.register(Symptom, SymptomAdmin)
@@ -52,4 +77,5 @@ admin.site.register(Complication)
 admin.site.register(Treatment)
 admin.site.register(Prevention)
 admin.site.register(Vaccine)
-admin.site.register(ChatSession, ChatSessionAdmin)
\ No newline at end of file
+admin.site.register(ChatSession, ChatSessionAdmin)
+admin.site.register(ArchivedSession, ArchivedSessionAdmin)
\ No newline at end of file
@@ -0,0 +1,245 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from unidecode import unidecode
+from . import metrics
+
+# Lý do từ chối request (cũng là hậu tố của bộ đếm admission_shed_*)
+RATE_LIMITED = 'rate_limited'
+QUEUE_FULL = 'queue_full'
+DEADLINE = 'deadline'
+
+# Header client gửi kèm: thời gian (giây) client còn chờ được, bị chặn bởi CHATBOT_REQUEST_TIMEOUT
+DEADLINE_HEADER = 'HTTP_X_REQUEST_TIMEOUT'
+
+# Số client được theo dõi token bucket và số câu trả lời giữ làm dự phòng
+MAX_CLIENTS = 10000
+FALLBACK_CACHE_SIZE = 1000
+
+_deadline = ContextVar('chatbot_request_deadline', default=None)
+
+
+class Shed(Exception):
+    """Request bị từ chối để bảo vệ đường chat; view trả về 429/503 ngay"""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self):
+        return 429 if self.reason == RATE_LIMITED else 503
+
+
+class ConcurrencyLimiter:
+    """Giới hạn số request chat xử lý đồng thời, kèm hàng đợi có giới hạn
+
+    Request vượt giới hạn chờ trong hàng đợi đến deadline của nó; hàng đợi đầy thì bị từ chối ngay,
+    không xếp hàng vô hạn sau các request chậm (dựng lại index, khóa SQLite).
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None):
+        self.max_concurrent = max_concurrent or getattr(settings, 'CHATBOT_MAX_CONCURRENT_CHATS', 4)
+        self.max_queue = max_queue if max_queue is not None else getattr(settings, 'CHATBOT_CHAT_QUEUE_SIZE', 16)
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline):
+        """Chiếm một chỗ xử lý trước deadline (time.monotonic()); trả về None nếu được nhận, ngược lại là lý do từ chối"""
+        with self._condition:
+            if self.in_flight < self.max_concurrent and not self.queued:
+                self.in_flight += 1
+                return None
+            if self.queued >= self.max_queue:
+                return QUEUE_FULL
+
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        return DEADLINE
+                    self._condition.wait(timeout)
+                self.in_flight += 1
+                return None
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'peak_queued': self.peak_queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+            }
+
+
+class ClientThrottle:
+    """Token bucket cho từng client: rate request/giây, cho phép dồn tối đa burst request"""
+
+    def __init__(self, rate=None, burst=None, max_clients=MAX_CLIENTS):
+        self.rate = rate or getattr(settings, 'CHATBOT_CLIENT_RATE', 2.0)
+        self.burst = burst or getattr(settings, 'CHATBOT_CLIENT_BURST', 10)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, client):
+        """Lấy một token của client; trả về 0 nếu được phép, ngược lại số giây cần chờ"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            # Bucket vừa dùng nằm cuối; client lâu không gửi bị loại trước (bucket mới của nó lại đầy)
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class FallbackCache:
+    """Câu trả lời gần đây theo nội dung tin nhắn đã chuẩn hóa, trả kèm khi request bị từ chối"""
+
+    def __init__(self, size=FALLBACK_CACHE_SIZE):
+        self.size = size
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(message):
+        return ' '.join(unidecode(message or '').lower().split())
+
+    def get(self, message):
+        key = self.key(message)
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self._answers.move_to_end(key)
+            return answer
+
+    def put(self, message, answer):
+        key = self.key(message)
+        if not key:
+            return
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.size:
+                self._answers.popitem(last=False)
+
+
+_limiter = None
+_throttle = None
+_fallbacks = None
+_init_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter, _throttle, _fallbacks
+    if _limiter is None:
+        with _init_lock:
+            if _limiter is None:
+                _throttle = ClientThrottle()
+                _fallbacks = FallbackCache()
+                _limiter = ConcurrencyLimiter()
+    return _limiter
+
+
+def get_throttle():
+    get_limiter()
+    return _throttle
+
+
+def get_fallbacks():
+    get_limiter()
+    return _fallbacks
+
+
+def client_key(request):
+    """Địa chỉ client dùng cho token bucket
+
+    Mặc định REMOTE_ADDR. Sau reverse proxy, đặt CHATBOT_CLIENT_IP_HEADER (vd. 'X-Forwarded-For') và
+    CHATBOT_TRUSTED_PROXIES (số proxy tin cậy phía trước app, mặc định 1): lấy địa chỉ do proxy tin cậy
+    ngoài cùng ghi vào, tính từ phải sang; các phần tử bên trái do client tự gửi nên không dùng.
+    """
+    header = getattr(settings, 'CHATBOT_CLIENT_IP_HEADER', None)
+    if header:
+        value = request.META.get('HTTP_' + header.upper().replace('-', '_'), '')
+        addresses = [address.strip() for address in value.split(',') if address.strip()]
+        trusted = max(1, getattr(settings, 'CHATBOT_TRUSTED_PROXIES', 1))
+        if addresses:
+            return addresses[-min(trusted, len(addresses))]
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def request_deadline(request):
+    """Deadline (time.monotonic()) của request: thời gian client còn chờ, không quá CHATBOT_REQUEST_TIMEOUT"""
+    timeout = getattr(settings, 'CHATBOT_REQUEST_TIMEOUT', 10.0)
+    try:
+        timeout = min(timeout, float(request.META.get(DEADLINE_HEADER, timeout)))
+    except ValueError:
+        pass
+    return time.monotonic() + max(timeout, 0.0)
+
+
+def remaining():
+    """Số giây còn lại đến deadline của request đang xử lý (None nếu ngoài admit())"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline():
+    """Từ chối request đã quá deadline trước một bước tốn kém (client đã bỏ đi, làm tiếp là phí)"""
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.incr(f'admission_shed_{DEADLINE}')
+        raise Shed(DEADLINE)
+
+
+@contextmanager
+def admit(request):
+    """Cho request vào đường chat, hoặc raise Shed: client vượt token bucket (429), hàng đợi đầy hoặc
+    hết deadline khi đang chờ (503). Deadline được giữ trong context để các bước sau kiểm tra."""
+    limiter = get_limiter()
+
+    wait = get_throttle().allow(client_key(request))
+    if wait:
+        metrics.incr(f'admission_shed_{RATE_LIMITED}')
+        raise Shed(RATE_LIMITED, retry_after=max(1, math.ceil(wait)))
+
+    deadline = request_deadline(request)
+    queued = limiter.in_flight >= limiter.max_concurrent
+    reason = limiter.acquire(deadline)
+    if queued and reason != QUEUE_FULL:
+        metrics.incr('admission_queued')
+    if reason:
+        metrics.incr(f'admission_shed_{reason}')
+        raise Shed(reason)
+
+    metrics.incr('admission_admitted')
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+        limiter.release()
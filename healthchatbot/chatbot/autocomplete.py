@@ -0,0 +1,132 @@
+from unidecode import unidecode
+
+# Số gợi ý tối đa giữ sẵn ở mỗi node (cũng là giới hạn của endpoint suggest)
+MAX_SUGGESTIONS = 10
+
+# Chỉ gợi ý khi đoạn đang gõ có ít nhất chừng này ký tự
+MIN_PREFIX_LENGTH = 2
+
+# Thứ tự ưu tiên khi hai mục có cùng độ phổ biến
+KIND_ORDER = {'disease': 0, 'symptom': 1, 'treatment': 2, 'prevention': 3}
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def _common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class _Node:
+    __slots__ = ('edges', 'top')
+
+    def __init__(self, top=None):
+        self.edges = {}  # ký tự đầu của nhãn cạnh -> (nhãn, node con)
+        self.top = top or []  # id các mục phổ biến nhất trong cây con, đã sắp xếp
+
+
+class SuggestionTrie:
+    """Radix trie (trie nén) tên bệnh/triệu chứng/thuật ngữ cho gợi ý khi gõ
+
+    Mỗi mục được thêm với hai khóa: dạng có dấu và dạng unidecode, nên gõ không dấu vẫn ra gợi ý.
+    Mỗi node giữ sẵn MAX_SUGGESTIONS mục phổ biến nhất của cây con, vì vậy một truy vấn chỉ cần đi
+    theo tiền tố (O(độ dài tiền tố)) và trả về danh sách có sẵn, không duyệt cây con.
+    """
+
+    def __init__(self):
+        self.entries = {}  # dạng chuẩn hóa -> {'text', 'kind', 'popularity'}
+        self.root = _Node()
+        self.max_words = 1
+        self._items = []
+
+    def add(self, text, kind, popularity=0):
+        """Thêm một mục; mục trùng tên (không phân biệt hoa thường) giữ độ phổ biến cao nhất"""
+        text = ' '.join(text.split())
+        key = normalize(text)
+        if not key:
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = {'text': text, 'kind': kind, 'popularity': popularity}
+        elif popularity > entry['popularity']:
+            entry.update(text=text, kind=kind, popularity=popularity)
+
+    def build(self):
+        """Dựng trie từ các mục đã thêm; gọi một lần sau khi add xong"""
+        ranked = sorted(self.entries.items(), key=lambda item: (
+            -item[1]['popularity'], KIND_ORDER.get(item[1]['kind'], len(KIND_ORDER)), len(item[0]), item[0]))
+        self._items = [entry for _, entry in ranked]
+        self.root = _Node()
+        # Chèn theo thứ tự phổ biến giảm dần: danh sách top của mỗi node tự nhiên đã được sắp xếp
+        for entry_id, (key, _) in enumerate(ranked):
+            self.max_words = max(self.max_words, len(key.split()))
+            for variant in {key, unidecode(key)}:
+                self._insert(variant, entry_id)
+        return self
+
+    def __len__(self):
+        return len(self._items)
+
+    def _offer(self, node, entry_id):
+        if len(node.top) < MAX_SUGGESTIONS and entry_id not in node.top:
+            node.top.append(entry_id)
+
+    def _insert(self, key, entry_id):
+        node = self.root
+        self._offer(node, entry_id)
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                child = _Node()
+                node.edges[key[0]] = (key, child)
+                self._offer(child, entry_id)
+                return
+            label, child = edge
+            common = _common_prefix_length(label, key)
+            if common < len(label):
+                # Tách cạnh: node giữa có cùng cây con với child nên thừa hưởng danh sách top của nó
+                middle = _Node(list(child.top))
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[0]] = (label[:common], middle)
+                child = middle
+            self._offer(child, entry_id)
+            node = child
+            key = key[common:]
+
+    def _find(self, prefix):
+        node = self.root
+        while prefix:
+            edge = node.edges.get(prefix[0])
+            if edge is None:
+                return None
+            label, child = edge
+            if label.startswith(prefix):
+                # Tiền tố kết thúc giữa cạnh: cây con là của child
+                return child
+            if not prefix.startswith(label):
+                return None
+            prefix = prefix[len(label):]
+            node = child
+        return node
+
+    def complete(self, query, limit=MAX_SUGGESTIONS):
+        """Gợi ý cho đoạn cuối đang gõ của query
+
+        Thử các đoạn cuối từ dài (tối đa max_words từ) tới ngắn, mỗi đoạn thử dạng gõ và dạng không dấu;
+        trả về (đoạn khớp, [mục]) để client thay đoạn đó bằng gợi ý, hoặc ('', []) nếu không có.
+        """
+        words = normalize(query).split()
+        for start in range(max(0, len(words) - self.max_words), len(words)):
+            fragment = ' '.join(words[start:])
+            if len(fragment) < MIN_PREFIX_LENGTH:
+                continue
+            for variant in dict.fromkeys((fragment, unidecode(fragment))):
+                node = self._find(variant)
+                if node is not None and node.top:
+                    return fragment, [self._items[i] for i in node.top[:limit]]
+        return '', []
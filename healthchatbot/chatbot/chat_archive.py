@@ -0,0 +1,212 @@
+import gzip
+import json
+import logging
+import os
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ChatSession, ChatMessage, ArchivedSession
+from . import stats_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def delete_rows(model, column, values, max_pk=None):
+    """DELETE FROM <bảng> WHERE <column> IN (values) [AND pk <= max_pk] bằng SQL tường minh (không qua
+    collector, không phát signal); trả về số dòng đã xóa"""
+    if not values:
+        return 0
+    quote = connection.ops.quote_name
+    sql = f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({', '.join(['%s'] * len(values))})"
+    params = list(values)
+    if max_pk is not None:
+        sql += f' AND {quote(model._meta.pk.column)} <= %s'
+        params.append(max_pk)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def get_archive_dir():
+    return Path(getattr(settings, 'CHATBOT_ARCHIVE_DIR', settings.BASE_DIR / 'chat_archive'))
+
+
+def get_retention_days():
+    return getattr(settings, 'CHATBOT_CHAT_RETENTION_DAYS', 90)
+
+
+def encode_session(messages):
+    """Một phiên -> một gzip member độc lập (JSONL, mỗi dòng một tin nhắn)
+
+    Các member nối tiếp nhau vẫn là một file gzip hợp lệ (zcat đọc được cả file),
+    đồng thời đọc lại một phiên chỉ cần seek tới offset và giải nén đúng member đó.
+    """
+    lines = ''.join(json.dumps(message, ensure_ascii=False) + '\n' for message in messages)
+    return gzip.compress(lines.encode('utf-8'))
+
+
+def read_archived_messages(archived):
+    """Tin nhắn của một ArchivedSession, theo thứ tự thời gian"""
+    with open(get_archive_dir() / archived.archive_file, 'rb') as f:
+        f.seek(archived.offset)
+        data = gzip.decompress(f.read(archived.length))
+    return [json.loads(line) for line in data.decode('utf-8').splitlines() if line]
+
+
+def session_history(session_id):
+    """Toàn bộ lịch sử của một phiên: phần đã lưu trữ (nếu có) rồi tới tin nhắn trong bảng nóng
+
+    Trả về (messages, archived) hoặc None nếu không có phiên nào với session_id này.
+    """
+    archived = ArchivedSession.objects.filter(session_id=session_id).first()
+    session = ChatSession.objects.filter(session_id=session_id).first()
+    if archived is None and session is None:
+        return None
+
+    messages = []
+    if archived is not None:
+        messages.extend(
+            {'sender': m['sender'], 'message': m['message'], 'timestamp': m['timestamp']}
+            for m in read_archived_messages(archived)
+        )
+    if session is not None:
+        messages.extend(
+            {'sender': sender, 'message': message, 'timestamp': timestamp.isoformat()}
+            for sender, message, timestamp in ChatMessage.objects.filter(session=session)
+            .order_by('timestamp', 'pk').values_list('sender', 'message', 'timestamp')
+        )
+    return messages, archived is not None
+
+
+class ChatArchiver:
+    """Chuyển các phiên không hoạt động quá N ngày sang file lưu trữ, theo từng chunk
+
+    Mỗi chunk: ghi các gzip member và fsync trước, sau đó trong một transaction ghi ArchivedSession
+    và xóa hàng loạt tin nhắn/phiên. Nếu tiến trình dừng giữa chừng, lần chạy sau ghi lại các phiên
+    chưa xóa (ArchivedSession được upsert), không mất dữ liệu.
+    """
+
+    def __init__(self, days=None, chunk_size=200, max_sessions=None, dry_run=False):
+        self.cutoff = timezone.now() - timedelta(days=get_retention_days() if days is None else days)
+        self.chunk_size = chunk_size
+        self.max_sessions = max_sessions
+        self.dry_run = dry_run
+
+        self.archive_file = f"chat-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz"
+        self.sessions = 0
+        self.messages = 0
+        self.skipped = 0
+
+    def candidate_chunks(self):
+        """pk các phiên quá hạn, phân trang theo khóa (pk > pk cuối) thay vì OFFSET"""
+        last_pk = 0
+        remaining = self.max_sessions
+        while remaining is None or remaining > 0:
+            limit = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            pks = list(ChatSession.objects.filter(pk__gt=last_pk, updated_at__lt=self.cutoff)
+                       .order_by('pk').values_list('pk', flat=True)[:limit])
+            if not pks:
+                return
+            last_pk = pks[-1]
+
+            # updated_at chỉ được cập nhật từ khi có lưu trữ: kiểm tra thêm tin nhắn mới (dùng index session+timestamp)
+            recent = set(ChatMessage.objects.filter(session_id__in=pks, timestamp__gte=self.cutoff)
+                         .values_list('session_id', flat=True).distinct())
+            self.skipped += len(recent)
+            pks = [pk for pk in pks if pk not in recent]
+            if pks:
+                if remaining is not None:
+                    remaining -= len(pks)
+                yield pks
+
+    def run(self):
+        path = get_archive_dir() / self.archive_file
+        output = None
+        try:
+            for pks in self.candidate_chunks():
+                if self.dry_run:
+                    self.sessions += len(pks)
+                    self.messages += ChatMessage.objects.filter(session_id__in=pks).count()
+                    continue
+                if output is None:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    output = open(path, 'ab')
+                self.archive_chunk(pks, output)
+        finally:
+            if output is not None:
+                output.close()
+
+        if self.sessions and not self.dry_run:
+            logger.info(f"Archived {self.sessions} chat sessions ({self.messages} messages) to {path}")
+        return {
+            'sessions': self.sessions,
+            'messages': self.messages,
+            'skipped_recent': self.skipped,
+            'archive_file': self.archive_file if self.sessions and not self.dry_run else None,
+        }
+
+    def archive_chunk(self, pks, output):
+        sessions = {pk: (session_id, created_at, updated_at) for pk, session_id, created_at, updated_at in
+                    ChatSession.objects.filter(pk__in=pks).values_list('pk', 'session_id', 'created_at', 'updated_at')}
+        previous = {archived.session_id: archived
+                    for archived in ArchivedSession.objects.filter(session_id__in=[s[0] for s in sessions.values()])}
+
+        messages_by_session = {pk: [] for pk in sessions}
+        max_message_pk = 0
+        for pk, session_pk, sender, message, timestamp in (
+                ChatMessage.objects.filter(session_id__in=pks).order_by('session_id', 'timestamp', 'pk')
+                .values_list('pk', 'session_id', 'sender', 'message', 'timestamp')):
+            max_message_pk = max(max_message_pk, pk)
+            messages_by_session[session_pk].append({
+                'sender': sender, 'message': message, 'timestamp': timestamp.isoformat(),
+            })
+
+        records = []
+        message_count = 0
+        for session_pk, (session_id, created_at, updated_at) in sessions.items():
+            messages = messages_by_session[session_pk]
+            message_count += len(messages)
+            old = previous.get(session_id)
+            if old is not None:
+                # Phiên đã được lưu trữ trước đó rồi được dùng lại: gộp phần cũ vào member mới
+                messages = read_archived_messages(old) + messages
+                created_at = min(created_at, old.created_at)
+            for message in messages:
+                message['session_id'] = session_id
+
+            data = encode_session(messages)
+            offset = output.tell()
+            output.write(data)
+            records.append(ArchivedSession(
+                session_id=session_id, archive_file=self.archive_file, offset=offset, length=len(data),
+                message_count=len(messages), created_at=created_at,
+                updated_at=parse_datetime(messages[-1]['timestamp']) if messages else updated_at,
+                archived_at=timezone.now(),
+            ))
+
+        output.flush()
+        os.fsync(output.fileno())
+
+        with transaction.atomic():
+            ArchivedSession.objects.bulk_create(
+                records, update_conflicts=True, unique_fields=['session_id'],
+                update_fields=['archive_file', 'offset', 'length', 'message_count', 'created_at', 'updated_at',
+                               'archived_at'],
+            )
+            # Xóa thẳng bằng DELETE ... WHERE: QuerySet.delete() sẽ load từng object để phát post_delete,
+            # mỗi object một lần cập nhật bộ đếm thống kê; bộ đếm được chỉnh một lần bên dưới.
+            # Tin nhắn đến sau khi đọc (pk lớn hơn) được giữ lại cùng phiên của nó
+            deleted_messages = delete_rows(ChatMessage, ChatMessage._meta.get_field('session').column, pks,
+                                           max_pk=max_message_pk)
+            still_active = set(ChatMessage.objects.filter(session_id__in=pks).values_list('session_id', flat=True))
+            deleted_sessions = delete_rows(ChatSession, ChatSession._meta.pk.column,
+                                           [pk for pk in pks if pk not in still_active])
+
+            stats_snapshot.adjust('total_messages', -deleted_messages)
+            stats_snapshot.adjust('total_sessions', -deleted_sessions)
+
+        self.sessions += len(records)
+        self.messages += message_count
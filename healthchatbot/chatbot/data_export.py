@@ -0,0 +1,118 @@
+import logging
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from .models import Disease, DiseaseSymptom, Symptom, ChatSession, ChatMessage, URLSource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def keyset_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, after=None):
+    """Duyệt queryset theo từng trang pk > pk cuối (keyset), không dùng OFFSET nên trang sau không chậm dần
+
+    Mỗi trang là một truy vấn riêng, vì vậy bộ nhớ chỉ phụ thuộc chunk_size, không phụ thuộc kích thước bảng.
+    """
+    last_pk = after or 0
+    while True:
+        page = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not page:
+            return
+        yield page
+        last_pk = page[-1].pk if hasattr(page[-1], 'pk') else page[-1]['id']
+        if len(page) < chunk_size:
+            return
+
+
+def iter_messages(chunk_size=DEFAULT_CHUNK_SIZE, after=None):
+    queryset = ChatMessage.objects.values('id', 'session__session_id', 'sender', 'message', 'timestamp')
+    for page in keyset_chunks(queryset, chunk_size, after):
+        for row in page:
+            yield {
+                'id': row['id'],
+                'session_id': row['session__session_id'],
+                'sender': row['sender'],
+                'message': row['message'],
+                'timestamp': row['timestamp'],
+            }
+
+
+def iter_sessions(chunk_size=DEFAULT_CHUNK_SIZE, after=None):
+    """Mỗi phiên một bản ghi kèm tin nhắn; tin nhắn của cả trang được đọc bằng một truy vấn
+    theo index (session, timestamp) qua iterator, không load toàn bộ bảng"""
+    queryset = ChatSession.objects.values('id', 'session_id', 'created_at', 'updated_at')
+    for page in keyset_chunks(queryset, chunk_size, after):
+        messages = {row['id']: [] for row in page}
+        rows = (ChatMessage.objects.filter(session_id__in=list(messages))
+                .order_by('session_id', 'timestamp', 'pk')
+                .values_list('session_id', 'sender', 'message', 'timestamp'))
+        for session_pk, sender, message, timestamp in rows.iterator(chunk_size=chunk_size):
+            messages[session_pk].append({'sender': sender, 'message': message, 'timestamp': timestamp})
+
+        for row in page:
+            yield dict(row, messages=messages[row['id']])
+
+
+def iter_diseases(chunk_size=500, after=None):
+    """Knowledge base theo từng bệnh: triệu chứng (kèm relevance_score), biến chứng, điều trị, phòng ngừa, vắc-xin"""
+    queryset = Disease.objects.prefetch_related(
+        Prefetch('symptoms_link', queryset=DiseaseSymptom.objects.select_related('symptom').order_by('-relevance_score')),
+        'complications', 'treatments', 'preventions', 'vaccines',
+    )
+    for page in keyset_chunks(queryset, chunk_size, after):
+        for disease in page:
+            yield {
+                'id': disease.pk,
+                'name': disease.name,
+                'description': disease.description,
+                'causes': disease.causes,
+                'is_contagious': disease.is_contagious,
+                'source_url': disease.source_url,
+                'duplicate_of': disease.duplicate_of_id,
+                'symptoms': [{'name': link.symptom.name, 'relevance_score': link.relevance_score}
+                             for link in disease.symptoms_link.all()],
+                'complications': [{'name': c.name, 'description': c.description} for c in disease.complications.all()],
+                'treatments': [{'name': t.name, 'description': t.description} for t in disease.treatments.all()],
+                'preventions': [{'method': p.method, 'description': p.description} for p in disease.preventions.all()],
+                'vaccines': [{'name': v.name, 'manufacturer': v.manufacturer} for v in disease.vaccines.all()],
+            }
+
+
+def iter_symptoms(chunk_size=DEFAULT_CHUNK_SIZE, after=None):
+    queryset = Symptom.objects.values('id', 'name', 'description', 'is_canonical')
+    for page in keyset_chunks(queryset, chunk_size, after):
+        yield from page
+
+
+def iter_sources(chunk_size=DEFAULT_CHUNK_SIZE, after=None):
+    queryset = URLSource.objects.values(
+        'id', 'url', 'domain', 'active', 'last_updated', 'success_count', 'failure_count', 'sitemap_lastmod',
+        'last_checked_at', 'last_check_status', 'quality_score', 'quality_reliability',
+    )
+    for page in keyset_chunks(queryset, chunk_size, after):
+        yield from page
+
+
+EXPORTERS = {
+    'sessions': iter_sessions,
+    'messages': iter_messages,
+    'diseases': iter_diseases,
+    'symptoms': iter_symptoms,
+    'sources': iter_sources,
+}
+
+
+def iter_ndjson(records):
+    """Mã hóa từng bản ghi thành một dòng JSON (NDJSON), giữ nguyên tiếng Việt"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records:
+        yield encoder.encode(record) + '\n'
+
+
+def export_lines(kind, chunk_size=None, after=None):
+    """Generator các dòng NDJSON cho một loại dữ liệu (xem EXPORTERS)"""
+    exporter = EXPORTERS[kind]
+    kwargs = {'after': after}
+    if chunk_size:
+        kwargs['chunk_size'] = chunk_size
+    return iter_ndjson(exporter(**kwargs))
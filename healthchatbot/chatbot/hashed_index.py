@@ -0,0 +1,107 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Số cột của không gian băm (CHATBOT_HASH_FEATURES): bộ nhớ cố định, không phụ thuộc vocabulary
+DEFAULT_N_FEATURES = 2 ** 18
+
+# Số tài liệu mỗi shard khi dựng song song
+SHARD_SIZE = 2000
+
+
+def make_hasher(n_features):
+    # Giống TfidfVectorizer của processor: unigram + bigram, đếm tần suất thô (IDF và chuẩn hóa làm sau)
+    return HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm=None,
+                             dtype=np.float32)
+
+
+def count_shard(texts, n_features):
+    """Vector tần suất của một shard và số tài liệu chứa mỗi cột (document frequency)
+
+    Không cần trạng thái dùng chung nên chạy được ở process riêng; kết quả các shard cộng lại được.
+    """
+    tf = make_hasher(n_features).transform(texts)
+    tf.sum_duplicates()
+    df = np.bincount(tf.indices, minlength=n_features).astype(np.int64)
+    return tf, df
+
+
+class HashedTfidfIndex:
+    """Thay thế TfidfVectorizer bằng feature hashing, IDF giữ dưới dạng số đếm document frequency
+
+    Không có bước dựng vocabulary toàn cục: mỗi shard được vector hóa độc lập (kể cả ở process khác)
+    rồi gộp bằng cách nối ma trận tần suất và cộng mảng df; tài liệu mới được thêm vào cùng cách đó,
+    không fit lại. Bộ nhớ ngoài ma trận tài liệu chỉ gồm mảng df/idf kích thước n_features.
+    Có transform() như vectorizer, trọng số giống TfidfVectorizer (smooth idf, chuẩn hóa L2).
+    """
+
+    def __init__(self, n_features=None):
+        self.n_features = n_features or getattr(settings, 'CHATBOT_HASH_FEATURES', DEFAULT_N_FEATURES)
+        self.hasher = make_hasher(self.n_features)
+        self.df = np.zeros(self.n_features, dtype=np.int64)
+        self.n_docs = 0
+        self.tf = sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+        self._idf = None
+        self._matrix = None
+
+    @classmethod
+    def build(cls, texts, workers=None, n_features=None):
+        """Dựng index từ danh sách văn bản, chia shard cho nhiều process khi có nhiều tài liệu"""
+        index = cls(n_features)
+        workers = workers or getattr(settings, 'CHATBOT_INDEX_BUILD_WORKERS', 1)
+        shards = [texts[i:i + SHARD_SIZE] for i in range(0, len(texts), SHARD_SIZE)]
+
+        if workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map giữ thứ tự shard, hàng của ma trận trùng thứ tự texts
+                counted = list(executor.map(count_shard, shards, [index.n_features] * len(shards)))
+        else:
+            counted = [count_shard(shard, index.n_features) for shard in shards]
+        if counted:
+            index.merge(sparse.vstack([tf for tf, _ in counted], format='csr'), sum(df for _, df in counted))
+        return index
+
+    def add(self, texts):
+        """Thêm tài liệu vào cuối index (hàng mới), không fit lại"""
+        self.merge(*count_shard(texts, self.n_features))
+
+    def merge(self, tf, df):
+        """Gộp kết quả count_shard của một shard vào index"""
+        self.tf = sparse.vstack([self.tf, tf], format='csr')
+        self.df += df
+        self.n_docs += tf.shape[0]
+        self._idf = None
+        self._matrix = None
+
+    @property
+    def idf(self):
+        if self._idf is None:
+            # Cùng công thức smooth_idf của TfidfVectorizer
+            self._idf = (np.log((1 + self.n_docs) / (1 + self.df)) + 1).astype(np.float32)
+        return self._idf
+
+    def weight(self, tf):
+        """tf * idf rồi chuẩn hóa L2 từng hàng"""
+        weighted = sparse.csr_matrix(tf, dtype=np.float32, copy=True)
+        weighted.data *= self.idf[weighted.indices]
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        weighted.data /= np.repeat(norms, np.diff(weighted.indptr)).astype(np.float32)
+        return weighted
+
+    def transform(self, texts):
+        return self.weight(self.hasher.transform(texts))
+
+    @property
+    def matrix(self):
+        """Ma trận tài liệu đã đánh trọng số (tính lại khi df thay đổi, O(số phần tử khác 0))"""
+        if self._matrix is None:
+            self._matrix = self.weight(self.tf)
+        return self._matrix
+
+    @property
+    def nbytes(self):
+        return (self.tf.data.nbytes + self.tf.indices.nbytes + self.tf.indptr.nbytes
+                + self.df.nbytes + self.idf.nbytes)
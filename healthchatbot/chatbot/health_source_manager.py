@@ -1,14 +1,48 @@
-import requests
 import logging
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
 from django.utils import timezone
 from django.db import transaction
-from .models import URLSource, Disease, Symptom
+from django.db.models import Case, Count, F, Func, IntegerField, DateTimeField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import URLSource, Disease, Symptom, TrustedSource
+from .trusted_sources import TRUSTED_SOURCES, normalize_domain, reliability_label
 from .vietnamese_medical_processor import VietnameseMedicalProcessor
 from .nlp_processor import ImprovedNLPProcessor
+from .source_discovery import DiscoveryFrontier, save_discovered_sources
+from .liveness import LivenessChecker
+from .source_quality import score_page, score_pages, save_scores, fetch_page, fetch_pages, error_result
+from . import page_cache
 
 logger = logging.getLogger(__name__)
 
+UPDATE_FREQUENCY_INTERVALS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+
+class DaysSince(Func):
+    """Số ngày (làm tròn xuống) từ một cột thời gian đến thời điểm `now`, tính trong database"""
+    template = 'EXTRACT(DAY FROM (%(expressions)s))'
+    arg_joiner = ' - '
+    output_field = IntegerField()
+    
+    def __init__(self, expression, now, **extra):
+        super().__init__(Value(now, output_field=DateTimeField()), expression, **extra)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           template='CAST(julianday(%(expressions)s) AS INTEGER)',
+                           arg_joiner=') - julianday(', **extra_context)
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        now, expression = self.get_source_expressions()
+        clone = self.copy()
+        clone.set_source_expressions([expression, now])
+        return clone.as_sql(compiler, connection, template='TIMESTAMPDIFF(DAY, %(expressions)s)',
+                            arg_joiner=', ', **extra_context)
+
 class HealthSourceManager:
     """Quản lý toàn diện các nguồn thông tin y tế"""
     
@@ -16,206 +50,78 @@ class HealthSourceManager:
         self.medical_processor = VietnameseMedicalProcessor()
         self.nlp_processor = ImprovedNLPProcessor()
         
-        # Danh sách nguồn đáng tin cậy cho y tế Việt Nam
-        self.trusted_sources = {
-            'government': [
-                {
-                    'url': 'https://moh.gov.vn/tin-tuc-su-kien',
-                    'name': 'Bộ Y tế Việt Nam',
-                    'reliability': 5,
-                    'update_frequency': 'daily',
-                    'content_types': ['news', 'guidelines', 'health_alerts']
-                },
-                {
-                    'url': 'https://kcb.vn/',
-                    'name': 'Cổng thông tin khám chữa bệnh',
-                    'reliability': 5,
-                    'update_frequency': 'daily',
-                    'content_types': ['healthcare_facilities', 'medical_procedures']
-                }
-            ],
-            'medical_centers': [
-                {
-                    'url': 'https://vnvc.vn/cac-benh-truyen-nhiem-thuong-gap/',
-                    'name': 'VNVC - Trung tâm tiêm chủng',
-                    'reliability': 4,
-                    'update_frequency': 'weekly',
-                    'content_types': ['infectious_diseases', 'vaccines', 'prevention']
-                },
-                {
-                    'url': 'https://www.vinmec.com/vi/bai-viet/cac-benh-truyen-nhiem-thuong-gap-175',
-                    'name': 'Vinmec International Hospital',
-                    'reliability': 4,
-                    'update_frequency': 'weekly',
-                    'content_types': ['diseases', 'treatments', 'health_tips']
-                },
-                {
-                    'url': 'https://benhvienbachmai.vn/tin-tuc-su-kien/',
-                    'name': 'Bệnh viện Bạch Mai',
-                    'reliability': 4,
-                    'update_frequency': 'weekly',
-                    'content_types': ['medical_news', 'treatments', 'specialties']
-                },
-                {
-                    'url': 'https://www.108.vn/benh-vien/danh-sach-benh-vien',
-                    'name': 'Bệnh viện Trung ương Quân đội 108',
-                    'reliability': 4,
-                    'update_frequency': 'weekly',
-                    'content_types': ['medical_services', 'health_information']
-                }
-            ],
-            'health_portals': [
-                {
-                    'url': 'https://suckhoedoisong.vn/benh-truyen-nhiem/',
-                    'name': 'Sức khỏe đời sống',
-                    'reliability': 3,
-                    'update_frequency': 'daily',
-                    'content_types': ['health_news', 'lifestyle', 'disease_info']
-                },
-                {
-                    'url': 'https://hellobacsi.com/benh-truyen-nhiem/',
-                    'name': 'Hello Bacsi',
-                    'reliability': 3,
-                    'update_frequency': 'daily',
-                    'content_types': ['health_articles', 'medical_advice', 'symptoms']
-                },
-                {
-                    'url': 'https://nhathuoclongchau.com.vn/bai-viet/cac-benh-truyen-nhiem-thuong-gap.html',
-                    'name': 'Nhà thuốc Long Châu',
-                    'reliability': 3,
-                    'update_frequency': 'weekly',
-                    'content_types': ['medications', 'health_tips', 'disease_prevention']
-                }
-            ],
-            'international': [
-                {
-                    'url': 'https://medlineplus.gov/languages/vietnamese.html',
-                    'name': 'MedlinePlus Vietnamese',
-                    'reliability': 5,
-                    'update_frequency': 'weekly',
-                    'content_types': ['medical_encyclopedia', 'health_topics', 'drug_information']
-                },
-                {
-                    'url': 'https://www.who.int/vietnam/health-topics',
-                    'name': 'WHO Vietnam',
-                    'reliability': 5,
-                    'update_frequency': 'weekly',
-                    'content_types': ['global_health', 'disease_outbreaks', 'health_guidelines']
-                }
-            ]
-        }
+        # Danh sách nguồn đáng tin cậy cho y tế Việt Nam (bản gốc, được lưu vào bảng TrustedSource)
+        self.trusted_sources = TRUSTED_SOURCES
+    
+    def sync_trusted_sources(self):
+        """Đồng bộ danh sách nguồn tin cậy vào database và gán lại cho các URLSource"""
+        synced = 0
+        for category, sources_list in self.trusted_sources.items():
+            for source in sources_list:
+                TrustedSource.objects.update_or_create(
+                    domain=normalize_domain(source['url']),
+                    defaults={
+                        'name': source['name'],
+                        'category': category,
+                        'url': source['url'],
+                        'reliability': source['reliability'],
+                        'update_frequency': source['update_frequency'],
+                        'content_types': source['content_types'],
+                    }
+                )
+                synced += 1
+        
+        URLSource.link_trusted_sources()
+        return synced
     
     def validate_source_quality(self, url, content=None):
         """Đánh giá chất lượng nguồn thông tin"""
-        quality_score = 0
-        issues = []
-        recommendations = []
-        
         try:
             if not content:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (compatible; HealthBot/1.0; +https://example.com/bot)'
-                }
-                response = requests.get(url, headers=headers, timeout=15)
-                content = response.text
-            
-            # Kiểm tra độ dài nội dung
-            if len(content) < 1000:
-                issues.append("Nội dung quá ngắn")
-                quality_score -= 20
-            else:
-                quality_score += 10
-            
-            # Kiểm tra có phải nội dung y tế không
-            medical_entities = self.medical_processor.extract_medical_entities(content)
-            total_entities = sum(len(entities) for entities in medical_entities.values())
-            
-            if total_entities > 10:
-                quality_score += 30
-                recommendations.append("Nguồn chứa nhiều thông tin y tế hữu ích")
-            elif total_entities > 5:
-                quality_score += 15
-            else:
-                quality_score -= 10
-                issues.append("Ít thông tin y tế")
-            
-            # Kiểm tra cấu trúc HTML
-            if '<h1>' in content or '<h2>' in content:
-                quality_score += 10
-            if '<ul>' in content or '<ol>' in content:
-                quality_score += 10
-            
-            # Kiểm tra có thông tin tác giả/nguồn không
-            author_indicators = ['tác giả', 'bác sĩ', 'bs.', 'ths.', 'pgs.', 'gs.']
-            if any(indicator in content.lower() for indicator in author_indicators):
-                quality_score += 15
-                recommendations.append("Có thông tin về tác giả/chuyên gia")
-            
-            # Kiểm tra ngày cập nhật
-            date_patterns = [r'\d{1,2}[/-]\d{1,2}[/-]\d{4}', r'\d{4}[/-]\d{1,2}[/-]\d{1,2}']
-            has_date = any(re.search(pattern, content) for pattern in date_patterns)
-            if has_date:
-                quality_score += 10
-                recommendations.append("Có thông tin về ngày đăng/cập nhật")
-            
-            # Xác định mức độ tin cậy
-            if quality_score >= 70:
-                reliability = 'high'
-            elif quality_score >= 40:
-                reliability = 'medium'
-            else:
-                reliability = 'low'
-                issues.append("Chất lượng nội dung cần cải thiện")
+                content = page_cache.get_page(url)
+            if not content:
+                content = fetch_page(url)
             
-            return {
-                'quality_score': quality_score,
-                'reliability': reliability,
-                'issues': issues,
-                'recommendations': recommendations,
-                'medical_entities_count': total_entities
-            }
+            return score_page(content)
             
         except Exception as e:
             logger.error(f"Error validating source quality: {e}")
-            return {
-                'quality_score': 0,
-                'reliability': 'unknown',
-                'issues': [f"Lỗi khi đánh giá: {str(e)}"],
-                'recommendations': [],
-                'medical_entities_count': 0
-            }
+            return error_result(str(e))
     
-    def auto_discover_health_sources(self, base_urls):
-        """Tự động khám phá các nguồn y tế từ các URL cơ sở"""
-        discovered_sources = []
+    def validate_sources(self, urls, max_workers=None, save=True):
+        """Đánh giá chất lượng nhiều nguồn: dùng lại trang đã cache, chấm điểm song song, lưu vào URLSource"""
+        urls = list(dict.fromkeys(urls))
+        pages, errors = fetch_pages(urls)
+        scores = score_pages(pages, max_workers=max_workers)
         
-        for base_url in base_urls:
-            try:
-                response = requests.get(base_url, timeout=15)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Tìm các link có chứa từ khóa y tế
-                health_keywords = ['benh', 'suc-khoe', 'y-te', 'dieu-tri', 'phong-ngua', 'vaccine']
-                
-                links = soup.find_all('a', href=True)
-                for link in links:
-                    href = link['href']
-                    link_text = link.get_text().lower()
-                    
-                    # Kiểm tra xem link có liên quan đến y tế không
-                    if any(keyword in href.lower() or keyword in link_text for keyword in health_keywords):
-                        full_url = urljoin(base_url, href)
-                        
-                        # Validate URL
-                        if self.is_valid_health_url(full_url):
-                            discovered_sources.append({
-                                'url': full_url,
-                                'title': link.get_text().strip(),
-                                'source_domain': urlparse(base_url).netloc
-                            })
-                
-            except Exception as e:
-                logger.error(f"Error discovering sources from {base_url}: {e}")
+        if save and scores:
+            save_scores(scores)
+        
+        results = {}
+        for url in urls:
+            if url in scores:
+                results[url] = scores[url]
+            else:
+                logger.error(f"Error validating source quality for {url}: {errors.get(url)}")
+                results[url] = error_result(errors.get(url, 'unknown error'))
+        return results
+    
+    def auto_discover_health_sources(self, base_urls, max_depth=2, max_pages=200, max_workers=8, save=False):
+        """Tự động khám phá các nguồn y tế từ các URL cơ sở
+        
+        Dùng DiscoveryFrontier: URL được chuẩn hóa và khử trùng lặp, có giới hạn độ sâu,
+        số trang, tải song song theo host và tôn trọng robots.txt.
+        """
+        frontier = DiscoveryFrontier(
+            self.is_valid_health_url,
+            max_depth=max_depth,
+            max_pages=max_pages,
+            max_workers=max_workers
+        )
+        discovered_sources = frontier.crawl(base_urls)
+        
+        if save and discovered_sources:
+            save_discovered_sources(discovered_sources)
         
         return discovered_sources
     
@@ -247,39 +153,34 @@ class HealthSourceManager:
             return False
     
     def prioritize_sources_for_update(self):
-        """Sắp xếp ưu tiên các nguồn để cập nhật"""
-        sources = URLSource.objects.filter(active=True)
+        """Sắp xếp ưu tiên các nguồn để cập nhật (tính điểm trong database)"""
+        now = timezone.now()
         
-        prioritized = []
-        for source in sources:
-            priority_score = 0
-            
-            # Tính điểm dựa trên thời gian cập nhật cuối
-            if source.last_updated:
-                days_since_update = (timezone.now() - source.last_updated).days
-                if days_since_update > 7:
-                    priority_score += days_since_update
-            else:
-                priority_score += 100  # Chưa bao giờ cập nhật
-            
+        priority = (
+            # Tính điểm dựa trên thời gian cập nhật cuối (chưa bao giờ cập nhật hoặc sitemap báo đã thay đổi: 100,
+            # quá 7 ngày: số ngày)
+            Case(
+                When(last_updated__isnull=True, then=Value(100)),
+                When(sitemap_lastmod__gt=F('last_updated'), then=Value(100)),
+                When(last_updated__lte=now - timedelta(days=8), then=DaysSince('last_updated', now)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
             # Tính điểm dựa trên độ tin cậy
-            domain = urlparse(source.url).netloc.lower()
-            for category, sources_list in self.trusted_sources.items():
-                for trusted_source in sources_list:
-                    if domain in trusted_source['url']:
-                        priority_score += trusted_source['reliability'] * 10
-                        break
-            
+            + Coalesce(F('trusted_source__reliability'), Value(0)) * 10
             # Tính điểm dựa trên thành công trước đó
-            if source.success_count > 0:
-                priority_score += source.success_count
-            
-            prioritized.append((source, priority_score))
+            + Case(When(success_count__gt=0, then=F('success_count')), default=Value(0))
+            # Tính điểm dựa trên chất lượng nội dung đã chấm (validate_sources), không cần tải lại trang
+            + Coalesce(F('quality_score'), Value(0)) / 5
+        )
         
-        # Sắp xếp theo điểm ưu tiên giảm dần
-        prioritized.sort(key=lambda x: x[1], reverse=True)
+        sources = (URLSource.objects
+                   .filter(active=True)
+                   .select_related('trusted_source')
+                   .annotate(priority_score=priority)
+                   .order_by('-priority_score', 'pk'))
         
-        return [source for source, score in prioritized]
+        return list(sources)
     
     def batch_update_sources(self, max_sources=10):
         """Cập nhật hàng loạt các nguồn theo thứ tự ưu tiên"""
@@ -326,51 +227,52 @@ class HealthSourceManager:
         return results
     
     def get_source_statistics(self):
-        """Lấy thống kê về các nguồn"""
-        sources = URLSource.objects.all()
+        """Lấy thống kê về các nguồn (hai truy vấn tổng hợp)"""
+        one_week_ago = timezone.now() - timedelta(days=7)
+        
+        totals = URLSource.objects.aggregate(
+            total_sources=Count('id'),
+            active_sources=Count('id', filter=Q(active=True)),
+            recent_updates=Count('id', filter=Q(last_updated__gte=one_week_ago)),
+            never_updated=Count('id', filter=Q(last_updated__isnull=True)),
+            total_diseases_from_sources=Coalesce(Sum('success_count'), 0)
+        )
         
         stats = {
-            'total_sources': sources.count(),
-            'active_sources': sources.filter(active=True).count(),
+            'total_sources': totals['total_sources'],
+            'active_sources': totals['active_sources'],
             'sources_by_reliability': {},
-            'recent_updates': 0,
-            'never_updated': 0,
-            'total_diseases_from_sources': 0
+            'recent_updates': totals['recent_updates'],
+            'never_updated': totals['never_updated'],
+            'total_diseases_from_sources': totals['total_diseases_from_sources']
         }
         
         # Thống kê theo độ tin cậy
-        for source in sources:
-            quality = self.get_source_reliability(source.url)
-            if quality not in stats['sources_by_reliability']:
-                stats['sources_by_reliability'][quality] = 0
-            stats['sources_by_reliability'][quality] += 1
-        
-        # Thống kê cập nhật gần đây
-        one_week_ago = timezone.now() - timedelta(days=7)
-        stats['recent_updates'] = sources.filter(last_updated__gte=one_week_ago).count()
-        stats['never_updated'] = sources.filter(last_updated__isnull=True).count()
-        
-        # Tổng số bệnh từ các nguồn
-        stats['total_diseases_from_sources'] = sum(source.success_count for source in sources)
+        by_reliability = (URLSource.objects
+                          .values('trusted_source__reliability')
+                          .annotate(count=Count('id'))
+                          .order_by())
+        for row in by_reliability:
+            quality = reliability_label(row['trusted_source__reliability'])
+            stats['sources_by_reliability'][quality] = stats['sources_by_reliability'].get(quality, 0) + row['count']
         
         return stats
     
+    def get_update_interval(self, url):
+        """Lấy chu kỳ cập nhật của nguồn theo update_frequency (mặc định hàng tuần)"""
+        trusted = TrustedSource.for_url(url)
+        return self.update_interval_for(trusted)
+    
+    def update_interval_for(self, trusted_source):
+        """Chu kỳ cập nhật của một TrustedSource (đã load sẵn, không truy vấn thêm)"""
+        if trusted_source is None:
+            return timedelta(days=7)
+        return UPDATE_FREQUENCY_INTERVALS.get(trusted_source.update_frequency, timedelta(days=7))
+    
     def get_source_reliability(self, url):
         """Lấy độ tin cậy của nguồn"""
-        domain = urlparse(url).netloc.lower()
-        
-        for category, sources_list in self.trusted_sources.items():
-            for source in sources_list:
-                if domain in source['url']:
-                    reliability = source['reliability']
-                    if reliability >= 4:
-                        return 'high'
-                    elif reliability >= 3:
-                        return 'medium'
-                    else:
-                        return 'low'
-        
-        return 'unknown'
+        trusted = TrustedSource.for_url(url)
+        return reliability_label(trusted.reliability if trusted else None)
     
     def suggest_new_sources(self, topic=None):
         """Đề xuất nguồn mới dựa trên chủ đề"""
@@ -408,36 +310,36 @@ class HealthSourceManager:
         
         return list(set(suggestions))
     
-    def cleanup_inactive_sources(self, days_threshold=30):
+    def cleanup_inactive_sources(self, days_threshold=30, checker=None):
         """Dọn dẹp các nguồn không hoạt động"""
         threshold_date = timezone.now() - timedelta(days=days_threshold)
         
         # Tìm các nguồn lâu không cập nhật
-        inactive_sources = URLSource.objects.filter(
+        inactive_sources = list(URLSource.objects.filter(
             last_updated__lt=threshold_date,
             success_count=0
-        )
+        ).only('id', 'url', 'last_updated'))
         
         cleanup_report = {
             'candidates_for_removal': [],
             'removed_count': 0
         }
         
+        # Kiểm tra lần cuối xem nguồn có còn hoạt động không (song song, giới hạn theo host)
+        checker = checker or LivenessChecker()
+        results = checker.check_many(source.url for source in inactive_sources)
+        
         for source in inactive_sources:
-            # Kiểm tra lần cuối xem nguồn có còn hoạt động không
-            try:
-                response = requests.head(source.url, timeout=10)
-                if response.status_code >= 400:
-                    cleanup_report['candidates_for_removal'].append({
-                        'url': source.url,
-                        'reason': f'HTTP {response.status_code}',
-                        'last_updated': source.last_updated
-                    })
-            except Exception as e:
+            result = results[source.url]
+            source.last_checked_at = result.checked_at
+            source.last_check_status = result.status_code
+            if not result.alive:
                 cleanup_report['candidates_for_removal'].append({
                     'url': source.url,
-                    'reason': str(e),
+                    'reason': result.reason,
                     'last_updated': source.last_updated
                 })
         
-        return cleanup_report
\ No newline at end of file
+        URLSource.objects.bulk_update(inactive_sources, ['last_checked_at', 'last_check_status'], batch_size=500)
+        
+        return cleanup_report
@@ -0,0 +1,194 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (compatible; HealthBot/1.0; +https://example.com/bot)'
+
+# Mã trạng thái nên thử lại (server quá tải / tạm lỗi)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Host đang bị ngắt (circuit open) do lỗi liên tiếp, request bị từ chối ngay không gửi đi"""
+
+
+class HostCircuit:
+    """Circuit breaker cho một host: closed -> open sau N lỗi liên tiếp -> half-open thử một request"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_request(self, host):
+        with self.lock:
+            now = time.monotonic()
+            if self.failures < self.failure_threshold:
+                return
+            if now < self.open_until:
+                raise CircuitOpenError(f"Circuit open for {host}, retry in {self.open_until - now:.0f}s")
+            if self.probing:
+                raise CircuitOpenError(f"Circuit half-open for {host}, probe request in progress")
+            # Hết thời gian chờ: cho một request thăm dò đi qua
+            self.probing = True
+
+    def release(self):
+        # Request thăm dò không được gửi đi (hết ngân sách, URL lỗi...): cho request khác thăm dò
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probing = False
+
+    def record_failure(self, host, cooldown=None):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + max(self.reset_timeout, cooldown or 0)
+                if self.failures == self.failure_threshold:
+                    logger.warning(f"Opening circuit for {host} after {self.failures} consecutive failures")
+
+
+class FetchClient:
+    """HTTP client dùng chung cho mọi lần tải trang: connection pool, retry với backoff có jitter,
+    tôn trọng Retry-After, ngân sách thời gian cho mỗi lần gọi và circuit breaker theo host"""
+
+    def __init__(self, max_retries=2, backoff_base=0.5, backoff_max=30, failure_threshold=3,
+                 reset_timeout=60, connect_timeout=5, read_timeout=20, total_timeout=45,
+                 pool_size=16, user_agent=USER_AGENT, session=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        session.headers['User-Agent'] = user_agent
+        self.session = session
+
+        self.circuits = {}
+        self.lock = threading.Lock()
+
+    def circuit(self, host):
+        with self.lock:
+            circuit = self.circuits.get(host)
+            if circuit is None:
+                circuit = self.circuits[host] = HostCircuit(self.failure_threshold, self.reset_timeout)
+            return circuit
+
+    def is_open(self, url):
+        """Host của URL đang bị ngắt (dùng để bỏ qua sớm trong các vòng lặp batch)"""
+        circuit = self.circuits.get(urlparse(url).netloc)
+        return bool(circuit and circuit.failures >= circuit.failure_threshold
+                    and time.monotonic() < circuit.open_until)
+
+    def backoff(self, attempt):
+        # Full jitter: ngẫu nhiên trong [0, base * 2^attempt], tránh các worker retry cùng lúc
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def retry_after(self, response):
+        """Số giây server yêu cầu chờ (Retry-After dạng số giây hoặc HTTP date), None nếu không có"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def request(self, method, url, retries=None, total_timeout=None, **kwargs):
+        """Gửi request với retry/backoff; lỗi mạng được raise (requests.RequestException),
+        response lỗi HTTP được trả về để caller tự raise_for_status như requests thông thường"""
+        host = urlparse(url).netloc
+        circuit = self.circuit(host)
+        retries = self.max_retries if retries is None else retries
+        deadline = time.monotonic() + (total_timeout or self.total_timeout)
+
+        attempt = 0
+        while True:
+            circuit.before_request(host)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                circuit.release()
+                raise requests.Timeout(f"Timeout budget exhausted for {url}")
+            timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+            wait = None
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                circuit.record_failure(host)
+                if attempt >= retries:
+                    raise
+                logger.info(f"{method} {url} failed ({e.__class__.__name__}), retrying")
+            except Exception:
+                # Lỗi không do host (URL sai, redirect vòng...) thì không tính vào circuit
+                circuit.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    circuit.record_success()
+                    return response
+
+                wait = self.retry_after(response)
+                circuit.record_failure(host, cooldown=wait)
+                if attempt >= retries:
+                    return response
+                response.close()
+                logger.info(f"{method} {url} returned HTTP {response.status_code}, retrying")
+
+            delay = self.backoff(attempt) if wait is None else min(wait, self.backoff_max)
+            if time.monotonic() + delay >= deadline:
+                raise requests.Timeout(f"Timeout budget exhausted for {url} (next retry in {delay:.1f}s)")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """FetchClient dùng chung trong tiến trình, cấu hình qua settings.CHATBOT_FETCH_OPTIONS"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FetchClient(**getattr(settings, 'CHATBOT_FETCH_OPTIONS', {}))
+    return _client
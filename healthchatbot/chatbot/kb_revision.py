@@ -0,0 +1,88 @@
+import logging
+import threading
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import StatsCounter
+
+logger = logging.getLogger(__name__)
+
+# Số hiệu knowledge base tăng dần, lưu trong một dòng StatsCounter (không nằm trong COUNTER_QUERIES
+# nên reconcile không ghi đè). Mọi tiến trình đọc dòng này để biết index trong bộ nhớ đã cũ chưa.
+REVISION_COUNTER = 'kb_revision'
+
+# Trạng thái theo thread: độ sâu của batch() đang mở, có thay đổi trong batch chưa, và các connection
+# đã hẹn tăng số hiệu khi transaction hiện tại commit
+_state = threading.local()
+
+
+def current():
+    """Số hiệu hiện tại (0 nếu chưa có thay đổi nào được ghi nhận); truy vấn một dòng theo khóa unique"""
+    return StatsCounter.objects.filter(name=REVISION_COUNTER).values_list('value', flat=True).first() or 0
+
+
+def bump():
+    """Tăng số hiệu sau một thay đổi knowledge base
+
+    Chạy trong transaction của thay đổi (nếu có): rollback thì số hiệu cũng không đổi.
+    """
+    updated = StatsCounter.objects.filter(name=REVISION_COUNTER).update(value=F('value') + 1,
+                                                                        updated_at=timezone.now())
+    if not updated:
+        counter, created = StatsCounter.objects.get_or_create(name=REVISION_COUNTER, defaults={'value': 1})
+        if not created:
+            StatsCounter.objects.filter(pk=counter.pk).update(value=F('value') + 1, updated_at=timezone.now())
+
+
+def _scheduled(using):
+    scheduled = getattr(_state, 'scheduled', None)
+    if scheduled is None:
+        scheduled = _state.scheduled = {}
+    return scheduled
+
+
+def changed(using=DEFAULT_DB_ALIAS):
+    """Ghi nhận một thay đổi knowledge base; số hiệu chỉ tăng một lần cho mỗi transaction hoặc batch()
+
+    Trong batch(): chỉ đánh dấu, tăng khi batch kết thúc. Trong transaction: hẹn tăng một lần khi commit
+    (rollback thì không tăng). Ngoài cả hai (autocommit): tăng ngay.
+    """
+    if getattr(_state, 'depth', 0):
+        _state.changed = True
+        return
+
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        bump()
+        return
+
+    scheduled = _scheduled(using)
+    callback = scheduled.get(using)
+    # Callback bị bỏ khi transaction rollback; chỉ coi là đã hẹn nếu nó còn trong hàng chờ của connection
+    if callback is not None and any(func is callback for _, func, _ in connection.run_on_commit):
+        return
+
+    def callback():
+        scheduled.pop(using, None)
+        bump()
+
+    scheduled[using] = callback
+    transaction.on_commit(callback, using=using)
+
+
+@contextmanager
+def batch():
+    """Gom mọi thay đổi knowledge base trong khối (vd. một lần import, gồm nhiều lần ghi autocommit)
+    thành một lần tăng số hiệu khi khối kết thúc"""
+    depth = getattr(_state, 'depth', 0)
+    if not depth:
+        _state.changed = False
+    _state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.depth = depth
+        if not depth and _state.changed:
+            _state.changed = False
+            changed()
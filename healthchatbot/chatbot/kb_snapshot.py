@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import struct
+import zlib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import (Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine,
+                     TrustedSource, URLSource, DiseaseSignature, DiseaseLSHBucket, KnowledgeBaseSnapshot)
+from . import kb_revision, near_duplicates, stats_snapshot, symptom_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# Bố cục file: MAGIC | uint32 độ dài header | header JSON | body nén zlib (các section nối tiếp nhau)
+MAGIC = b'HCKBSNAP'
+FORMAT_VERSION = 1
+
+# Bảng -> cột, theo thứ tự nạp (bảng được tham chiếu đứng trước)
+TABLES = [
+    (TrustedSource, ['id', 'name', 'category', 'url', 'domain', 'reliability', 'update_frequency', 'content_types']),
+    (Disease, ['id', 'name', 'description', 'causes', 'is_contagious', 'source_url', 'duplicate_of_id']),
+    (Symptom, ['id', 'name', 'description', 'is_canonical']),
+    (DiseaseSymptom, ['id', 'disease_id', 'symptom_id', 'relevance_score']),
+    (Complication, ['id', 'name', 'description']),
+    (Treatment, ['id', 'name', 'description']),
+    (Prevention, ['id', 'method', 'description']),
+    (Vaccine, ['id', 'name', 'manufacturer']),
+    (URLSource, ['id', 'url', 'domain', 'trusted_source_id', 'active', 'last_updated', 'success_count',
+                 'sitemap_lastmod', 'quality_score', 'quality_reliability']),
+]
+RELATIONS = [Complication, Treatment, Prevention, Vaccine]  # ManyToMany 'diseases'
+DATETIME_COLUMNS = {'last_updated', 'sitemap_lastmod'}
+SEEDED_MODELS = (TrustedSource, Symptom)  # Migration đã tạo sẵn dữ liệu (nguồn tin cậy, từ điển triệu chứng)
+
+
+class SnapshotError(Exception):
+    """File snapshot không hợp lệ (sai định dạng, sai checksum) hoặc không nạp được"""
+
+
+def pack_sections(sections):
+    """Gộp các section (tên -> dict JSON hoặc numpy array) thành (mô tả section, body chưa nén)"""
+    entries = []
+    chunks = []
+    offset = 0
+    for name, value in sections.items():
+        if isinstance(value, np.ndarray):
+            data = np.ascontiguousarray(value).tobytes()
+            entry = {'name': name, 'kind': 'array', 'dtype': value.dtype.str, 'shape': list(value.shape)}
+        else:
+            data = json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            entry = {'name': name, 'kind': 'json'}
+        entry.update(offset=offset, length=len(data))
+        entries.append(entry)
+        chunks.append(data)
+        offset += len(data)
+    return entries, b''.join(chunks)
+
+
+def unpack_sections(entries, body, prefix=''):
+    sections = {}
+    for entry in entries:
+        if not entry['name'].startswith(prefix):
+            continue
+        data = body[entry['offset']:entry['offset'] + entry['length']]
+        if entry['kind'] == 'array':
+            sections[entry['name']] = np.frombuffer(data, dtype=entry['dtype']).reshape(entry['shape'])
+        else:
+            sections[entry['name']] = json.loads(data.decode('utf-8'))
+    return sections
+
+
+def write_container(header, sections):
+    entries, body = pack_sections(sections)
+    compressed = zlib.compress(body, 6)
+    header = dict(header, format_version=FORMAT_VERSION, sections=entries,
+                  sha256=hashlib.sha256(compressed).hexdigest())
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + compressed
+
+
+def read_header(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise SnapshotError('Not a knowledge base snapshot (bad magic)')
+    start = len(MAGIC) + 4
+    (header_length,) = struct.unpack('<I', data[len(MAGIC):start])
+    header = json.loads(data[start:start + header_length].decode('utf-8'))
+    if header.get('format_version') != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format version {header.get('format_version')}")
+    return header, start + header_length
+
+
+def read_container(data, prefix=''):
+    """Đọc và kiểm tra checksum, trả về (header, sections)"""
+    header, body_start = read_header(data)
+    compressed = data[body_start:]
+    if hashlib.sha256(compressed).hexdigest() != header['sha256']:
+        raise SnapshotError('Snapshot checksum mismatch (file is truncated or corrupted)')
+    return header, unpack_sections(header['sections'], zlib.decompress(compressed), prefix)
+
+
+def kb_version(table_sections):
+    """Phiên bản knowledge base = digest nội dung các bảng: cùng dữ liệu luôn cho cùng phiên bản"""
+    digest = hashlib.sha256()
+    for name in sorted(table_sections):
+        digest.update(name.encode('utf-8'))
+        digest.update(json.dumps(table_sections[name], ensure_ascii=False, separators=(',', ':'),
+                                 sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def dump_tables():
+    sections = {}
+    for model, columns in TABLES:
+        rows = model.objects.order_by('pk').values_list(*columns)
+        sections[f'table.{model._meta.model_name}'] = {
+            'columns': columns,
+            'rows': [[_value(value) for value in row] for row in rows.iterator(chunk_size=2000)],
+        }
+    for model in RELATIONS:
+        through = model.diseases.through
+        column = f'{model._meta.model_name}_id'
+        rows = through.objects.order_by(column, 'disease_id').values_list(column, 'disease_id')
+        sections[f'table.{model._meta.model_name}_diseases'] = {
+            'columns': [column, 'disease_id'],
+            'rows': [list(row) for row in rows.iterator(chunk_size=2000)],
+        }
+    return sections
+
+
+def dump_vectorizer(prefix, ids, vectorizer, matrix):
+    matrix = csr_matrix(matrix)
+    matrix.sort_indices()
+    return {
+        f'{prefix}.ids': np.asarray(ids, dtype=np.int64),
+        f'{prefix}.terms': sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get),
+        f'{prefix}.idf': np.asarray(vectorizer.idf_, dtype=np.float64),
+        f'{prefix}.data': matrix.data.astype(np.float64),
+        f'{prefix}.indices': matrix.indices.astype(np.int32),
+        f'{prefix}.indptr': matrix.indptr.astype(np.int64),
+        f'{prefix}.shape': np.asarray(matrix.shape, dtype=np.int64),
+    }
+
+
+def dump_index():
+    """Index TF-IDF dựng sẵn (đúng như processor dựng từ database) và chữ ký MinHash"""
+    from .nlp_processor import ImprovedNLPProcessor
+
+    processor = ImprovedNLPProcessor()
+    # Cấu hình vectorizer lúc dựng; processor chỉ dùng index dựng sẵn khi cấu hình của nó giống hệt
+    sections = {'index.params': {'max_features': processor.max_features()}}
+    # Index băm (CHATBOT_VECTORIZER_BACKEND='hashing') không cần fit, không lưu vào snapshot
+    if isinstance(processor.symptom_vectorizer, TfidfVectorizer):
+        sections.update(dump_vectorizer('index.symptoms', [s.pk for s in processor.symptoms],
+                                        processor.symptom_vectorizer, processor.symptom_vectors))
+    if isinstance(processor.disease_vectorizer, TfidfVectorizer):
+        sections.update(dump_vectorizer('index.diseases', [d.pk for d in processor.diseases],
+                                        processor.disease_vectorizer, processor.disease_vectors))
+
+    signatures = list(DiseaseSignature.objects.order_by('disease_id').values_list('disease_id', 'minhash'))
+    sections['index.signatures.ids'] = np.asarray([pk for pk, _ in signatures], dtype=np.int64)
+    sections['index.signatures.minhash'] = np.asarray(
+        [near_duplicates.signature_from_bytes(data) for _, data in signatures], dtype=np.uint32
+    ).reshape(len(signatures), near_duplicates.NUM_PERM)
+    return sections
+
+
+def export_snapshot():
+    """Snapshot toàn bộ knowledge base, trả về (bytes, header)"""
+    with transaction.atomic():
+        # Đọc mọi bảng trong cùng một transaction để snapshot nhất quán
+        tables = dump_tables()
+        index = dump_index()
+    header = {
+        'kb_version': kb_version(tables),
+        'created_at': timezone.now().isoformat(),
+        'counts': {name.split('.', 1)[1]: len(section['rows']) for name, section in tables.items()},
+    }
+    data = write_container(header, dict(tables, **index))
+    return data, read_header(data)[0]
+
+
+def is_empty():
+    # Bảng được migration seed sẵn không tính; khi nạp sẽ được thay bằng bản trong snapshot
+    return not any(model.objects.exists() for model, _ in TABLES if model not in SEEDED_MODELS)
+
+
+def load_tables(sections):
+    for model in SEEDED_MODELS:
+        model.objects.all().delete()
+    for model, columns in TABLES:
+        section = sections[f'table.{model._meta.model_name}']
+        names = section['columns']
+        objects = []
+        for row in section['rows']:
+            values = dict(zip(names, row))
+            for column in DATETIME_COLUMNS.intersection(values):
+                if values[column]:
+                    values[column] = parse_datetime(values[column])
+            objects.append(model(**values))
+        model.objects.bulk_create(objects, batch_size=1000)
+
+    for model in RELATIONS:
+        through = model.diseases.through
+        section = sections[f'table.{model._meta.model_name}_diseases']
+        through.objects.bulk_create([through(**dict(zip(section['columns'], row))) for row in section['rows']],
+                                    batch_size=2000)
+
+    # Đã giữ nguyên id: đặt lại sequence để bản ghi tạo sau không trùng khóa (PostgreSQL...)
+    models = [model for model, _ in TABLES] + [model.diseases.through for model in RELATIONS]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def load_signatures(sections):
+    ids = sections['index.signatures.ids']
+    minhashes = sections['index.signatures.minhash']
+    DiseaseSignature.objects.bulk_create(
+        [DiseaseSignature(disease_id=int(pk), minhash=signature.tobytes()) for pk, signature in zip(ids, minhashes)],
+        batch_size=1000,
+    )
+    DiseaseLSHBucket.objects.bulk_create(
+        [DiseaseLSHBucket(disease_id=int(pk), bucket=bucket)
+         for pk, signature in zip(ids, minhashes) for bucket in near_duplicates.band_buckets(signature)],
+        batch_size=5000,
+    )
+
+
+def import_snapshot(data):
+    """Nạp snapshot vào database rỗng và đăng ký index dựng sẵn, trong một transaction"""
+    header, sections = read_container(data)
+    if not is_empty():
+        raise SnapshotError('Database already contains knowledge base data, import needs an empty database')
+
+    index_sections = {name: value for name, value in sections.items()
+                      if name.startswith('index.') and not name.startswith('index.signatures.')}
+    index_blob = write_container({'kb_version': header['kb_version']}, index_sections)
+
+    with transaction.atomic():
+        load_tables(sections)
+        load_signatures(sections)
+        # bulk_create không phát signal, xóa dữ liệu seed thì có: gộp tất cả thành một lần tăng số hiệu khi commit
+        kb_revision.changed()
+        snapshot = KnowledgeBaseSnapshot.objects.create(
+            kb_version=header['kb_version'],
+            checksum=header['sha256'],
+            created_at=parse_datetime(header['created_at']),
+            index=index_blob,
+        )
+
+        def record_revision():
+            # Chạy sau callback tăng số hiệu (đăng ký trước) nên ghi đúng số hiệu mà index dựng sẵn ứng với
+            snapshot.revision = kb_revision.current()
+            KnowledgeBaseSnapshot.objects.filter(pk=snapshot.pk).update(revision=snapshot.revision)
+
+        transaction.on_commit(record_revision)
+
+    stats_snapshot.reconcile()
+    symptom_vocabulary.invalidate()
+    logger.info(f"Imported knowledge base snapshot {header['kb_version']}: {header['counts']}")
+    return snapshot, header
+
+
+class PrebuiltIndex:
+    """Một index TF-IDF đọc từ snapshot: id theo thứ tự hàng, vectorizer đã khôi phục và ma trận CSR"""
+
+    def __init__(self, sections, prefix, max_features):
+        self.ids = sections[f'{prefix}.ids'].tolist()
+        self.vectorizer = TfidfVectorizer(max_features=max_features, ngram_range=(1, 2))
+        self.vectorizer.vocabulary_ = {term: i for i, term in enumerate(sections[f'{prefix}.terms'])}
+        self.vectorizer.idf_ = sections[f'{prefix}.idf']
+        self.matrix = csr_matrix(
+            (sections[f'{prefix}.data'], sections[f'{prefix}.indices'], sections[f'{prefix}.indptr']),
+            shape=tuple(sections[f'{prefix}.shape'].tolist()),
+        )
+
+
+def load_prebuilt_index(max_features):
+    """Index dựng sẵn của snapshot đã nạp, nếu knowledge base chưa thay đổi kể từ đó và index được dựng
+    với cùng max_features (CHATBOT_TFIDF_MAX_FEATURES của processor); ngược lại None
+
+    Trả về dict 'symptoms'/'diseases' -> PrebuiltIndex. Processor vẫn so khớp danh sách id trước khi dùng.
+    """
+    snapshot = KnowledgeBaseSnapshot.objects.order_by('-imported_at').first()
+    if snapshot is None or snapshot.revision != kb_revision.current():
+        return None
+
+    try:
+        _, sections = read_container(bytes(snapshot.index))
+    except SnapshotError as e:
+        logger.error(f"Ignoring prebuilt index of snapshot {snapshot.kb_version}: {e}")
+        return None
+
+    built_with = sections.get('index.params', {}).get('max_features')
+    if built_with != max_features:
+        logger.info(f"Ignoring prebuilt index of snapshot {snapshot.kb_version}: "
+                    f"built with max_features={built_with}, processor uses {max_features}")
+        return None
+
+    return {name: PrebuiltIndex(sections, f'index.{name}', max_features)
+            for name in ('symptoms', 'diseases') if f'index.{name}.ids' in sections}
@@ -0,0 +1,135 @@
+import logging
+import socket
+import os
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import KnowledgeUpdateJob, URLSource
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_knowledge_update(urls):
+    """Tạo job cập nhật knowledge base và trả về ngay, worker sẽ xử lý sau"""
+    with transaction.atomic():
+        existing = set(URLSource.objects.filter(url__in=urls).values_list('url', flat=True))
+        for url in urls:
+            if url not in existing:
+                URLSource.objects.get_or_create(url=url)
+
+        job = KnowledgeUpdateJob.objects.create(
+            urls=list(urls),
+            progress={url: {'state': 'pending'} for url in urls}
+        )
+
+    logger.info(f"Enqueued knowledge update job {job.pk} for {len(urls)} URLs")
+    return job
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_name=None):
+    """Lấy job pending cũ nhất và đánh dấu running (compare-and-set, an toàn khi nhiều worker)"""
+    worker_name = worker_name or default_worker_name()
+
+    while True:
+        job = (KnowledgeUpdateJob.objects
+               .filter(status='pending')
+               .order_by('created_at', 'pk')
+               .first())
+        if job is None:
+            return None
+
+        claimed = KnowledgeUpdateJob.objects.filter(pk=job.pk, status='pending').update(
+            status='running',
+            started_at=timezone.now(),
+            worker=worker_name
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Worker khác đã lấy job này, thử job tiếp theo
+
+
+def start_job(urls, worker_name=None):
+    """Tạo job ở trạng thái running cho tiến trình tự chạy luôn (ví dụ refresh scheduler)"""
+    now = timezone.now()
+    return KnowledgeUpdateJob.objects.create(
+        urls=list(urls),
+        status='running',
+        started_at=now,
+        worker=worker_name or default_worker_name(),
+        progress={url: {'state': 'pending'} for url in urls}
+    )
+
+
+def requeue_stale_jobs(stale_after_minutes=60):
+    """Đưa các job running quá lâu (worker bị dừng giữa chừng) về lại pending"""
+    threshold = timezone.now() - timedelta(minutes=stale_after_minutes)
+    count = KnowledgeUpdateJob.objects.filter(
+        status='running',
+        started_at__lt=threshold
+    ).update(status='pending', started_at=None, worker='')
+
+    if count:
+        logger.warning(f"Requeued {count} stale knowledge update jobs")
+    return count
+
+
+def run_job(job, processor=None):
+    """Chạy crawl-parse-import cho một job, ghi tiến độ theo từng URL"""
+    if processor is None:
+        from .nlp_processor import ImprovedNLPProcessor
+        processor = ImprovedNLPProcessor()
+
+    def report(url, state, imported=0, error=None, bytes_fetched=0):
+        entry = {'state': state, 'updated_at': timezone.now().isoformat()}
+        if state == 'succeeded':
+            entry['imported'] = imported
+            entry['bytes_fetched'] = bytes_fetched
+            job.imported_diseases += imported
+        if error:
+            entry['error'] = error
+        job.progress[url] = entry
+        job.save(update_fields=['progress', 'imported_diseases'])
+
+    logger.info(f"Running knowledge update job {job.pk} ({len(job.urls)} URLs)")
+
+    try:
+        processor.fetch_and_update_knowledge_base(
+            job.urls,
+            progress_callback=report,
+            rebuild_index=False
+        )
+
+        failed = [url for url, entry in job.progress.items() if entry.get('state') == 'failed']
+        job.status = 'failed' if failed and len(failed) == len(job.urls) else 'succeeded'
+        if failed:
+            job.error = f"{len(failed)}/{len(job.urls)} URL lỗi"
+
+    except Exception as e:
+        logger.error(f"Knowledge update job {job.pk} crashed: {e}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+    logger.info(f"Job {job.pk} finished with status {job.status}: {job.imported_diseases} diseases")
+    return job
+
+
+def serialize_job(job):
+    return {
+        'job_id': job.pk,
+        'status': job.status,
+        'urls': job.urls,
+        'progress': job.progress,
+        'imported_diseases': job.imported_diseases,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
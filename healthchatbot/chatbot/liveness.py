@@ -0,0 +1,87 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from urllib.parse import urlparse
+import requests
+from django.utils import timezone
+from .http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+# Server trả về các mã này cho HEAD thường là do không hỗ trợ HEAD, thử lại bằng GET
+HEAD_FALLBACK_STATUSES = {400, 403, 404, 405, 501}
+
+
+class LivenessResult:
+    """Kết quả kiểm tra một URL"""
+
+    def __init__(self, url, status_code=None, error=''):
+        self.url = url
+        self.status_code = status_code
+        self.error = error
+        self.checked_at = timezone.now()
+
+    @property
+    def alive(self):
+        return self.status_code is not None and self.status_code < 400
+
+    @property
+    def reason(self):
+        # Cùng định dạng với báo cáo cũ của cleanup_inactive_sources
+        return f'HTTP {self.status_code}' if self.status_code is not None else self.error
+
+
+class LivenessChecker:
+    """Kiểm tra URL còn sống song song qua FetchClient dùng chung, giới hạn số request mỗi host"""
+
+    def __init__(self, max_workers=16, per_host=2, timeout=10, client=None):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.client = client or get_client()
+
+        self.host_slots = {}
+        self.lock = threading.Lock()
+
+    def _host_slot(self, host):
+        with self.lock:
+            return self.host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+
+    def check(self, url):
+        """HEAD, nếu server không hỗ trợ thì GET (chỉ đọc header, không tải body)"""
+        with self._host_slot(urlparse(url).netloc):
+            try:
+                response = self.client.head(url, total_timeout=self.timeout)
+                status_code = response.status_code
+                response.close()
+
+                if status_code in HEAD_FALLBACK_STATUSES:
+                    with self.client.get(url, total_timeout=self.timeout, stream=True) as response:
+                        status_code = response.status_code
+
+                return LivenessResult(url, status_code=status_code)
+            except requests.RequestException as e:
+                return LivenessResult(url, error=str(e))
+
+    def check_many(self, urls):
+        """Kiểm tra nhiều URL, trả về OrderedDict url -> LivenessResult theo thứ tự đầu vào"""
+        urls = list(OrderedDict.fromkeys(urls))
+        results = OrderedDict((url, None) for url in urls)
+        if not urls:
+            return results
+
+        # Xếp xen kẽ theo host để worker không dồn vào chờ cùng một host
+        by_host = OrderedDict()
+        for url in urls:
+            by_host.setdefault(urlparse(url).netloc, []).append(url)
+        ordered = [url for group in zip_longest(*by_host.values()) for url in group if url is not None]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='liveness') as executor:
+            for result in executor.map(self.check, ordered):
+                results[result.url] = result
+
+        dead = sum(1 for result in results.values() if not result.alive)
+        logger.info(f"Checked {len(urls)} URLs across {len(by_host)} hosts: {dead} unreachable")
+        return results
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from chatbot.chat_archive import ChatArchiver, get_archive_dir
+
+class Command(BaseCommand):
+    help = 'Move chat sessions idle for longer than the retention period into compressed JSONL archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive sessions idle for this many days (default: CHATBOT_CHAT_RETENTION_DAYS or 90)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Sessions archived per transaction')
+        parser.add_argument('--max-sessions', type=int, help='Stop after archiving this many sessions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **kwargs):
+        archiver = ChatArchiver(days=kwargs['days'], chunk_size=kwargs['chunk_size'],
+                                max_sessions=kwargs['max_sessions'], dry_run=kwargs['dry_run'])
+        result = archiver.run()
+
+        if kwargs['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['sessions']} sessions ({result['messages']} messages) would be archived, "
+                f"{result['skipped_recent']} skipped with recent messages"
+            ))
+            return
+
+        location = get_archive_dir() / result['archive_file'] if result['archive_file'] else 'nothing written'
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result['sessions']} sessions ({result['messages']} messages), "
+            f"{result['skipped_recent']} skipped with recent messages: {location}"
+        ))
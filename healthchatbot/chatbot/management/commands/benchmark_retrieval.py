@@ -0,0 +1,123 @@
+import time
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.feature_extraction.text import TfidfVectorizer
+from chatbot.models import Disease
+from chatbot.nlp_processor import ImprovedNLPProcessor
+from chatbot.retrieval import BruteForceRetriever, LsaRetriever, MaxScoreRetriever
+
+class Command(BaseCommand):
+    help = 'Benchmark MaxScore and LSA top-k retrieval against brute-force cosine on synthetic corpora built from the knowledge base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, nargs='+', default=[10000, 100000], help='Corpus sizes to test')
+        parser.add_argument('--queries', type=int, default=300, help='Queries per corpus')
+        parser.add_argument('--top', type=int, default=3, help='k of the top-k')
+        parser.add_argument('--min-score', type=float, default=0.1, help='Score cut-off used by the chatbot')
+        parser.add_argument('--max-features', type=int, default=1000,
+                            help='Vectorizer vocabulary size (the chatbot uses 1000)')
+        parser.add_argument('--lsa-dimensions', type=int, nargs='*', default=[64, 128, 256],
+                            help='LSA dimensions to compare (none to skip LSA)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **kwargs):
+        processor = ImprovedNLPProcessor.__new__(ImprovedNLPProcessor)
+        texts = [processor.preprocess_text(f"{name} {description}") for name, description in
+                 Disease.objects.values_list('name', 'description')]
+        texts = [text.split() for text in texts if len(text.split()) >= 10]
+        if not texts:
+            raise CommandError('The knowledge base has no disease descriptions to build a corpus from')
+
+        rng = np.random.default_rng(kwargs['seed'])
+        frequency = Counter(word for words in texts for word in words)
+        vocabulary = np.array(list(frequency))
+        probabilities = np.array(list(frequency.values()), dtype=float)
+        probabilities /= probabilities.sum()
+
+        for size in kwargs['docs']:
+            self.stdout.write(f'Building corpus of {size} documents...')
+            corpus, bases = self.synthesize(texts, vocabulary, probabilities, size, rng)
+            vectorizer = TfidfVectorizer(max_features=kwargs['max_features'], ngram_range=(1, 2))
+            matrix = vectorizer.fit_transform(corpus)
+
+            queries = []
+            origins = rng.integers(0, size, kwargs['queries'])
+            for i in origins:
+                words = corpus[i].split()
+                picked = rng.choice(len(words), size=min(len(words), rng.integers(2, 6)), replace=False)
+                queries.append(vectorizer.transform([' '.join(words[j] for j in sorted(picked))]))
+
+            k, min_score = kwargs['top'], kwargs['min_score']
+            brute = BruteForceRetriever(matrix)
+            brute_times, expected = self.run(brute, queries, k, min_score)
+            self.stdout.write(f'{size} docs, {matrix.shape[1]} terms, {matrix.nnz} postings')
+            self.report('brute force', brute, 0.0, brute_times)
+            self.compare(expected, expected, bases, bases[origins], k)
+
+            candidates = [('maxscore', lambda: MaxScoreRetriever(matrix))]
+            candidates += [(f'lsa-{d}', lambda d=d: LsaRetriever(matrix, dimensions=d))
+                           for d in kwargs['lsa_dimensions']]
+            for name, build in candidates:
+                started = time.perf_counter()
+                retriever = build()
+                build_time = time.perf_counter() - started
+                times, results = self.run(retriever, queries, k, min_score)
+                self.report(name, retriever, build_time, times)
+                self.compare(expected, results, bases, bases[origins], k)
+
+                if hasattr(retriever, 'search_batch'):
+                    batch = sparse.vstack(queries)
+                    started = time.perf_counter()
+                    retriever.search_batch(batch, k, min_score)
+                    per_query = (time.perf_counter() - started) * 1000 / len(queries)
+                    self.stdout.write(f'    batched: {per_query:.3f} ms per query')
+
+    def report(self, name, retriever, build_time, times):
+        self.stdout.write(
+            f'  {name:<12} p50 {np.percentile(times, 50):.3f} ms, p95 {np.percentile(times, 95):.3f} ms, '
+            f'index {retriever.nbytes / 2 ** 20:.1f} MiB, built in {build_time * 1000:.0f} ms'
+        )
+
+    def compare(self, expected, results, bases, topics, k):
+        """So với brute force: số truy vấn cùng top-k, tỉ lệ kết quả tốt nhất của brute force nằm trong top-k;
+        và hit rate: top-k có tài liệu cùng bệnh gốc với tài liệu sinh ra truy vấn"""
+        same = 0
+        hits = 0
+        answerable = 0
+        relevant = 0
+        for exact, actual, topic in zip(expected, results, topics):
+            relevant += any(bases[i] == topic for i, _ in actual)
+            if [i for i, _ in exact] == [i for i, _ in actual] or (
+                    len(exact) == len(actual)
+                    and max((abs(a - b) for (_, a), (_, b) in zip(exact, actual)), default=0.0) < 1e-9):
+                # Cùng tài liệu, hoặc khác nhau chỉ ở các điểm bằng nhau
+                same += 1
+            if exact:
+                answerable += 1
+                hits += exact[0][0] in {i for i, _ in actual}
+        top1 = hits / answerable if answerable else 0.0
+        self.stdout.write(f'    same top-{k}: {same}/{len(expected)}, exact top-1 kept {top1:.1%}, '
+                          f'hit rate {relevant / len(results):.1%}')
+
+    def synthesize(self, texts, vocabulary, probabilities, size, rng):
+        """Mỗi tài liệu: một nửa từ lấy từ mô tả một bệnh thật, một nửa theo phân bố từ của cả knowledge base"""
+        corpus = []
+        lengths = rng.integers(40, 200, size)
+        bases = rng.integers(0, len(texts), size)
+        for length, base in zip(lengths, bases):
+            words = texts[base]
+            own = [words[i] for i in rng.integers(0, len(words), length // 2)]
+            background = vocabulary[rng.choice(len(vocabulary), length - length // 2, p=probabilities)]
+            corpus.append(' '.join(own) + ' ' + ' '.join(background))
+        return corpus, bases
+
+    def run(self, retriever, queries, k, min_score):
+        times = []
+        results = []
+        for query in queries:
+            started = time.perf_counter()
+            results.append(retriever.search(query, k, min_score))
+            times.append((time.perf_counter() - started) * 1000)
+        return times, results
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from chatbot import symptom_vocabulary
+from chatbot.models import DiseaseSymptom, Symptom, SymptomCandidate
+
+class Command(BaseCommand):
+    help = 'Remap extracted symptom phrases onto the canonical symptom vocabulary and remove the junk rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--keep-unmatched', action='store_true',
+                            help='Keep symptoms that match no vocabulary term instead of deleting them')
+        parser.add_argument('--prune-candidates-days', type=int, default=90,
+                            help='Delete unpromoted candidate phrases not seen for this many days (0 = keep)')
+
+    def handle(self, *args, **kwargs):
+        dry_run = kwargs['dry_run']
+        vocabulary = symptom_vocabulary.get_vocabulary()
+
+        remapped = unmatched = links_moved = 0
+        for symptom in Symptom.objects.filter(is_canonical=False).iterator():
+            terms = vocabulary.canonicalize(symptom.name)
+            if not terms:
+                unmatched += 1
+                if not dry_run and not kwargs['keep_unmatched']:
+                    symptom.delete()
+                continue
+
+            remapped += 1
+            if dry_run:
+                self.stdout.write(f"{symptom.name!r} -> {terms}")
+                continue
+
+            with transaction.atomic():
+                for link in DiseaseSymptom.objects.filter(symptom=symptom):
+                    for term in terms:
+                        canonical = symptom_vocabulary.canonical_symptom(term)
+                        target, created = DiseaseSymptom.objects.get_or_create(
+                            disease_id=link.disease_id, symptom=canonical,
+                            defaults={'relevance_score': link.relevance_score}
+                        )
+                        if not created and link.relevance_score > target.relevance_score:
+                            DiseaseSymptom.objects.filter(pk=target.pk).update(relevance_score=link.relevance_score)
+                        links_moved += 1
+                symptom.delete()
+
+        pruned = 0
+        if kwargs['prune_candidates_days'] and not dry_run:
+            threshold = timezone.now() - timedelta(days=kwargs['prune_candidates_days'])
+            pruned, _ = SymptomCandidate.objects.filter(last_seen__lt=threshold).delete()
+
+        action = 'would be' if dry_run else 'were'
+        self.stdout.write(self.style.SUCCESS(
+            f'{remapped} symptoms {action} remapped onto the vocabulary ({links_moved} disease links), '
+            f'{unmatched} unmatched{"" if kwargs["keep_unmatched"] else " " + action + " removed"}, '
+            f'{pruned} stale candidates pruned. '
+            f'Canonical symptoms: {Symptom.objects.filter(is_canonical=True).count()}'
+        ))
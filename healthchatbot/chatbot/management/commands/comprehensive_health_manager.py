@@ -14,7 +14,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--action',
             type=str,
-            choices=['update-all', 'stats', 'test', 'debug'],
+            choices=['update-all', 'stats', 'test', 'debug', 'sync-sources'],
             help='Action to perform',
             required=True
         )
@@ -41,6 +41,8 @@ class Command(BaseCommand):
                 self.test_basic_functionality(urls)
             elif action == 'update-all':
                 self.update_knowledge_base(urls)
+            elif action == 'sync-sources':
+                self.sync_trusted_sources()
             else:
                 self.stdout.write(self.style.ERROR(f'Unknown action: {action}'))
                 
@@ -101,28 +103,37 @@ class Command(BaseCommand):
         self.stdout.write('📊 System Statistics:')
         
         try:
-            from chatbot.models import Disease, Symptom, URLSource, ChatSession, ChatMessage
+            from chatbot import stats_snapshot
             
+            snapshot = stats_snapshot.get_stats()
             stats = {
-                'diseases': Disease.objects.count(),
-                'symptoms': Symptom.objects.count(),
-                'sources': URLSource.objects.count(),
-                'sessions': ChatSession.objects.count(),
-                'messages': ChatMessage.objects.count(),
+                'diseases': snapshot['total_diseases'],
+                'symptoms': snapshot['total_symptoms'],
+                'sources': snapshot['total_sources'],
+                'sessions': snapshot['total_sessions'],
+                'messages': snapshot['total_messages'],
             }
             
             for key, value in stats.items():
                 self.stdout.write(f'  {key.capitalize()}: {value}')
                 
             # Active sources
-            active_sources = URLSource.objects.filter(active=True).count()
-            self.stdout.write(f'  Active Sources: {active_sources}')
+            self.stdout.write(f'  Active Sources: {snapshot["active_sources"]}')
             
             self.stdout.write('✅ Statistics retrieved successfully')
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Error getting statistics: {str(e)}'))
     
+    def sync_trusted_sources(self):
+        """Đồng bộ danh sách nguồn tin cậy vào database"""
+        self.stdout.write('🔄 Syncing trusted sources...')
+        
+        from chatbot.health_source_manager import HealthSourceManager
+        synced = HealthSourceManager().sync_trusted_sources()
+        
+        self.stdout.write(self.style.SUCCESS(f'✅ Synced {synced} trusted sources'))
+    
     def test_basic_functionality(self, urls):
         """Test chức năng cơ bản"""
         self.stdout.write('🧪 Testing basic functionality...')
@@ -134,8 +145,8 @@ class Command(BaseCommand):
             self.stdout.write(f'📡 Testing URL: {url}')
             
             try:
-                import requests
-                response = requests.get(url, timeout=30)
+                from chatbot.http_client import get_client
+                response = get_client().get(url)
                 
                 if response.status_code == 200:
                     self.stdout.write(f'  ✅ URL accessible (status: {response.status_code})')
@@ -201,10 +212,10 @@ class Command(BaseCommand):
             self.stdout.write(f'📡 Manually processing: {url}')
             
             try:
-                import requests
                 from bs4 import BeautifulSoup
+                from chatbot.http_client import get_client
                 
-                response = requests.get(url, timeout=30)
+                response = get_client().get(url)
                 soup = BeautifulSoup(response.text, 'html.parser')
                 
                 # Basic extraction
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from chatbot.health_source_manager import HealthSourceManager
+from chatbot.source_discovery import save_discovered_sources
+
+class Command(BaseCommand):
+    help = 'Discover health source URLs by crawling from seed URLs (deduplicated, bounded, concurrent)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', type=str, help='Seed URLs to start discovery from')
+        parser.add_argument('--max-depth', type=int, default=2, help='Maximum link depth from the seeds')
+        parser.add_argument('--max-pages', type=int, default=200, help='Maximum number of pages to fetch')
+        parser.add_argument('--max-workers', type=int, default=8, help='Number of concurrent fetches')
+        parser.add_argument('--save', action='store_true', help='Save discovered URLs as URLSource rows')
+
+    def handle(self, *args, **kwargs):
+        manager = HealthSourceManager()
+        discovered = manager.auto_discover_health_sources(
+            kwargs['urls'],
+            max_depth=kwargs['max_depth'],
+            max_pages=kwargs['max_pages'],
+            max_workers=kwargs['max_workers']
+        )
+
+        for item in discovered:
+            self.stdout.write(f"[{item['depth']}] {item['url']} - {item['title'][:60]}")
+
+        self.stdout.write(self.style.SUCCESS(f'Discovered {len(discovered)} sources'))
+
+        if kwargs['save']:
+            created = save_discovered_sources(discovered)
+            self.stdout.write(self.style.SUCCESS(f'Saved {created} new sources'))
@@ -0,0 +1,35 @@
+import gzip
+import sys
+from django.core.management.base import BaseCommand
+from chatbot import data_export
+
+class Command(BaseCommand):
+    help = 'Stream chat sessions/messages or the knowledge base to NDJSON with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(data_export.EXPORTERS), help='What to export')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout); a .gz suffix writes gzip')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per query')
+        parser.add_argument('--after', type=int, default=0, help='Resume after this id')
+
+    def handle(self, *args, **kwargs):
+        lines = data_export.export_lines(kwargs['kind'], chunk_size=kwargs['chunk_size'], after=kwargs['after'])
+        output = kwargs['output']
+
+        if not output:
+            count = 0
+            for line in lines:
+                sys.stdout.write(line)
+                count += 1
+            sys.stdout.flush()
+            self.stderr.write(f'Exported {count} {kwargs["kind"]}')
+            return
+
+        opener = gzip.open if output.endswith('.gz') else open
+        count = 0
+        with opener(output, 'wt', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} {kwargs["kind"]} to {output}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from chatbot import kb_snapshot
+
+class Command(BaseCommand):
+    help = 'Write a checksummed binary snapshot of the knowledge base and its prebuilt index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Snapshot file to write')
+
+    def handle(self, *args, **kwargs):
+        data, header = kb_snapshot.export_snapshot()
+        with open(kwargs['output'], 'wb') as f:
+            f.write(data)
+
+        counts = ', '.join(f'{count} {name}' for name, count in header['counts'].items() if count)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote snapshot {header['kb_version']} ({len(data) / 1024:.0f} KiB, sha256 {header['sha256'][:12]}) "
+            f"to {kwargs['output']}: {counts}"
+        ))
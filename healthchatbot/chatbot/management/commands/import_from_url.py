@@ -3,6 +3,8 @@ from bs4 import BeautifulSoup
 import re
 from django.core.management.base import BaseCommand
 from chatbot.models import Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine
+from chatbot.http_client import get_client
+from chatbot import kb_revision, near_duplicates, symptom_vocabulary
 
 class Command(BaseCommand):
     help = 'Import disease data from URL'
@@ -16,7 +18,7 @@ class Command(BaseCommand):
         try:
             # Lấy nội dung từ URL
             self.stdout.write(f'Fetching data from {url}...')
-            response = requests.get(url, timeout=30)
+            response = get_client().get(url)
             response.raise_for_status()  # Kiểm tra lỗi
             
             # Xử lý nội dung tùy thuộc vào định dạng
@@ -27,7 +29,8 @@ class Command(BaseCommand):
             
             # Tiến hành xử lý dữ liệu và nhập vào database
             diseases_data = self.extract_disease_info(content)
-            self.import_data_to_db(diseases_data)
+            with kb_revision.batch():
+                self.import_data_to_db(diseases_data)
             
             self.stdout.write(self.style.SUCCESS(f'Successfully imported {len(diseases_data)} diseases from {url}'))
             
@@ -160,6 +163,7 @@ class Command(BaseCommand):
         return diseases
     
     def import_data_to_db(self, diseases_data):
+        vocabulary = symptom_vocabulary.get_vocabulary()
         for data in diseases_data:
             # Tạo hoặc cập nhật bệnh
             disease, created = Disease.objects.update_or_create(
@@ -171,10 +175,12 @@ class Command(BaseCommand):
                 }
             )
             
-            # Thêm triệu chứng
-            for symptom_name in data['symptoms']:
-                symptom, _ = Symptom.objects.get_or_create(name=symptom_name)
+            # Thêm triệu chứng (chỉ lưu triệu chứng chuẩn trong từ điển)
+            symptom_names, unmatched = vocabulary.canonicalize_all(data['symptoms'])
+            for symptom_name in symptom_names:
+                symptom = symptom_vocabulary.canonical_symptom(symptom_name)
                 DiseaseSymptom.objects.get_or_create(disease=disease, symptom=symptom)
+            symptom_vocabulary.observe_unmatched(unmatched, disease.pk)
             
             # Thêm biến chứng
             for complication_name in data['complications']:
@@ -192,4 +198,7 @@ class Command(BaseCommand):
                 vaccine, _ = Vaccine.objects.get_or_create(name=vaccine_name)
                 disease.vaccines.add(vaccine)
             
-            self.stdout.write(f"Imported {disease.name}")
\ No newline at end of file
+            if near_duplicates.register(disease):
+                self.stdout.write(f"Imported {disease.name} (near-duplicate of disease #{disease.duplicate_of_id})")
+            else:
+                self.stdout.write(f"Imported {disease.name}")
\ No newline at end of file
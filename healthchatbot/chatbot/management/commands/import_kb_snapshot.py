@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from chatbot import kb_snapshot
+
+class Command(BaseCommand):
+    help = 'Bulk-load a knowledge base snapshot into an empty database and register its prebuilt index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', help='Snapshot file written by export_kb_snapshot')
+        parser.add_argument('--verify-only', action='store_true', help='Only check the header and checksum')
+
+    def handle(self, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            with open(kwargs['snapshot'], 'rb') as f:
+                data = f.read()
+
+            if kwargs['verify_only']:
+                header, _ = kb_snapshot.read_container(data)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Snapshot {header['kb_version']} created {header['created_at']} is valid: {header['counts']}"
+                ))
+                return
+
+            snapshot, header = kb_snapshot.import_snapshot(data)
+        except (OSError, kb_snapshot.SnapshotError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported snapshot {snapshot.kb_version} in {time.monotonic() - started:.1f}s: {header['counts']}"
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.health_source_manager import HealthSourceManager
+from chatbot.sitemap_ingest import SitemapIngester, parse_lastmod, sitemaps_from_robots
+
+class Command(BaseCommand):
+    help = 'Stream sitemap.xml / sitemap indexes (optionally gzipped) into URLSource, tracking <lastmod> changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', type=str, help='Sitemap URLs (or site URLs with --from-robots)')
+        parser.add_argument('--from-robots', action='store_true',
+                            help='Treat URLs as sites and read their sitemaps from robots.txt')
+        parser.add_argument('--since', type=str, help='Skip entries with <lastmod> at or before this date/datetime')
+        parser.add_argument('--batch-size', type=int, default=500, help='URLs written per database batch')
+        parser.add_argument('--max-urls', type=int, help='Stop after this many sitemap entries')
+        parser.add_argument('--max-sitemaps', type=int, default=200, help='Maximum number of sitemap files to read')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue knowledge update jobs for new and changed pages')
+
+    def handle(self, *args, **kwargs):
+        since = None
+        if kwargs['since']:
+            since = parse_lastmod(kwargs['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {kwargs['since']}")
+
+        sitemap_urls = kwargs['urls']
+        if kwargs['from_robots']:
+            sitemap_urls = [sitemap for url in sitemap_urls for sitemap in sitemaps_from_robots(url)]
+
+        manager = HealthSourceManager()
+        ingester = SitemapIngester(
+            manager.is_valid_health_url,
+            batch_size=kwargs['batch_size'],
+            max_urls=kwargs['max_urls'],
+            max_sitemaps=kwargs['max_sitemaps'],
+            since=since,
+            enqueue=kwargs['enqueue']
+        )
+        stats = ingester.ingest(sitemap_urls)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Sitemap ingestion: ' + ', '.join(f'{name}={value}' for name, value in stats.items())
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from chatbot import near_duplicates
+from chatbot.models import Disease
+
+class Command(BaseCommand):
+    help = 'Find near-duplicate diseases with MinHash/LSH and fold them into their canonical disease'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute signatures for all diseases and regroup duplicates before merging')
+        parser.add_argument('--threshold', type=float,
+                            help='Minimum estimated Jaccard similarity (default: CHATBOT_DUPLICATE_THRESHOLD or 0.7)')
+        parser.add_argument('--dry-run', action='store_true', help='Only list duplicate groups, do not merge')
+
+    def handle(self, *args, **kwargs):
+        groups = {}
+        if kwargs['rebuild'] and kwargs['dry_run']:
+            # Chỉ tính nhóm mới, không ghi chữ ký hay duplicate_of
+            regrouped = near_duplicates.rebuild_index(threshold=kwargs['threshold'], save=False)
+            diseases = Disease.objects.in_bulk([pk for canonical, members in regrouped.items()
+                                                for pk in [canonical] + members])
+            for canonical, members in sorted(regrouped.items()):
+                groups[diseases[canonical]] = [diseases[pk] for pk in sorted(members)]
+        else:
+            if kwargs['rebuild']:
+                near_duplicates.rebuild_index(threshold=kwargs['threshold'])
+            for duplicate in Disease.objects.exclude(duplicate_of=None).select_related('duplicate_of').order_by('pk'):
+                groups.setdefault(duplicate.duplicate_of, []).append(duplicate)
+
+        if not groups:
+            self.stdout.write(self.style.SUCCESS('No near-duplicate diseases found'))
+            return
+
+        merged = 0
+        for canonical, duplicates in groups.items():
+            self.stdout.write(f'{canonical.name} (#{canonical.pk}) <- ' +
+                              ', '.join(f'{d.name} (#{d.pk})' for d in duplicates))
+            if kwargs['dry_run']:
+                continue
+
+            for duplicate in duplicates:
+                near_duplicates.merge_into(duplicate, canonical)
+                merged += 1
+            # Triệu chứng của bệnh gốc đã thay đổi, tính lại chữ ký
+            near_duplicates.store_signature(canonical, near_duplicates.compute_signature(canonical))
+
+        if kwargs['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(groups)} duplicate groups found (dry run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Merged {merged} diseases into {len(groups)} canonical diseases'))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from chatbot import stats_snapshot
+
+class Command(BaseCommand):
+    help = 'Recount stats counters from the database (fixes drift from bulk updates/deletes that skip signals)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and reconcile every N seconds (0 = run once)')
+
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+
+        while True:
+            close_old_connections()
+            stats = stats_snapshot.reconcile()
+            self.stdout.write(self.style.SUCCESS(
+                'Reconciled: ' + ', '.join(f'{name}={value}' for name, value in stats.items())
+            ))
+
+            if not interval:
+                break
+            time.sleep(interval)
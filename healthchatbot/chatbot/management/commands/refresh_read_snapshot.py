@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot import storage
+
+class Command(BaseCommand):
+    help = "Copy the primary database into the chat read snapshot (storage profile 'split')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Copy even if the snapshot already has the current knowledge-base revision')
+
+    def handle(self, *args, **kwargs):
+        database = storage.read_database()
+        if database is None:
+            raise CommandError("No read database configured, set CHATBOT_STORAGE_PROFILE=split")
+        if not storage.is_sqlite(database):
+            raise CommandError("The read database is not a SQLite snapshot, it is refreshed by replication")
+
+        revision = storage.refresh_read_snapshot(force=kwargs['force'])
+        self.stdout.write(self.style.SUCCESS(f"Read snapshot {database['NAME']} is at kb revision {revision}"))
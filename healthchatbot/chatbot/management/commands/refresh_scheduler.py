@@ -0,0 +1,47 @@
+import signal
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from chatbot.health_source_manager import HealthSourceManager
+from chatbot.refresh_scheduler import RefreshScheduler
+
+class Command(BaseCommand):
+    help = 'Run the long-running source refresh scheduler (due-time priority queue with concurrency and bandwidth limits)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-concurrency', type=int, default=2, help='Maximum refreshes running at once')
+        parser.add_argument('--bandwidth-kbps', type=int, default=256,
+                            help='Average download budget in KB/s across all refreshes (0 = unlimited)')
+        parser.add_argument('--poll-interval', type=float, default=30.0, help='Maximum seconds between scheduling passes')
+        parser.add_argument('--reload-interval', type=float, default=300.0,
+                            help='Seconds between reloading sources from the database')
+        parser.add_argument('--base-backoff-minutes', type=int, default=15, help='Backoff after the first failure')
+        parser.add_argument('--max-backoff-hours', type=int, default=24, help='Upper bound for failure backoff')
+        parser.add_argument('--once', action='store_true', help='Refresh sources that are due now, then exit')
+
+    def handle(self, *args, **kwargs):
+        manager = HealthSourceManager()
+        scheduler = RefreshScheduler(
+            manager,
+            max_concurrency=kwargs['max_concurrency'],
+            bandwidth_bytes_per_second=kwargs['bandwidth_kbps'] * 1024,
+            base_backoff=timedelta(minutes=kwargs['base_backoff_minutes']),
+            max_backoff=timedelta(hours=kwargs['max_backoff_hours']),
+            reload_interval=kwargs['reload_interval'],
+        )
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping scheduler after in-flight refreshes finish...')
+            scheduler.stop()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(f'Refresh scheduler started (concurrency={kwargs["max_concurrency"]}, '
+                          f'bandwidth={kwargs["bandwidth_kbps"]} KB/s)')
+
+        stats = scheduler.run(once=kwargs['once'], poll_interval=kwargs['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scheduler stopped: {stats["dispatched"]} dispatched, {stats["succeeded"]} succeeded, '
+            f'{stats["failed"]} failed, {stats["bytes"]} bytes'
+        ))
@@ -0,0 +1,63 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from chatbot import stats_snapshot
+from chatbot.knowledge_jobs import claim_next_job, run_job, requeue_stale_jobs, default_worker_name
+from chatbot.nlp_processor import ImprovedNLPProcessor
+
+class Command(BaseCommand):
+    help = 'Run the background worker that processes queued knowledge base update jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process pending jobs then exit')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Exit after this many jobs (0 = unlimited)')
+        parser.add_argument('--stale-minutes', type=int, default=60,
+                            help='Requeue running jobs started longer ago than this (crashed workers)')
+        parser.add_argument('--reconcile-stats-every', type=float, default=0,
+                            help='Also reconcile stats counters every N seconds while idle (0 = never)')
+
+    def handle(self, *args, **kwargs):
+        worker_name = default_worker_name()
+        poll_interval = kwargs['poll_interval']
+        max_jobs = kwargs['max_jobs']
+
+        requeue_stale_jobs(kwargs['stale_minutes'])
+
+        # Dùng một processor cho mọi job; worker không phục vụ chat nên không dựng lại index sau mỗi job
+        processor = ImprovedNLPProcessor()
+
+        self.stdout.write(f'Knowledge worker {worker_name} started')
+        processed = 0
+        reconcile_every = kwargs['reconcile_stats_every']
+        last_reconcile = time.monotonic()
+
+        try:
+            while True:
+                close_old_connections()
+                job = claim_next_job(worker_name)
+
+                if reconcile_every and time.monotonic() - last_reconcile >= reconcile_every:
+                    stats_snapshot.reconcile()
+                    last_reconcile = time.monotonic()
+
+                if job is None:
+                    if kwargs['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f'Processing job #{job.pk} ({len(job.urls)} URLs)...')
+                job = run_job(job, processor=processor)
+
+                style = self.style.SUCCESS if job.status == 'succeeded' else self.style.ERROR
+                self.stdout.write(style(f'Job #{job.pk} {job.status}: {job.imported_diseases} diseases'))
+
+                processed += 1
+                if max_jobs and processed >= max_jobs:
+                    break
+
+        except KeyboardInterrupt:
+            self.stdout.write('Worker interrupted')
+
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped after {processed} jobs'))
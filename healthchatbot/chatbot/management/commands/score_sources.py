@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from chatbot.health_source_manager import HealthSourceManager
+from chatbot.models import URLSource
+
+class Command(BaseCommand):
+    help = 'Score content quality of URL sources in batch and store the scores on URLSource'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', type=str, help='URLs to score (default: active sources due for scoring)')
+        parser.add_argument('--max-age-days', type=int, default=30,
+                            help='Rescore sources whose score is older than this')
+        parser.add_argument('--limit', type=int, default=500, help='Maximum number of sources to score')
+        parser.add_argument('--workers', type=int, help='Number of scoring processes (default: CPU count)')
+
+    def handle(self, *args, **kwargs):
+        urls = kwargs['urls']
+        if not urls:
+            threshold = timezone.now() - timedelta(days=kwargs['max_age_days'])
+            urls = list(URLSource.objects
+                        .filter(active=True)
+                        .filter(Q(quality_checked_at__isnull=True) | Q(quality_checked_at__lt=threshold))
+                        .order_by('quality_checked_at', 'pk')
+                        .values_list('url', flat=True)[:kwargs['limit']])
+
+        manager = HealthSourceManager()
+        results = manager.validate_sources(urls, max_workers=kwargs['workers'])
+
+        for url, result in results.items():
+            self.stdout.write(f"{result['quality_score']:>4} {result['reliability']:<8} {url}")
+        self.stdout.write(self.style.SUCCESS(f'Scored {len(results)} sources'))
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from .models import StatsCounter
+
+logger = logging.getLogger(__name__)
+
+# Bộ đếm vận hành được lưu thành các dòng StatsCounter có tiền tố này (cộng dồn từ mọi worker)
+PREFIX = 'metric.'
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+_flushing = False
+
+
+def incr(name, delta=1):
+    """Tăng một bộ đếm; giá trị được gom trong bộ nhớ và ghi xuống database ở thread nền tối đa
+    một lần mỗi CHATBOT_METRICS_FLUSH_INTERVAL giây, không ghi (chờ khóa ghi SQLite) trên request"""
+    global _last_flush, _flushing
+
+    if not delta:
+        return
+    with _lock:
+        _pending[name] += delta
+        if _flushing or time.monotonic() - _last_flush < getattr(settings, 'CHATBOT_METRICS_FLUSH_INTERVAL', 10):
+            return
+        _last_flush = time.monotonic()
+        _flushing = True
+
+    thread = threading.Thread(target=_flush_in_background, name='metrics-flush', daemon=True)
+    thread.start()
+
+
+def _flush_in_background():
+    global _flushing
+
+    try:
+        flush()
+    finally:
+        _flushing = False
+        connections.close_all()
+
+
+def _write(name, delta):
+    updated = StatsCounter.objects.filter(name=PREFIX + name).update(value=F('value') + delta,
+                                                                     updated_at=timezone.now())
+    if not updated:
+        counter, created = StatsCounter.objects.get_or_create(name=PREFIX + name, defaults={'value': delta})
+        if not created:
+            StatsCounter.objects.filter(pk=counter.pk).update(value=F('value') + delta, updated_at=timezone.now())
+
+
+def flush():
+    """Ghi các giá trị đang gom xuống bảng StatsCounter"""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+
+    try:
+        for name, delta in list(pending.items()):
+            _write(name, delta)
+            del pending[name]
+    except Exception as e:
+        # Giữ lại các giá trị chưa ghi để lần sau ghi tiếp (giá trị đã ghi không cộng lại lần nữa)
+        logger.error(f"Error flushing metrics: {e}")
+        with _lock:
+            _pending.update(pending)
+
+
+def snapshot():
+    """Giá trị hiện tại của mọi bộ đếm (đã ghi + đang gom trong process này)"""
+    values = {name[len(PREFIX):]: value for name, value in
+              StatsCounter.objects.filter(name__startswith=PREFIX).values_list('name', 'value')}
+    with _lock:
+        for name, delta in _pending.items():
+            values[name] = values.get(name, 0) + delta
+    return values
+
+
+def rate(values, numerator, denominator):
+    total = values.get(denominator, 0)
+    return round(values.get(numerator, 0) / total, 4) if total else 0.0
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_knowledgeupdatejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlsource',
+            name='failure_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='last_failure_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,176 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:14
+
+from urllib.parse import urlparse
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Danh mục nguồn tin cậy và các hàm chuẩn hóa domain tại thời điểm viết migration (bản sao cố định, không import
+# module đang chạy: migration lịch sử không được thay đổi theo code sau này)
+TRUSTED_SOURCES = {
+    'government': [
+        {
+            'url': 'https://moh.gov.vn/tin-tuc-su-kien',
+            'name': 'Bộ Y tế Việt Nam',
+            'reliability': 5,
+            'update_frequency': 'daily',
+            'content_types': ['news', 'guidelines', 'health_alerts']
+        },
+        {
+            'url': 'https://kcb.vn/',
+            'name': 'Cổng thông tin khám chữa bệnh',
+            'reliability': 5,
+            'update_frequency': 'daily',
+            'content_types': ['healthcare_facilities', 'medical_procedures']
+        }
+    ],
+    'medical_centers': [
+        {
+            'url': 'https://vnvc.vn/cac-benh-truyen-nhiem-thuong-gap/',
+            'name': 'VNVC - Trung tâm tiêm chủng',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['infectious_diseases', 'vaccines', 'prevention']
+        },
+        {
+            'url': 'https://www.vinmec.com/vi/bai-viet/cac-benh-truyen-nhiem-thuong-gap-175',
+            'name': 'Vinmec International Hospital',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['diseases', 'treatments', 'health_tips']
+        },
+        {
+            'url': 'https://benhvienbachmai.vn/tin-tuc-su-kien/',
+            'name': 'Bệnh viện Bạch Mai',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_news', 'treatments', 'specialties']
+        },
+        {
+            'url': 'https://www.108.vn/benh-vien/danh-sach-benh-vien',
+            'name': 'Bệnh viện Trung ương Quân đội 108',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_services', 'health_information']
+        }
+    ],
+    'health_portals': [
+        {
+            'url': 'https://suckhoedoisong.vn/benh-truyen-nhiem/',
+            'name': 'Sức khỏe đời sống',
+            'reliability': 3,
+            'update_frequency': 'daily',
+            'content_types': ['health_news', 'lifestyle', 'disease_info']
+        },
+        {
+            'url': 'https://hellobacsi.com/benh-truyen-nhiem/',
+            'name': 'Hello Bacsi',
+            'reliability': 3,
+            'update_frequency': 'daily',
+            'content_types': ['health_articles', 'medical_advice', 'symptoms']
+        },
+        {
+            'url': 'https://nhathuoclongchau.com.vn/bai-viet/cac-benh-truyen-nhiem-thuong-gap.html',
+            'name': 'Nhà thuốc Long Châu',
+            'reliability': 3,
+            'update_frequency': 'weekly',
+            'content_types': ['medications', 'health_tips', 'disease_prevention']
+        }
+    ],
+    'international': [
+        {
+            'url': 'https://medlineplus.gov/languages/vietnamese.html',
+            'name': 'MedlinePlus Vietnamese',
+            'reliability': 5,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_encyclopedia', 'health_topics', 'drug_information']
+        },
+        {
+            'url': 'https://www.who.int/vietnam/health-topics',
+            'name': 'WHO Vietnam',
+            'reliability': 5,
+            'update_frequency': 'weekly',
+            'content_types': ['global_health', 'disease_outbreaks', 'health_guidelines']
+        }
+    ]
+}
+
+
+def normalize_domain(url):
+    """Chuẩn hóa domain của URL: chữ thường, bỏ port và tiền tố www."""
+    netloc = urlparse(url).netloc.lower()
+    if '@' in netloc:
+        netloc = netloc.rsplit('@', 1)[1]
+    netloc = netloc.split(':', 1)[0].rstrip('.')
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc
+
+
+def domain_candidates(domain):
+    """Domain và các domain cha (tin.moh.gov.vn -> moh.gov.vn), dùng để tra cứu bằng index"""
+    parts = domain.split('.')
+    return ['.'.join(parts[i:]) for i in range(len(parts) - 1)] or [domain]
+
+
+def seed_trusted_sources(apps, schema_editor):
+    TrustedSource = apps.get_model('chatbot', 'TrustedSource')
+    URLSource = apps.get_model('chatbot', 'URLSource')
+
+    by_domain = {}
+    for category, sources in TRUSTED_SOURCES.items():
+        for source in sources:
+            trusted, _ = TrustedSource.objects.update_or_create(
+                domain=normalize_domain(source['url']),
+                defaults={
+                    'name': source['name'],
+                    'category': category,
+                    'url': source['url'],
+                    'reliability': source['reliability'],
+                    'update_frequency': source['update_frequency'],
+                    'content_types': source['content_types'],
+                }
+            )
+            by_domain[trusted.domain] = trusted
+
+    for url_source in URLSource.objects.all():
+        url_source.domain = normalize_domain(url_source.url)
+        url_source.trusted_source = next(
+            (by_domain[d] for d in domain_candidates(url_source.domain) if d in by_domain), None
+        )
+        url_source.save(update_fields=['domain', 'trusted_source'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_urlsource_failure_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrustedSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('category', models.CharField(max_length=50)),
+                ('url', models.URLField()),
+                ('domain', models.CharField(max_length=255, unique=True)),
+                ('reliability', models.IntegerField(default=3)),
+                ('update_frequency', models.CharField(default='weekly', max_length=20)),
+                ('content_types', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='domain',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='trusted_source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='url_sources', to='chatbot.trustedsource'),
+        ),
+        migrations.RunPython(seed_trusted_sources, migrations.RunPython.noop),
+    ]
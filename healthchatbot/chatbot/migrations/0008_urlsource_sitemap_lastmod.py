@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_statscounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlsource',
+            name='sitemap_lastmod',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_urlsource_sitemap_lastmod'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlsource',
+            name='last_check_status',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
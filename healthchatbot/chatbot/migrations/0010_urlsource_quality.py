@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_urlsource_liveness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlsource',
+            name='quality_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='quality_reliability',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='urlsource',
+            name='quality_score',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
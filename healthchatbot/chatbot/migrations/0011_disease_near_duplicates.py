@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0010_urlsource_quality'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disease',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='chatbot.disease'),
+        ),
+        migrations.CreateModel(
+            name='DiseaseLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('disease', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='chatbot.disease')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DiseaseSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minhash', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('disease', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='signature', to='chatbot.disease')),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:28
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+# Từ điển triệu chứng curated tại thời điểm viết migration (bản sao cố định, không import module đang chạy:
+# migration lịch sử không được thay đổi theo code sau này)
+CURATED_SYMPTOMS = [
+    'sốt', 'ho', 'khó thở', 'đau ngực', 'đau bụng', 'đau đầu', 'chóng mặt', 'buồn nôn', 'nôn', 'tiêu chảy',
+    'táo bón', 'mệt mỏi', 'yếu', 'đau cơ', 'đau khớp', 'phát ban', 'ngứa', 'chảy nước mũi', 'nghẹt mũi',
+    'hắt hơi', 'đau họng', 'khàn tiếng', 'nuốt khó', 'ợ chua', 'đầy hơi', 'khó tiêu', 'đau lưng', 'đau cổ',
+    'tê bì', 'run', 'co giật', 'mất ý thức', 'hôn mê', 'suy giảm trí nhớ', 'lẫn', 'mất ngủ', 'ác mông',
+    'lo lắng', 'buồn bã', 'cáu gắt', 'sốt cao', 'sốt nhẹ', 'ớn lạnh', 'ho khan', 'ho có đờm', 'ho ra máu',
+    'sổ mũi', 'đau mỏi người', 'nôn mửa', 'chán ăn', 'sụt cân', 'vàng da', 'xuất huyết', 'nổi hạch',
+    'phát ban đỏ', 'mụn nước', 'đau mắt', 'đỏ mắt', 'khó nuốt', 'tiêu chảy ra máu', 'đau tai', 'khó ngủ',
+    'đổ mồ hôi', 'đau cơ thể', 'đau nhức', 'đau nhức cơ thể', 'thiếu máu', 'rụng tóc', 'nước tiểu sẫm màu',
+]
+
+
+def seed_symptom_vocabulary(apps, schema_editor):
+    """Đánh dấu/tạo các triệu chứng trong từ điển curated là triệu chứng chuẩn"""
+    Symptom = apps.get_model('chatbot', 'Symptom')
+    StatsCounter = apps.get_model('chatbot', 'StatsCounter')
+
+    created = 0
+    for name in CURATED_SYMPTOMS:
+        updated = Symptom.objects.filter(name=name).update(is_canonical=True)
+        if not updated:
+            Symptom.objects.create(name=name, is_canonical=True)
+            created += 1
+
+    # Model lịch sử không gửi signal nên tự cập nhật bộ đếm thống kê
+    StatsCounter.objects.filter(name='total_symptoms').update(value=F('value') + created)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0011_disease_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymptomCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized', models.CharField(max_length=200, unique=True)),
+                ('phrase', models.CharField(max_length=200)),
+                ('occurrences', models.IntegerField(default=1)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='symptom',
+            name='is_canonical',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(seed_symptom_vocabulary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0013_chat_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeBaseSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kb_version', models.CharField(db_index=True, max_length=32)),
+                ('checksum', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField()),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+                ('index', models.BinaryField()),
+            ],
+        ),
+    ]
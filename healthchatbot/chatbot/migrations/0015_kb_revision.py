@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0014_kb_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebasesnapshot',
+            name='revision',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
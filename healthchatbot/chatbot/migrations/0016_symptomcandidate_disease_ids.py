@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0015_kb_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symptomcandidate',
+            name='disease_ids',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from .trusted_sources import normalize_domain, domain_candidates, match_domain
 
 class Disease(models.Model):
     name = models.CharField(max_length=200)
@@ -6,17 +7,42 @@ class Disease(models.Model):
     causes = models.TextField(blank=True)
     is_contagious = models.BooleanField(default=False)
     source_url = models.URLField(blank=True, null=True)  # Trường URL nguồn
+    # Bản gần trùng (cùng bệnh nhập từ nguồn khác) trỏ về bệnh gốc, không đưa vào index/câu trả lời
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='duplicates')
     
     def __str__(self):
         return self.name
 
+class DiseaseSignature(models.Model):
+    disease = models.OneToOneField(Disease, on_delete=models.CASCADE, related_name='signature')
+    minhash = models.BinaryField()  # NUM_PERM số uint32 (xem near_duplicates.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class DiseaseLSHBucket(models.Model):
+    disease = models.ForeignKey(Disease, on_delete=models.CASCADE, related_name='lsh_buckets')
+    bucket = models.BigIntegerField(db_index=True)  # Hash của một band chữ ký MinHash
+
 class Symptom(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
+    is_canonical = models.BooleanField(default=False, db_index=True)  # Thuộc từ điển triệu chứng chuẩn
     
     def __str__(self):
         return self.name
 
+class SymptomCandidate(models.Model):
+    """Cụm triệu chứng trích xuất được nhưng chưa có trong từ điển, xuất hiện ở đủ nhiều bệnh thì được thêm vào"""
+    normalized = models.CharField(max_length=200, unique=True)
+    phrase = models.CharField(max_length=200)
+    occurrences = models.IntegerField(default=1)  # Số bệnh khác nhau đã cho ra cụm này
+    disease_ids = models.JSONField(default=list)  # Các bệnh đó; import lại cùng trang không tính thêm
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.phrase
+
 class DiseaseSymptom(models.Model):
     disease = models.ForeignKey(Disease, on_delete=models.CASCADE, related_name='symptoms_link')
     symptom = models.ForeignKey(Symptom, on_delete=models.CASCADE, related_name='diseases_link')
@@ -60,7 +86,7 @@ class Vaccine(models.Model):
 class ChatSession(models.Model):
     session_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Lần hoạt động cuối, dùng để chọn phiên cần lưu trữ
     
     def __str__(self):
         return f"Session {self.session_id}"
@@ -78,14 +104,131 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Lịch sử một phiên theo thời gian: đọc bằng một lần quét index, không cần sắp xếp
+            models.Index(fields=['session', 'timestamp'], name='chat_msg_session_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender}: {self.message[:30]}..."
+
+class ArchivedSession(models.Model):
+    """Phiên chat đã chuyển khỏi bảng nóng sang file lưu trữ (gzip JSONL, mỗi phiên một gzip member)"""
+    session_id = models.CharField(max_length=100, unique=True)
+    archive_file = models.CharField(max_length=255)  # Đường dẫn tương đối trong CHATBOT_ARCHIVE_DIR
+    offset = models.BigIntegerField()  # Vị trí byte của gzip member trong file
+    length = models.BigIntegerField()
+    message_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived session {self.session_id}"
+
+class TrustedSource(models.Model):
+    name = models.CharField(max_length=200)
+    category = models.CharField(max_length=50)
+    url = models.URLField()
+    domain = models.CharField(max_length=255, unique=True)  # Domain đã chuẩn hóa (không www.)
+    reliability = models.IntegerField(default=3)  # 1-5
+    update_frequency = models.CharField(max_length=20, default='weekly')
+    content_types = models.JSONField(default=list, blank=True)
+    
+    def __str__(self):
+        return self.name
+    
+    @classmethod
+    def for_url(cls, url):
+        """Tìm nguồn tin cậy khớp domain (hoặc domain cha) của URL bằng một truy vấn có index"""
+        domain = normalize_domain(url)
+        matches = {source.domain: source for source in cls.objects.filter(domain__in=domain_candidates(domain))}
+        return match_domain(domain, matches)
+
 class URLSource(models.Model):
     url = models.URLField(unique=True)
     last_updated = models.DateTimeField(null=True, blank=True)
     success_count = models.IntegerField(default=0)
     active = models.BooleanField(default=True)
+    failure_count = models.IntegerField(default=0)  # Số lần lỗi liên tiếp, dùng cho backoff
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    domain = models.CharField(max_length=255, blank=True, db_index=True)
+    trusted_source = models.ForeignKey(TrustedSource, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='url_sources')
+    sitemap_lastmod = models.DateTimeField(null=True, blank=True)  # <lastmod> gần nhất đọc từ sitemap
+    last_checked_at = models.DateTimeField(null=True, blank=True)  # Lần kiểm tra liveness gần nhất
+    last_check_status = models.IntegerField(null=True, blank=True)  # Mã HTTP, None nếu không kết nối được
+    quality_score = models.IntegerField(null=True, blank=True)  # Điểm từ validate_sources
+    quality_reliability = models.CharField(max_length=20, blank=True)
+    quality_checked_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return self.url
+    
+    @property
+    def changed_since_update(self):
+        """Sitemap báo trang đã thay đổi sau lần cập nhật cuối (trang chưa crawl lần nào cũng tính là đã thay đổi)"""
+        return bool(self.sitemap_lastmod and (self.last_updated is None or self.sitemap_lastmod > self.last_updated))
+    
+    def save(self, *args, **kwargs):
+        domain = normalize_domain(self.url)
+        if domain != self.domain or self.pk is None:
+            self.domain = domain
+            self.trusted_source = TrustedSource.for_url(self.url)
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def link_trusted_sources(cls, queryset=None):
+        """Gán lại trusted_source theo domain cho nhiều nguồn (sau bulk_create/bulk_update)"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        queryset.update(trusted_source=None)
+        # Domain ngắn trước để domain cụ thể hơn (subdomain) ghi đè sau
+        for trusted in sorted(TrustedSource.objects.all(), key=lambda t: len(t.domain)):
+            queryset.filter(
+                models.Q(domain=trusted.domain) | models.Q(domain__endswith='.' + trusted.domain)
+            ).update(trusted_source=trusted)
+
+class KnowledgeUpdateJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    urls = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    progress = models.JSONField(default=dict, blank=True)  # {url: {'state': ..., 'imported': n, 'error': ...}}
+    imported_diseases = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Job {self.pk} ({self.status})"
+
+class StatsCounter(models.Model):
+    """Bộ đếm được cập nhật dần qua signal, thay cho COUNT(*) trên mỗi request"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class KnowledgeBaseSnapshot(models.Model):
+    """Snapshot knowledge base đã nạp vào database này (xem kb_snapshot.py), kèm index TF-IDF dựng sẵn"""
+    kb_version = models.CharField(max_length=32, db_index=True)  # Digest nội dung các bảng
+    checksum = models.CharField(max_length=64)  # sha256 của body file snapshot
+    created_at = models.DateTimeField()  # Thời điểm export
+    imported_at = models.DateTimeField(auto_now_add=True)
+    revision = models.BigIntegerField(null=True, blank=True)  # kb_revision sau khi nạp; khác đi thì index hết hiệu lực
+    index = models.BinaryField()
     
     def __str__(self):
-        return self.url
\ No newline at end of file
+        return f"Snapshot {self.kb_version}"
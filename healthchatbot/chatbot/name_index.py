@@ -0,0 +1,91 @@
+import re
+from .symptom_vocabulary import AMBIGUOUS_SINGLE_WORDS, fold, normalize_words
+
+DISEASE = 'disease'
+SYMPTOM = 'symptom'
+
+# Khớp dạng không dấu và bí danh chỉ với cụm đủ dài, tránh các từ ngắn trùng nghĩa khác
+MIN_FOLDED_KEY_LENGTH = 3
+
+# Tên bệnh một từ cũng là từ thông dụng ("mô tả", "lao động", "phòng" khi bỏ dấu):
+# chỉ khớp khi đi kèm "bệnh" ("bệnh tả", "bệnh lao")
+COMMON_WORD_NAMES = {'tả', 'than', 'phong', 'lao', 'dại'}
+
+
+def _key(words):
+    key = ' '.join(words)
+    return 'bệnh ' + key if key in COMMON_WORD_NAMES else key
+
+
+def name_keys(name):
+    """Các khóa tra cứu của một tên: dạng chuẩn hóa, tên trong ngoặc, các tên tách bởi '/',
+    và bỏ tiền tố 'bệnh' khi phần còn lại đủ dài để không trùng từ thông thường
+
+    Ví dụ 'Bệnh viêm gan B (Hepatitis B)' -> {'bệnh viêm gan b hepatitis b', 'bệnh viêm gan b', 'viêm gan b',
+    'hepatitis b'}.
+    """
+    if '<' in name or '>' in name:
+        # Tên lẫn markup do crawl lỗi, không dùng để trả lời nhanh
+        return set()
+
+    keys = set()
+    full = _key(normalize_words(name))
+    if full:
+        keys.add(full)  # Tên đầy đủ luôn được dùng, kể cả tên ngắn như 'ho'
+
+    variants = [re.sub(r'\([^)]*\)', ' ', name)] + re.findall(r'\(([^)]*)\)', name) + name.split('/')
+    for variant in variants:
+        words = normalize_words(variant)
+        forms = [words, words[1:]] if words and words[0] == 'bệnh' and len(words) > 2 else [words]
+        for form in forms:
+            key = _key(form)
+            if len(key) >= MIN_FOLDED_KEY_LENGTH:
+                keys.add(key)
+    return keys
+
+
+class NameIndex:
+    """Bảng băm tên bệnh/triệu chứng (kể cả bí danh, dạng không dấu) -> (loại, id)
+
+    Tên trùng nhau giữ mục thêm vào trước: bệnh trước triệu chứng, id nhỏ trước, nên kết quả luôn xác định.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.folded = {}
+        self.max_words = 1
+
+    def add(self, kind, obj_id, name):
+        for key in name_keys(name):
+            self.exact.setdefault(key, (kind, obj_id))
+            self.folded.setdefault(fold(key), (kind, obj_id))
+            self.max_words = max(self.max_words, len(key.split()))
+
+    def __len__(self):
+        return len(self.exact)
+
+    def lookup(self, key):
+        hit = self.exact.get(key)
+        if hit is None and key.isascii() and len(key) >= MIN_FOLDED_KEY_LENGTH:
+            # Người dùng gõ không dấu
+            hit = self.folded.get(key)
+        return hit
+
+    def scan(self, text):
+        """Quét câu hỏi từ trái sang phải, mỗi vị trí lấy cụm khớp dài nhất; trả về [(loại, id)] không trùng"""
+        words = normalize_words(text)
+        found = []
+        i = 0
+        while i < len(words):
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                key = ' '.join(words[i:i + size])
+                if size == 1 and key in AMBIGUOUS_SINGLE_WORDS:
+                    continue
+                hit = self.lookup(key)
+                if hit:
+                    found.append(hit)
+                    i += size
+                    break
+            else:
+                i += 1
+        return list(dict.fromkeys(found))
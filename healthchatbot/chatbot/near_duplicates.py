@@ -0,0 +1,252 @@
+import hashlib
+import logging
+import re
+import string
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from unidecode import unidecode
+from .models import Disease, DiseaseSymptom, DiseaseSignature, DiseaseLSHBucket
+from . import kb_revision
+
+logger = logging.getLogger(__name__)
+
+# 128 hàm băm chia thành 32 band x 4 hàng: cặp có Jaccard 0.7 gần như chắc chắn rơi chung ít nhất một bucket,
+# cặp dưới 0.3 hiếm khi, nên chỉ cần so sánh chính xác trên số ít ứng viên
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_random = np.random.RandomState(20240601)  # Cố định để chữ ký đã lưu vẫn so sánh được giữa các lần chạy
+_PERM_A = _random.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _random.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def get_threshold():
+    return getattr(settings, 'CHATBOT_DUPLICATE_THRESHOLD', 0.7)
+
+
+def normalize(text):
+    """Chữ thường, bỏ dấu, bỏ số và dấu câu (giống preprocess_text của NLP processor)"""
+    text = unidecode((text or '').lower())
+    text = re.sub(r'\d+', ' ', text)
+    text = text.translate(str.maketrans(string.punctuation, ' ' * len(string.punctuation)))
+    return text.split()
+
+
+def disease_text(disease, symptom_names):
+    return ' '.join([disease.name, disease.description or ''] + sorted(symptom_names))
+
+
+def shingles(words, size=SHINGLE_SIZE):
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash32(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+def minhash(shingle_set):
+    """Chữ ký MinHash (NUM_PERM số uint32) của một tập shingle"""
+    if not shingle_set:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint32)
+    hashes = np.fromiter((_hash32(s) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    permuted = ((hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """Khóa bucket LSH cho từng band (đã gồm chỉ số band nên không trùng giữa các band)"""
+    buckets = []
+    for band in range(BANDS):
+        chunk = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little') & ((1 << 63) - 1))
+    return buckets
+
+
+def similarity(signature_a, signature_b):
+    """Ước lượng độ tương đồng Jaccard từ hai chữ ký"""
+    return float(np.mean(signature_a == signature_b))
+
+
+def signature_from_bytes(data):
+    return np.frombuffer(bytes(data), dtype=np.uint32)
+
+
+def compute_signature(disease, symptom_names=None):
+    if symptom_names is None:
+        symptom_names = list(disease.symptoms_link.values_list('symptom__name', flat=True))
+    return minhash(shingles(normalize(disease_text(disease, symptom_names))))
+
+
+def store_signature(disease, signature):
+    DiseaseSignature.objects.update_or_create(disease=disease, defaults={'minhash': signature.tobytes()})
+    DiseaseLSHBucket.objects.filter(disease=disease).delete()
+    DiseaseLSHBucket.objects.bulk_create(
+        [DiseaseLSHBucket(disease=disease, bucket=bucket) for bucket in band_buckets(signature)]
+    )
+
+
+def register(disease, symptom_names=None, threshold=None):
+    """Gọi khi nhập/cập nhật một bệnh: lưu chữ ký vào index LSH và đánh dấu nếu là bản gần trùng
+
+    Trả về id của bệnh gốc (canonical) nếu bệnh này trùng với bệnh đã có, ngược lại None.
+    """
+    threshold = get_threshold() if threshold is None else threshold
+    signature = compute_signature(disease, symptom_names)
+    buckets = band_buckets(signature)
+
+    with transaction.atomic():
+        store_signature(disease, signature)
+
+        candidate_ids = set(DiseaseLSHBucket.objects
+                            .filter(bucket__in=buckets)
+                            .exclude(disease=disease)
+                            .values_list('disease_id', flat=True))
+        matches = [
+            candidate.disease_id
+            for candidate in DiseaseSignature.objects.filter(disease_id__in=candidate_ids)
+            if similarity(signature, signature_from_bytes(candidate.minhash)) >= threshold
+        ]
+
+        if not matches:
+            if disease.duplicate_of_id:
+                # Nội dung đã thay đổi, không còn trùng nữa
+                Disease.objects.filter(pk=disease.pk).update(duplicate_of=None)
+                disease.duplicate_of_id = None
+                kb_revision.changed()
+            return None
+
+        # Gộp các nhóm liên quan về bệnh có id nhỏ nhất (bệnh được nhập sớm nhất)
+        roots = {disease.pk}
+        for pk, duplicate_of in Disease.objects.filter(pk__in=matches).values_list('pk', 'duplicate_of'):
+            roots.add(duplicate_of or pk)
+        canonical = min(roots)
+        others = roots - {canonical}
+
+        Disease.objects.filter(pk__in=others).update(duplicate_of=canonical)
+        Disease.objects.filter(duplicate_of__in=others).update(duplicate_of=canonical)
+        # Bệnh gốc không trỏ tới bệnh nào (kể cả khi chính bệnh này trước đó là bản trùng của nhóm khác)
+        Disease.objects.filter(pk=canonical).exclude(duplicate_of=None).update(duplicate_of=None)
+        disease.duplicate_of_id = canonical if disease.pk != canonical else None
+        kb_revision.changed()
+
+    if disease.duplicate_of_id:
+        logger.info(f"Disease '{disease.name}' ({disease.pk}) is a near-duplicate of {canonical}")
+    return disease.duplicate_of_id
+
+
+def rebuild_index(threshold=None, batch_size=500, save=True):
+    """Tính lại chữ ký cho toàn bộ bệnh và gán duplicate_of theo nhóm (LSH + union-find, không so từng cặp)
+
+    Trả về {id bệnh gốc: [id các bản trùng]}. save=False chỉ tính nhóm, không ghi gì vào database.
+    """
+    threshold = get_threshold() if threshold is None else threshold
+
+    symptoms_by_disease = {}
+    for disease_id, name in DiseaseSymptom.objects.values_list('disease_id', 'symptom__name'):
+        symptoms_by_disease.setdefault(disease_id, []).append(name)
+
+    signatures = {}
+    bucket_members = {}
+    disease_ids = list(Disease.objects.order_by('pk').values_list('pk', flat=True))
+
+    for start in range(0, len(disease_ids), batch_size):
+        batch = Disease.objects.filter(pk__in=disease_ids[start:start + batch_size]).only('id', 'name', 'description')
+        for disease in batch:
+            signature = compute_signature(disease, symptoms_by_disease.get(disease.pk, []))
+            signatures[disease.pk] = signature
+            for bucket in band_buckets(signature):
+                bucket_members.setdefault(bucket, []).append(disease.pk)
+
+    # Union-find trên các cặp ứng viên đã kiểm tra độ tương đồng
+    parent = {pk: pk for pk in signatures}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    checked = set()
+    for members in bucket_members.values():
+        if len(members) < 2:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if (a, b) in checked:
+                    continue
+                checked.add((a, b))
+                if similarity(signatures[a], signatures[b]) >= threshold:
+                    root_a, root_b = find(a), find(b)
+                    if root_a != root_b:
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    duplicates = {}
+    for pk in signatures:
+        root = find(pk)
+        if root != pk:
+            duplicates.setdefault(root, []).append(pk)
+
+    if save:
+        with transaction.atomic():
+            DiseaseLSHBucket.objects.all().delete()
+            DiseaseSignature.objects.all().delete()
+            DiseaseSignature.objects.bulk_create(
+                [DiseaseSignature(disease_id=pk, minhash=signature.tobytes()) for pk, signature in signatures.items()],
+                batch_size=batch_size,
+            )
+            DiseaseLSHBucket.objects.bulk_create(
+                [DiseaseLSHBucket(disease_id=pk, bucket=bucket)
+                 for bucket, members in bucket_members.items() for pk in members],
+                batch_size=2000,
+            )
+
+            Disease.objects.exclude(duplicate_of=None).update(duplicate_of=None)
+            for canonical, members in duplicates.items():
+                Disease.objects.filter(pk__in=members).update(duplicate_of=canonical)
+            kb_revision.changed()
+
+    logger.info(f"Rebuilt near-duplicate index for {len(signatures)} diseases: {len(checked)} candidate pairs, "
+                f"{sum(len(m) for m in duplicates.values())} duplicates in {len(duplicates)} groups"
+                f"{'' if save else ' (not saved)'}")
+    return duplicates
+
+
+def merge_into(duplicate, canonical):
+    """Gộp một bệnh trùng vào bệnh gốc: chuyển triệu chứng, biến chứng, phòng ngừa, vắc-xin, điều trị rồi xóa"""
+    with transaction.atomic():
+        existing = dict(DiseaseSymptom.objects.filter(disease=canonical).values_list('symptom_id', 'relevance_score'))
+        for link in DiseaseSymptom.objects.filter(disease=duplicate):
+            if link.symptom_id not in existing:
+                DiseaseSymptom.objects.filter(pk=link.pk).update(disease=canonical)
+            elif link.relevance_score > existing[link.symptom_id]:
+                DiseaseSymptom.objects.filter(disease=canonical, symptom_id=link.symptom_id).update(
+                    relevance_score=link.relevance_score
+                )
+
+        canonical.complications.add(*duplicate.complications.all())
+        canonical.preventions.add(*duplicate.preventions.all())
+        canonical.vaccines.add(*duplicate.vaccines.all())
+        canonical.treatments.add(*duplicate.treatments.all())
+
+        update_fields = []
+        if not canonical.description and duplicate.description:
+            canonical.description = duplicate.description
+            update_fields.append('description')
+        if not canonical.causes and duplicate.causes:
+            canonical.causes = duplicate.causes
+            update_fields.append('causes')
+        if duplicate.is_contagious and not canonical.is_contagious:
+            canonical.is_contagious = True
+            update_fields.append('is_contagious')
+        if update_fields:
+            canonical.save(update_fields=update_fields)
+
+        duplicate.delete()
@@ -1,31 +1,93 @@
 import re
 import string
 import requests
+import numpy as np
 from bs4 import BeautifulSoup
 from unidecode import unidecode
-import numpy as np
+from django.conf import settings
+from django.db.models import Count
 from django.utils import timezone
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
 
 from .models import Disease, Symptom, DiseaseSymptom, Complication, Prevention, Vaccine, URLSource
+from . import http_client, kb_revision, kb_snapshot, metrics, near_duplicates, page_cache, retrieval, symptom_vocabulary
+from .name_index import NameIndex, DISEASE, SYMPTOM
+from .autocomplete import SuggestionTrie
+from .spelling import SpellingCorrector
+from .hashed_index import HashedTfidfIndex
+from .vietnamese_medical_processor import VietnameseMedicalProcessor
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Câu hỏi tiếp theo về bệnh vừa nhắc tới ("còn cách phòng ngừa?"): khía cạnh -> từ khóa (đã bỏ dấu)
+FOLLOW_UP_ASPECTS = [
+    ('preventions', ['phong ngua', 'phong benh', 'phong tranh', 'cach phong']),
+    ('vaccines', ['vac xin', 'vaccine', 'tiem phong', 'tiem chung']),
+    ('treatments', ['dieu tri', 'chua tri', 'cach chua', 'thuoc']),
+    ('complications', ['bien chung']),
+    ('symptoms', ['trieu chung', 'bieu hien', 'dau hieu']),
+    ('causes', ['nguyen nhan', 'lay lan', 'lay qua', 'lay nhiem', 'do dau']),
+]
+
+# Từ chỉ bệnh vừa nhắc và từ đệm ("còn", "bệnh này", "thì sao"): câu hỏi chỉ gồm các từ này cùng từ khóa
+# khía cạnh chắc chắn là câu hỏi tiếp theo; câu còn nội dung khác phải được tìm kiếm trước
+FOLLOW_UP_FILLER_WORDS = {
+    'con', 'benh', 'nay', 'do', 'no', 'thi', 'sao', 'the', 'nao', 'nhu', 'gi', 'la', 'co', 'khong', 'ko',
+    'vay', 'a', 'ah', 'nhi', 'nua', 'cua', 'cach', 've', 'cho', 'hoi', 'toi', 'minh', 'em', 'muon', 'biet',
+    'duoc', 'can', 'nhung', 'cac', 'ra', 'oi', 'ban', 'xin', 'hay',
+}
+
+# Tiêu đề của từng phần trong câu trả lời về một bệnh
+CARD_TITLES = {
+    'symptoms': 'Triệu chứng thường gặp',
+    'complications': 'Biến chứng có thể xảy ra',
+    'preventions': 'Cách phòng ngừa',
+    'vaccines': 'Vắc-xin phòng bệnh',
+    'treatments': 'Cách điều trị',
+    'causes': 'Nguyên nhân',
+}
+
+# Xếp hạng bệnh theo triệu chứng: tỉ trọng của độ bao phủ so với relevance_score (thang 1..MAX_RELEVANCE)
+COVERAGE_WEIGHT = 0.8
+MAX_RELEVANCE = 10
+
+DISCLAIMER = "\n\n⚠️ **Lưu ý:** Đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ."
+
 class ImprovedNLPProcessor:
     def __init__(self):
+        # Index dựng sẵn từ snapshot đã nạp (nếu còn hiệu lực), tránh fit lại TF-IDF khi khởi động
+        prebuilt = self.load_prebuilt_index()
+        
         self.symptom_vectorizer = None
         self.symptom_vectors = None
+        self.symptom_retriever = None
         self.symptoms = None
-        self.init_symptoms()
+        self.init_symptoms(prebuilt.get('symptoms'))
         
         self.disease_vectorizer = None
         self.disease_vectors = None
+        self.disease_retriever = None
         self.diseases = None
-        self.init_diseases()
+        self.init_diseases(prebuilt.get('diseases'))
+        
+        self.symptom_disease_matrix = None
+        self.init_symptom_disease_matrix()
+        
+        self.name_index = None
+        self.init_name_index()
+        
+        self.suggestions = None
+        self.init_suggestions()
+        
+        self.speller = None
+        self.init_spelling()
+        
+        # Thông tin đầy đủ của từng bệnh đã trả lời (xem disease_card)
+        self.disease_cards = {}
         
         # Danh sách từ khóa để nhận dạng bệnh
         self.disease_keywords = [
@@ -40,33 +102,79 @@ class ImprovedNLPProcessor:
             'đau', 'sốt', 'ho', 'chảy nước mũi', 'mệt mỏi', 'buồn nôn'
         ]
     
-    def init_symptoms(self):
+    def load_prebuilt_index(self):
+        if self.vectorizer_backend() != 'tfidf':
+            # Snapshot chỉ chứa index TfidfVectorizer
+            return {}
+        try:
+            return kb_snapshot.load_prebuilt_index(self.max_features()) or {}
+        except Exception as e:
+            logger.error(f"Error loading prebuilt index: {e}")
+            return {}
+    
+    def vectorizer_backend(self):
+        # 'tfidf' (mặc định) hoặc 'hashing': feature hashing, dựng theo shard/song song, thêm tài liệu không cần fit lại
+        return getattr(settings, 'CHATBOT_VECTORIZER_BACKEND', 'tfidf')
+    
+    def fit_vectorizer(self, texts):
+        """(vectorizer, ma trận tài liệu) theo CHATBOT_VECTORIZER_BACKEND"""
+        if self.vectorizer_backend() == 'hashing':
+            index = HashedTfidfIndex.build(texts)
+            return index, index.matrix
+        vectorizer = TfidfVectorizer(max_features=self.max_features(), ngram_range=(1, 2))
+        return vectorizer, vectorizer.fit_transform(texts)
+    
+    def max_features(self):
+        # Giới hạn vocabulary của vectorizer; với CHATBOT_RETRIEVAL_BACKEND='lsa' có thể đặt lớn hơn
+        # vì chi phí truy vấn chỉ phụ thuộc số chiều LSA
+        return getattr(settings, 'CHATBOT_TFIDF_MAX_FEATURES', 1000)
+    
+    def init_symptoms(self, prebuilt=None):
         """Khởi tạo vector cho triệu chứng"""
         try:
-            self.symptoms = list(Symptom.objects.all())
+            # Chỉ index từ điển triệu chứng chuẩn, không index các cụm rác từ crawl
+            self.symptoms = list(Symptom.objects.filter(is_canonical=True).order_by('pk'))
             
             if not self.symptoms:
                 logger.warning("No symptoms found in database")
                 return
             
+            if prebuilt and prebuilt.ids == [s.pk for s in self.symptoms]:
+                self.symptom_vectorizer = prebuilt.vectorizer
+                self.symptom_vectors = prebuilt.matrix
+                self.symptom_retriever = retrieval.build_retriever(self.symptom_vectors)
+                logger.info(f"Loaded prebuilt index for {len(self.symptoms)} symptoms")
+                return
+            
             symptom_texts = [self.preprocess_text(s.name + " " + (s.description or "")) 
                            for s in self.symptoms]
             
-            self.symptom_vectorizer = TfidfVectorizer(max_features=1000, ngram_range=(1, 2))
-            self.symptom_vectors = self.symptom_vectorizer.fit_transform(symptom_texts)
+            self.symptom_vectorizer, self.symptom_vectors = self.fit_vectorizer(symptom_texts)
+            self.symptom_retriever = retrieval.build_retriever(self.symptom_vectors)
             logger.info(f"Initialized {len(self.symptoms)} symptoms")
         except Exception as e:
             logger.error(f"Error initializing symptoms: {e}")
     
-    def init_diseases(self):
+    def init_diseases(self, prebuilt=None):
         """Khởi tạo vector cho bệnh"""
         try:
-            self.diseases = list(Disease.objects.all())
+            # Bỏ qua các bản gần trùng, chỉ index bệnh gốc
+            self.diseases = list(Disease.objects
+                                 .filter(duplicate_of__isnull=True)
+                                 .order_by('pk')
+                                 .prefetch_related('symptoms_link__symptom'))
             
             if not self.diseases:
                 logger.warning("No diseases found in database")
                 return
             
+            if prebuilt and prebuilt.ids == [d.pk for d in self.diseases]:
+                self.disease_vectorizer = prebuilt.vectorizer
+                self.disease_vectors = prebuilt.matrix
+                self.disease_retriever = retrieval.build_retriever(self.disease_vectors)
+                logger.info(f"Loaded prebuilt index for {len(self.diseases)} diseases")
+                return
+            
             disease_texts = []
             for disease in self.diseases:
                 text = disease.name + " " + disease.description
@@ -77,12 +185,174 @@ class ImprovedNLPProcessor:
                 
                 disease_texts.append(self.preprocess_text(text))
             
-            self.disease_vectorizer = TfidfVectorizer(max_features=1000, ngram_range=(1, 2))
-            self.disease_vectors = self.disease_vectorizer.fit_transform(disease_texts)
+            self.disease_vectorizer, self.disease_vectors = self.fit_vectorizer(disease_texts)
+            self.disease_retriever = retrieval.build_retriever(self.disease_vectors)
             logger.info(f"Initialized {len(self.diseases)} diseases")
         except Exception as e:
             logger.error(f"Error initializing diseases: {e}")
     
+    def init_symptom_disease_matrix(self):
+        """Ma trận thưa bệnh x triệu chứng chuẩn dùng để xếp hạng bệnh (xem rank_diseases_by_symptoms)
+        
+        Mỗi liên kết có trọng số COVERAGE_WEIGHT + (1 - COVERAGE_WEIGHT) * relevance_score / MAX_RELEVANCE.
+        Không chuẩn hóa theo hàng: chuẩn hóa L2 làm bệnh có ít triệu chứng được trích xuất luôn đứng trước.
+        Dựng từ các liên kết đã prefetch trong init_diseases, không thêm truy vấn.
+        """
+        try:
+            if not self.diseases or not self.symptoms:
+                return
+            
+            self.symptom_columns = {s.pk: i for i, s in enumerate(self.symptoms)}
+            rows, cols, weights = [], [], []
+            for row, disease in enumerate(self.diseases):
+                for link in disease.symptoms_link.all():
+                    col = self.symptom_columns.get(link.symptom_id)
+                    if col is not None:
+                        rows.append(row)
+                        cols.append(col)
+                        relevance = min(max(link.relevance_score, 1), MAX_RELEVANCE)
+                        weights.append(COVERAGE_WEIGHT + (1 - COVERAGE_WEIGHT) * relevance / MAX_RELEVANCE)
+            
+            matrix = sparse.csr_matrix((np.asarray(weights, dtype=np.float32), (rows, cols)),
+                                       shape=(len(self.diseases), len(self.symptoms)))
+            # Liên kết trùng (cùng bệnh, cùng triệu chứng) chỉ tính một lần
+            matrix.sum_duplicates()
+            self.symptom_disease_matrix = matrix
+            logger.info(f"Initialized disease x symptom matrix with {matrix.nnz} links")
+        except Exception as e:
+            logger.error(f"Error initializing disease x symptom matrix: {e}")
+    
+    def rank_diseases_by_symptoms(self, matching_symptoms, top_n=5):
+        """Xếp hạng bệnh theo các triệu chứng đã khớp: một phép nhân ma trận thưa với vector triệu chứng
+        
+        Điểm (0..1) chủ yếu là độ bao phủ: phần các triệu chứng khớp (theo độ tương đồng) mà bệnh có;
+        phần còn lại là tổng relevance_score của các triệu chứng đó. Bệnh có thêm triệu chứng khác không
+        bị trừ điểm; điểm bằng nhau giữ thứ tự của knowledge base. Trả về [(disease, score)] giảm dần.
+        """
+        if self.symptom_disease_matrix is None or not matching_symptoms:
+            return []
+        
+        query = np.zeros(len(self.symptoms), dtype=np.float32)
+        for symptom, similarity in matching_symptoms:
+            col = self.symptom_columns.get(symptom.pk)
+            if col is not None:
+                query[col] = max(query[col], similarity)
+        total = query.sum()
+        if not total:
+            return []
+        
+        scores = self.symptom_disease_matrix @ (query / total)
+        return [(self.diseases[i], score) for i, score in retrieval.top_k(scores, top_n, 0.0)]
+    
+    def init_name_index(self):
+        """Khởi tạo bảng băm tên bệnh/triệu chứng cho đường trả lời nhanh (trước tìm kiếm TF-IDF)"""
+        try:
+            self.diseases_by_id = {d.pk: d for d in self.diseases or []}
+            self.symptoms_by_id = {s.pk: s for s in self.symptoms or []}
+            
+            index = NameIndex()
+            for disease in self.diseases or []:
+                index.add(DISEASE, disease.pk, disease.name)
+            # Tên của các bản gần trùng đã gộp là bí danh của bệnh gốc
+            for name, canonical_id in (Disease.objects
+                                       .filter(duplicate_of__in=list(self.diseases_by_id))
+                                       .order_by('pk').values_list('name', 'duplicate_of')):
+                index.add(DISEASE, canonical_id, name)
+            for symptom in self.symptoms or []:
+                index.add(SYMPTOM, symptom.pk, symptom.name)
+            
+            self.name_index = index
+            logger.info(f"Initialized name index with {len(index)} keys")
+        except Exception as e:
+            logger.error(f"Error initializing name index: {e}")
+    
+    def init_suggestions(self):
+        """Khởi tạo trie gợi ý khi gõ từ tên bệnh, triệu chứng và từ điển thuật ngữ y tế
+        
+        Độ phổ biến: bệnh theo số nguồn viết về bệnh (bản gốc + các bản gần trùng đã gộp),
+        triệu chứng theo số bệnh có triệu chứng đó; thuật ngữ chỉ có trong từ điển xếp sau.
+        """
+        try:
+            trie = SuggestionTrie()
+            sources = dict(Disease.objects.filter(duplicate_of__isnull=False)
+                           .values('duplicate_of').annotate(n=Count('pk')).values_list('duplicate_of', 'n'))
+            for disease in self.diseases or []:
+                if '<' not in disease.name and '>' not in disease.name:
+                    trie.add(disease.name, 'disease', 1 + sources.get(disease.pk, 0))
+            
+            linked = dict(DiseaseSymptom.objects.values('symptom').annotate(n=Count('pk'))
+                          .values_list('symptom', 'n'))
+            for symptom in self.symptoms or []:
+                trie.add(symptom.name, 'symptom', linked.get(symptom.pk, 0))
+            
+            # Bộ phận cơ thể không phải câu hỏi hoàn chỉnh, không dùng làm gợi ý
+            terms = VietnameseMedicalProcessor().medical_terms
+            for category, kind in (('diseases', 'disease'), ('symptoms', 'symptom'),
+                                   ('treatments', 'treatment'), ('prevention', 'prevention')):
+                for term in terms[category]:
+                    trie.add(term, kind)
+            
+            self.suggestions = trie.build()
+            logger.info(f"Initialized suggestion trie with {len(trie)} entries")
+        except Exception as e:
+            logger.error(f"Error initializing suggestions: {e}")
+    
+    def suggest(self, query, limit=10):
+        """Gợi ý hoàn thành đoạn cuối của query, trả về (đoạn được thay, [{'text', 'kind'}])"""
+        if not self.suggestions:
+            return '', []
+        fragment, entries = self.suggestions.complete(query, limit)
+        return fragment, [{'text': entry['text'], 'kind': entry['kind']} for entry in entries]
+    
+    def init_spelling(self):
+        """Khởi tạo bộ sửa lỗi gõ trên từ vựng của hai vectorizer và từ điển thuật ngữ y tế"""
+        try:
+            words = []
+            for vectorizer in (self.symptom_vectorizer, self.disease_vectorizer):
+                if hasattr(vectorizer, 'get_feature_names_out'):
+                    for feature in vectorizer.get_feature_names_out():
+                        words.extend(feature.split())
+            if self.vectorizer_backend() == 'hashing':
+                # Index băm không giữ vocabulary: lấy từ trực tiếp từ tên và mô tả
+                for obj in (self.symptoms or []) + (self.diseases or []):
+                    words.extend(self.preprocess_text(obj.name + " " + (obj.description or "")).split())
+            for terms in VietnameseMedicalProcessor().medical_terms.values():
+                for term in terms:
+                    words.extend(self.preprocess_text(term).split())
+            
+            self.speller = SpellingCorrector(words)
+            logger.info(f"Initialized spelling corrector with {len(self.speller)} words")
+        except Exception as e:
+            logger.error(f"Error initializing spelling corrector: {e}")
+    
+    def correct_query(self, query):
+        """Sửa lỗi gõ trong query (trả về dạng đã preprocess) và ghi nhận số lần sửa để theo dõi"""
+        text = self.preprocess_text(query)
+        if not self.speller:
+            return text, []
+        
+        text, corrections = self.speller.correct(text)
+        if corrections:
+            metrics.incr('queries_corrected')
+            metrics.incr('tokens_corrected', len(corrections))
+            logger.info(f"Corrected query tokens: {corrections}")
+        return text, corrections
+    
+    def find_exact_matches(self, query):
+        """Bệnh và triệu chứng được gọi đúng tên trong query, trả về (symptoms, diseases) cùng dạng với
+        find_matching_symptoms/find_matching_diseases (độ tương đồng 1.0)"""
+        if not self.name_index:
+            return [], []
+        
+        symptoms = []
+        diseases = []
+        for kind, obj_id in self.name_index.scan(query):
+            if kind == DISEASE:
+                diseases.append((self.diseases_by_id[obj_id], 1.0))
+            else:
+                symptoms.append((self.symptoms_by_id[obj_id], 1.0))
+        return symptoms, diseases
+    
     def preprocess_text(self, text):
         """Tiền xử lý văn bản"""
         if not text:
@@ -103,8 +373,12 @@ class ImprovedNLPProcessor:
         
         return text
     
-    def fetch_and_update_knowledge_base(self, urls=None):
-        """Lấy dữ liệu từ URL và cập nhật knowledge base"""
+    def fetch_and_update_knowledge_base(self, urls=None, progress_callback=None, rebuild_index=True):
+        """Lấy dữ liệu từ URL và cập nhật knowledge base
+        
+        progress_callback(url, state, imported=0, error=None, bytes_fetched=0) được gọi
+        khi bắt đầu và kết thúc mỗi URL để báo tiến độ (dùng cho background job).
+        """
         if urls is None:
             urls = [
                 'https://vnvc.vn/cac-benh-truyen-nhiem-thuong-gap/',
@@ -115,109 +389,138 @@ class ImprovedNLPProcessor:
         total_diseases = 0
         
         for url in urls:
+            if progress_callback:
+                progress_callback(url, 'running')
             try:
-                logger.info(f'Fetching data from {url}...')
-                
-                # Headers để tránh bị block
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'vi-VN,vi;q=0.8,en-US;q=0.5,en;q=0.3',
-                    'Accept-Encoding': 'gzip, deflate',
-                    'Connection': 'keep-alive'
-                }
-                
-                response = requests.get(url, headers=headers, timeout=30)
-                response.raise_for_status()
-                response.encoding = 'utf-8'
-                
-                # Xử lý nội dung HTML
-                diseases_data = self.extract_from_url_improved(url, response.text)
-                
-                # Cập nhật database
-                imported_count = 0
-                for data in diseases_data:
-                    try:
-                        # Tạo hoặc cập nhật bệnh
-                        disease, created = Disease.objects.update_or_create(
-                            name=data['name'],
-                            defaults={
-                                'description': data['description'][:1000] if data['description'] else '',
-                                'causes': data.get('causes', '')[:1000],
-                                'is_contagious': data.get('is_contagious', False),
-                                'source_url': url
-                            }
-                        )
-                        
-                        # Thêm triệu chứng
-                        for symptom_name in data.get('symptoms', []):
-                            if symptom_name and len(symptom_name.strip()) > 2:
-                                symptom, _ = Symptom.objects.get_or_create(
-                                    name=symptom_name[:200],
-                                    defaults={'description': ''}
-                                )
-                                DiseaseSymptom.objects.get_or_create(
-                                    disease=disease, 
-                                    symptom=symptom
-                                )
-                        
-                        # Thêm biến chứng
-                        for complication_name in data.get('complications', []):
-                            if complication_name and len(complication_name.strip()) > 2:
-                                complication, _ = Complication.objects.get_or_create(
-                                    name=complication_name[:200],
-                                    defaults={'description': ''}
-                                )
-                                disease.complications.add(complication)
-                        
-                        # Thêm phương pháp phòng ngừa
-                        for prevention_method in data.get('preventions', []):
-                            if prevention_method and len(prevention_method.strip()) > 2:
-                                prevention, _ = Prevention.objects.get_or_create(
-                                    method=prevention_method[:200], 
-                                    defaults={'description': ''}
-                                )
-                                disease.preventions.add(prevention)
-                        
-                        # Thêm vắc-xin
-                        for vaccine_name in data.get('vaccines', []):
-                            if vaccine_name and len(vaccine_name.strip()) > 2:
-                                vaccine, _ = Vaccine.objects.get_or_create(
-                                    name=vaccine_name[:200],
-                                    defaults={'manufacturer': ''}
-                                )
-                                disease.vaccines.add(vaccine)
-                        
-                        logger.info(f"Imported {disease.name}")
-                        imported_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Error importing disease {data.get('name', 'Unknown')}: {e}")
-                
-                # Cập nhật thông tin nguồn URL
-                try:
-                    source, _ = URLSource.objects.get_or_create(url=url)
-                    source.last_updated = timezone.now()
-                    source.success_count = imported_count
-                    source.save()
-                except Exception as e:
-                    logger.error(f"Error updating URL source: {e}")
-                
+                fetch_stats = {}
+                # Một lần tăng kb_revision cho cả trang, không phải cho mỗi dòng được ghi
+                with kb_revision.batch():
+                    imported_count = self.import_from_url(url, stats=fetch_stats)
                 total_diseases += imported_count
-                logger.info(f"Successfully imported {imported_count} diseases from {url}")
+                if progress_callback:
+                    progress_callback(url, 'succeeded', imported=imported_count,
+                                      bytes_fetched=fetch_stats.get('bytes', 0))
                 
             except requests.RequestException as e:
                 logger.error(f'Error fetching URL {url}: {e}')
+                if progress_callback:
+                    progress_callback(url, 'failed', error=str(e))
             except Exception as e:
                 logger.error(f'Unexpected error processing URL {url}: {e}')
+                if progress_callback:
+                    progress_callback(url, 'failed', error=str(e))
         
         # Khởi tạo lại vectorizer và vectors sau khi cập nhật dữ liệu
-        if total_diseases > 0:
+        if total_diseases > 0 and rebuild_index:
             self.init_symptoms()
             self.init_diseases()
+            self.init_symptom_disease_matrix()
+            self.init_name_index()
+            self.init_suggestions()
+            self.init_spelling()
         
         return total_diseases
     
+    def import_from_url(self, url, stats=None):
+        """Tải một URL, trích xuất và lưu các bệnh vào database, trả về số bệnh đã nhập
+        
+        Nếu truyền dict stats, số byte đã tải được ghi vào stats['bytes'].
+        """
+        logger.info(f'Fetching data from {url}...')
+        
+        # Headers để tránh bị block
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'vi-VN,vi;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        }
+        
+        response = http_client.get_client().get(url, headers=headers)
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        if stats is not None:
+            stats['bytes'] = len(response.content)
+        page_cache.store_page(url, response.text)
+        
+        # Xử lý nội dung HTML
+        diseases_data = self.extract_from_url_improved(url, response.text)
+        
+        # Cập nhật database
+        imported_count = 0
+        vocabulary = symptom_vocabulary.get_vocabulary()
+        for data in diseases_data:
+            try:
+                # Tạo hoặc cập nhật bệnh
+                disease, created = Disease.objects.update_or_create(
+                    name=data['name'],
+                    defaults={
+                        'description': data['description'][:1000] if data['description'] else '',
+                        'causes': data.get('causes', '')[:1000],
+                        'is_contagious': data.get('is_contagious', False),
+                        'source_url': url
+                    }
+                )
+                
+                # Thêm triệu chứng (chỉ lưu triệu chứng chuẩn trong từ điển)
+                symptom_names, unmatched = vocabulary.canonicalize_all(data.get('symptoms', []))
+                for symptom_name in symptom_names:
+                    symptom = symptom_vocabulary.canonical_symptom(symptom_name)
+                    DiseaseSymptom.objects.get_or_create(
+                        disease=disease, 
+                        symptom=symptom
+                    )
+                symptom_vocabulary.observe_unmatched(unmatched, disease.pk)
+                
+                # Thêm biến chứng
+                for complication_name in data.get('complications', []):
+                    if complication_name and len(complication_name.strip()) > 2:
+                        complication, _ = Complication.objects.get_or_create(
+                            name=complication_name[:200],
+                            defaults={'description': ''}
+                        )
+                        disease.complications.add(complication)
+                
+                # Thêm phương pháp phòng ngừa
+                for prevention_method in data.get('preventions', []):
+                    if prevention_method and len(prevention_method.strip()) > 2:
+                        prevention, _ = Prevention.objects.get_or_create(
+                            method=prevention_method[:200], 
+                            defaults={'description': ''}
+                        )
+                        disease.preventions.add(prevention)
+                
+                # Thêm vắc-xin
+                for vaccine_name in data.get('vaccines', []):
+                    if vaccine_name and len(vaccine_name.strip()) > 2:
+                        vaccine, _ = Vaccine.objects.get_or_create(
+                            name=vaccine_name[:200],
+                            defaults={'manufacturer': ''}
+                        )
+                        disease.vaccines.add(vaccine)
+                
+                # Kiểm tra gần trùng với bệnh đã nhập từ nguồn khác (MinHash/LSH)
+                near_duplicates.register(disease)
+                
+                logger.info(f"Imported {disease.name}")
+                imported_count += 1
+                
+            except Exception as e:
+                logger.error(f"Error importing disease {data.get('name', 'Unknown')}: {e}")
+        
+        # Cập nhật thông tin nguồn URL
+        try:
+            source, _ = URLSource.objects.get_or_create(url=url)
+            source.last_updated = timezone.now()
+            source.success_count = imported_count
+            source.save()
+        except Exception as e:
+            logger.error(f"Error updating URL source: {e}")
+        
+        logger.info(f"Successfully imported {imported_count} diseases from {url}")
+        return imported_count
+    
     def extract_from_url_improved(self, url, html_content):
         """Phương thức trích xuất cải tiến dựa trên URL và phân tích nội dung"""
         logger.info(f"Extracting information from {url}")
@@ -703,16 +1006,15 @@ class ImprovedNLPProcessor:
     
     def find_matching_symptoms(self, query, top_n=3):
         """Tìm triệu chứng phù hợp với query"""
-        if not self.symptoms or not self.symptom_vectorizer:
+        if not self.symptoms or not self.symptom_retriever:
             return []
         
         try:
             query = self.preprocess_text(query)
             query_vector = self.symptom_vectorizer.transform([query])
-            similarities = cosine_similarity(query_vector, self.symptom_vectors).flatten()
-            
-            top_indices = np.argsort(similarities)[-top_n:][::-1]
-            top_symptoms = [(self.symptoms[i], similarities[i]) for i in top_indices if similarities[i] > 0.1]
+            # Top-k trên chỉ mục ngược (xem retrieval.py), không tính và sắp xếp điểm của mọi triệu chứng
+            top_symptoms = [(self.symptoms[i], score) for i, score in
+                            self.symptom_retriever.search(query_vector, top_n, min_score=0.1)]
             
             return top_symptoms
         except Exception as e:
@@ -721,108 +1023,174 @@ class ImprovedNLPProcessor:
     
     def find_matching_diseases(self, query, top_n=3):
         """Tìm bệnh phù hợp với query"""
-        if not self.diseases or not self.disease_vectorizer:
+        if not self.diseases or not self.disease_retriever:
             return []
         
         try:
             query = self.preprocess_text(query)
             query_vector = self.disease_vectorizer.transform([query])
-            similarities = cosine_similarity(query_vector, self.disease_vectors).flatten()
-            
-            top_indices = np.argsort(similarities)[-top_n:][::-1]
-            top_diseases = [(self.diseases[i], similarities[i]) for i in top_indices if similarities[i] > 0.1]
+            top_diseases = [(self.diseases[i], score) for i, score in
+                            self.disease_retriever.search(query_vector, top_n, min_score=0.1)]
             
             return top_diseases
         except Exception as e:
             logger.error(f"Error finding matching diseases: {e}")
             return []
     
+    def disease_card(self, disease):
+        """Các phần thông tin của một bệnh dùng để trả lời, truy vấn database một lần rồi giữ trong bộ nhớ
+        
+        Câu hỏi tiếp theo về cùng bệnh được trả lời từ cache. Processor được dựng lại khi knowledge base
+        thay đổi nên cache không bị cũ; kích thước bị chặn bởi số bệnh.
+        """
+        card = self.disease_cards.get(disease.pk)
+        if card is None:
+            card = {
+                'symptoms': [link.symptom.name for link in disease.symptoms_link.all()],
+                'complications': [c.name for c in disease.complications.all()],
+                'preventions': [p.method for p in disease.preventions.all()],
+                'vaccines': [v.name for v in disease.vaccines.all()],
+                'treatments': [t.name for t in disease.treatments.all()],
+                'causes': [disease.causes] if disease.causes else [],
+            }
+            self.disease_cards[disease.pk] = card
+        return card
+    
+    def detect_follow_up(self, text):
+        """Khía cạnh được hỏi trong text đã preprocess và câu có chỉ gồm khía cạnh + từ đệm hay không
+        
+        Trả về (aspect, bare); aspect là None nếu câu không hỏi khía cạnh nào.
+        """
+        padded = f" {text} "
+        found = None
+        for aspect, keywords in FOLLOW_UP_ASPECTS:
+            for keyword in keywords:
+                if f" {keyword} " in padded:
+                    found = found or aspect
+                    padded = padded.replace(f" {keyword} ", " ")
+        if found is None:
+            return None, False
+        return found, all(word in FOLLOW_UP_FILLER_WORDS for word in padded.split())
+    
+    def answer_follow_up(self, disease, aspect):
+        """Trả lời một khía cạnh của bệnh vừa được nhắc tới trong phiên"""
+        title = CARD_TITLES[aspect]
+        items = self.disease_card(disease)[aspect]
+        if not items:
+            return (f"Hiện tôi chưa có thông tin về {title.lower()} của **{disease.name}**. "
+                    f"Vui lòng tham khảo ý kiến bác sĩ.")
+        return f"**{disease.name}**\n\n**{title}:** {', '.join(items)}" + DISCLAIMER
+    
+    def follow_up_result(self, result, disease, aspect):
+        metrics.incr('follow_up_answers')
+        result.update(response=self.answer_follow_up(disease, aspect), diseases=[disease.pk], follow_up=True)
+        return result
+    
     def process_query(self, query):
         """Xử lý query từ người dùng"""
+        return self.answer_query(query)['response']
+    
+    def answer_query(self, query, state=None):
+        """Xử lý query trong ngữ cảnh của một phiên (SessionState, có thể None)
+        
+        Trả về dict: response, id các bệnh/triệu chứng được nhắc tới trong câu trả lời (để ghi vào ngữ cảnh
+        phiên), follow_up (câu trả lời dựa trên bệnh của câu trước) và error (response là thông báo lỗi).
+        """
+        result = {'response': None, 'diseases': [], 'symptoms': [], 'follow_up': False, 'error': False}
         try:
-            # Tìm triệu chứng phù hợp
-            matching_symptoms = self.find_matching_symptoms(query)
+            metrics.incr('queries')
+            
+            # Sửa lỗi gõ ("sot xuat huyt", "viem hongg"); query không có lỗi được dùng nguyên văn
+            corrected, corrections = self.correct_query(query)
+            if corrections:
+                query = corrected
             
-            # Tìm bệnh phù hợp
-            matching_diseases = self.find_matching_diseases(query)
+            # Đường nhanh: query gọi đúng tên bệnh/triệu chứng thì trả lời ngay, không cần tìm kiếm vector
+            matching_symptoms, matching_diseases = self.find_exact_matches(query)
+            
+            # Câu hỏi tiếp theo không nhắc tên ("còn cách phòng ngừa?"): trả lời về bệnh vừa nói tới trong phiên.
+            # Chỉ trả lời ngay khi câu không có nội dung nào khác; câu hỏi mới ("nguyên nhân đau nửa đầu")
+            # được tìm kiếm trước, chỉ dùng ngữ cảnh khi tìm kiếm không ra gì
+            follow_up = None
+            if state is not None and state.disease_ids and not matching_symptoms and not matching_diseases:
+                aspect, bare = self.detect_follow_up(corrected)
+                disease = self.diseases_by_id.get(state.disease_ids[0]) if aspect else None
+                if disease is not None:
+                    follow_up = (disease, aspect)
+                    if bare:
+                        return self.follow_up_result(result, disease, aspect)
+            
+            if not matching_symptoms and not matching_diseases:
+                # Tìm triệu chứng phù hợp
+                matching_symptoms = self.find_matching_symptoms(query)
+                
+                # Tìm bệnh phù hợp
+                matching_diseases = self.find_matching_diseases(query)
+                
+                if follow_up and not matching_symptoms and not matching_diseases:
+                    return self.follow_up_result(result, *follow_up)
+            
+            result['symptoms'] = [s.pk for s, _ in matching_symptoms]
+            result['diseases'] = [d.pk for d, _ in matching_diseases]
             
             # Nếu có cả triệu chứng và bệnh phù hợp
             if matching_symptoms and matching_diseases:
                 symptoms_text = ", ".join([s[0].name for s in matching_symptoms])
                 diseases_text = ", ".join([d[0].name for d in matching_diseases])
                 
-                return (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
-                       f"Điều này có thể liên quan đến: {diseases_text}. "
-                       f"Xin lưu ý đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ.")
+                result['response'] = (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
+                                      f"Điều này có thể liên quan đến: {diseases_text}. "
+                                      f"Xin lưu ý đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ.")
             
             # Nếu chỉ có triệu chứng phù hợp
             elif matching_symptoms:
                 symptoms_text = ", ".join([s[0].name for s in matching_symptoms])
                 
-                # Tìm các bệnh liên quan đến các triệu chứng này
-                related_diseases = set()
-                for symptom, _ in matching_symptoms:
-                    for link in symptom.diseases_link.all():
-                        related_diseases.add(link.disease)
+                # Các bệnh liên quan, xếp theo mức độ khớp với toàn bộ triệu chứng (theo relevance_score)
+                related_diseases = self.rank_diseases_by_symptoms(matching_symptoms)
                 
                 if related_diseases:
-                    diseases_text = ", ".join([d.name for d in related_diseases])
-                    return (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
-                           f"Những triệu chứng này có thể liên quan đến: {diseases_text}. "
-                           f"Xin lưu ý đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ.")
+                    result['diseases'] = [d.pk for d, _ in related_diseases]
+                    diseases_text = ", ".join([d.name for d, _ in related_diseases])
+                    result['response'] = (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
+                                          f"Những triệu chứng này có thể liên quan đến: {diseases_text}. "
+                                          f"Xin lưu ý đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ.")
                 else:
-                    return (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
-                           f"Tôi không có đủ thông tin để xác định bệnh cụ thể. "
-                           f"Vui lòng mô tả chi tiết hơn hoặc tham khảo ý kiến bác sĩ.")
+                    result['response'] = (f"Tôi nhận thấy bạn có thể đang mô tả các triệu chứng: {symptoms_text}. "
+                                          f"Tôi không có đủ thông tin để xác định bệnh cụ thể. "
+                                          f"Vui lòng mô tả chi tiết hơn hoặc tham khảo ý kiến bác sĩ.")
             
             # Nếu chỉ có bệnh phù hợp
             elif matching_diseases:
                 disease = matching_diseases[0][0]  # Lấy bệnh phù hợp nhất
+                card = self.disease_card(disease)
                 
                 # Tạo câu trả lời chi tiết về bệnh
                 response = f"**{disease.name}**\n\n{disease.description}"
                 
-                # Thêm thông tin về triệu chứng
-                symptom_links = disease.symptoms_link.all()
-                if symptom_links:
-                    symptoms_text = ", ".join([link.symptom.name for link in symptom_links])
-                    response += f"\n\n**Triệu chứng thường gặp:** {symptoms_text}"
-                
-                # Thêm thông tin về biến chứng
-                complications = disease.complications.all()
-                if complications:
-                    complications_text = ", ".join([c.name for c in complications])
-                    response += f"\n\n**Biến chứng có thể xảy ra:** {complications_text}"
-                
-                # Thêm thông tin về cách phòng ngừa
-                preventions = disease.preventions.all()
-                if preventions:
-                    preventions_text = ", ".join([p.method for p in preventions])
-                    response += f"\n\n**Cách phòng ngừa:** {preventions_text}"
-                
-                # Thêm thông tin về vắc-xin nếu có
-                vaccines = disease.vaccines.all()
-                if vaccines:
-                    vaccines_text = ", ".join([v.name for v in vaccines])
-                    response += f"\n\n**Vắc-xin phòng bệnh:** {vaccines_text}"
+                # Triệu chứng, biến chứng, cách phòng ngừa, vắc-xin (phần nào có dữ liệu)
+                for aspect in ('symptoms', 'complications', 'preventions', 'vaccines'):
+                    if card[aspect]:
+                        response += f"\n\n**{CARD_TITLES[aspect]}:** {', '.join(card[aspect])}"
                 
                 # Thêm thông tin về nguồn
                 if disease.source_url:
                     response += f"\n\n**Nguồn tham khảo:** {disease.source_url}"
                 
-                response += "\n\n⚠️ **Lưu ý:** Đây chỉ là thông tin tham khảo, vui lòng tham khảo ý kiến bác sĩ."
-                
-                return response
+                result['response'] = response + DISCLAIMER
             
             # Nếu không có kết quả phù hợp
             else:
-                return ("Tôi không có đủ thông tin để xử lý yêu cầu của bạn. "
-                       "Vui lòng mô tả chi tiết hơn về triệu chứng hoặc bệnh bạn đang tìm hiểu. "
-                       "Bạn cũng có thể hỏi về:\n"
-                       "- Các triệu chứng cụ thể (ví dụ: sốt, ho, đau đầu)\n"
-                       "- Tên bệnh cụ thể\n"
-                       "- Cách phòng ngừa bệnh")
+                result['response'] = ("Tôi không có đủ thông tin để xử lý yêu cầu của bạn. "
+                                      "Vui lòng mô tả chi tiết hơn về triệu chứng hoặc bệnh bạn đang tìm hiểu. "
+                                      "Bạn cũng có thể hỏi về:\n"
+                                      "- Các triệu chứng cụ thể (ví dụ: sốt, ho, đau đầu)\n"
+                                      "- Tên bệnh cụ thể\n"
+                                      "- Cách phòng ngừa bệnh")
+            return result
             
         except Exception as e:
             logger.error(f"Error processing query: {e}")
-            return "Xin lỗi, đã xảy ra lỗi khi xử lý yêu cầu của bạn. Vui lòng thử lại."
\ No newline at end of file
+            result.update(diseases=[], symptoms=[], error=True)
+            result['response'] = "Xin lỗi, đã xảy ra lỗi khi xử lý yêu cầu của bạn. Vui lòng thử lại."
+            return result
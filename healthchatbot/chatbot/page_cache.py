@@ -0,0 +1,37 @@
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Alias cache dùng chung giữa các process (settings.CACHES['pages'], mặc định FileBasedCache)
+CACHE_ALIAS = 'pages'
+
+# Trang lớn hơn mức này không được cache (tránh đầy cache vì vài trang khổng lồ)
+MAX_CACHED_PAGE_CHARS = 2 * 1024 * 1024
+
+
+def cache_key(url):
+    return 'chatbot:page:' + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def store_page(url, html):
+    """Lưu HTML đã tải (bởi crawler/importer) để các bước sau như chấm điểm chất lượng dùng lại
+
+    Cache 'pages' là backend dùng chung (file trên đĩa) nên trang do crawler/importer lưu được các process
+    khác (score_sources, pool chấm điểm) đọc lại; có thể thay bằng redis/memcached trong CACHES.
+    """
+    if not html or len(html) > MAX_CACHED_PAGE_CHARS:
+        return
+    caches[CACHE_ALIAS].set(cache_key(url), html, getattr(settings, 'CHATBOT_PAGE_CACHE_TTL', 3600))
+
+
+def get_page(url):
+    return caches[CACHE_ALIAS].get(cache_key(url))
+
+
+def get_pages(urls):
+    """Lấy nhiều trang trong một lần gọi cache, trả về dict url -> html cho các trang có trong cache"""
+    keys = {cache_key(url): url for url in urls}
+    return {keys[key]: html for key, html in caches[CACHE_ALIAS].get_many(list(keys)).items()}
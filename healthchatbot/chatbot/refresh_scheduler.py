@@ -0,0 +1,223 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from .knowledge_jobs import start_job, run_job, default_worker_name
+from .models import URLSource
+
+logger = logging.getLogger(__name__)
+
+
+class BandwidthBudget:
+    """Token bucket theo byte để giới hạn băng thông trung bình của các lần refresh"""
+
+    def __init__(self, bytes_per_second, burst_seconds=60):
+        self.rate = bytes_per_second
+        self.capacity = bytes_per_second * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Số giây cần chờ trước khi được phép tải tiếp (0 nếu còn budget)"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            self._refill()
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def consume(self, nbytes):
+        # Kích thước chỉ biết sau khi tải xong nên cho phép "nợ" (tokens âm)
+        if not self.rate:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens -= nbytes
+
+
+class RefreshScheduler:
+    """Lập lịch refresh các nguồn theo thời điểm đến hạn, với giới hạn đồng thời và băng thông"""
+
+    def __init__(self, manager, max_concurrency=2, bandwidth_bytes_per_second=0,
+                 base_backoff=timedelta(minutes=15), max_backoff=timedelta(days=1),
+                 reload_interval=300, worker_name=None):
+        self.manager = manager
+        self.processor = manager.nlp_processor
+        self.max_concurrency = max_concurrency
+        self.bandwidth = BandwidthBudget(bandwidth_bytes_per_second)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.reload_interval = reload_interval
+        self.worker_name = worker_name or f"scheduler@{default_worker_name()}"
+
+        self.heap = []  # (due_timestamp, rank, source_id, url)
+        self.ranks = {}
+        self.in_flight = {}  # future -> (source_id, url)
+        self.last_reload = 0.0
+        self.deferred_until = 0.0
+        self.stop_event = threading.Event()
+        self.stats = {'dispatched': 0, 'succeeded': 0, 'failed': 0, 'bytes': 0}
+
+    def next_due_at(self, source, now):
+        """Thời điểm đến hạn: theo update_frequency sau lần thành công, hoặc backoff sau lỗi"""
+        if source.failure_count and source.last_failure_at:
+            backoff = min(self.base_backoff * (2 ** (source.failure_count - 1)), self.max_backoff)
+            # Jitter cố định theo nguồn để các nguồn lỗi cùng lúc không retry đồng loạt
+            jitter = random.Random(source.pk * 31 + source.failure_count).uniform(0.9, 1.1)
+            return source.last_failure_at + backoff * jitter
+
+        if source.last_updated is None or source.changed_since_update:
+            return now
+
+        return source.last_updated + self.manager.update_interval_for(source.trusted_source)
+
+    def load_queue(self):
+        """Dựng lại hàng đợi ưu tiên từ database theo thứ tự của prioritize_sources_for_update"""
+        now = timezone.now()
+        in_flight_ids = {source_id for source_id, _ in self.in_flight.values()}
+
+        heap = []
+        ranks = {}
+        for rank, source in enumerate(self.manager.prioritize_sources_for_update()):
+            ranks[source.pk] = rank
+            if source.pk in in_flight_ids:
+                continue
+            due = self.next_due_at(source, now)
+            heap.append((due.timestamp(), rank, source.pk, source.url))
+
+        heapq.heapify(heap)
+        self.heap = heap
+        self.ranks = ranks
+        self.last_reload = time.monotonic()
+
+        due_now = sum(1 for entry in heap if entry[0] <= now.timestamp())
+        logger.info(f"Scheduler loaded {len(heap)} active sources ({due_now} due now)")
+
+    def dispatch_due(self, executor):
+        now_ts = time.time()
+
+        while self.heap and len(self.in_flight) < self.max_concurrency:
+            due_ts, rank, source_id, url = self.heap[0]
+            if due_ts > now_ts:
+                break
+
+            wait_time = self.bandwidth.wait_time()
+            if wait_time > 0:
+                if time.monotonic() >= self.deferred_until:
+                    logger.info(f"Bandwidth budget exhausted, deferring {url} for {wait_time:.1f}s")
+                self.deferred_until = time.monotonic() + wait_time
+                break
+
+            heapq.heappop(self.heap)
+            logger.info(f"Dispatching refresh of {url} (rank {rank}, overdue {now_ts - due_ts:.0f}s)")
+            future = executor.submit(self.refresh_source, source_id, url)
+            self.in_flight[future] = (source_id, url)
+            self.stats['dispatched'] += 1
+
+    def refresh_source(self, source_id, url):
+        """Chạy trong thread của pool: refresh một nguồn như một job và ghi lại kết quả"""
+        try:
+            job = start_job([url], self.worker_name)
+            job = run_job(job, processor=self.processor)
+
+            entry = job.progress.get(url, {})
+            succeeded = entry.get('state') == 'succeeded'
+            bytes_fetched = entry.get('bytes_fetched', 0)
+            self.bandwidth.consume(bytes_fetched)
+
+            if succeeded:
+                URLSource.objects.filter(pk=source_id).update(failure_count=0, last_failure_at=None)
+            else:
+                URLSource.objects.filter(pk=source_id).update(
+                    failure_count=F('failure_count') + 1,
+                    last_failure_at=timezone.now()
+                )
+
+            return succeeded, bytes_fetched, entry.get('error')
+        finally:
+            connections.close_all()
+
+    def collect(self, timeout):
+        """Chờ các refresh đang chạy, đưa nguồn trở lại hàng đợi với thời điểm đến hạn mới"""
+        if not self.in_flight:
+            self.stop_event.wait(timeout)
+            return
+
+        done, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        now = timezone.now()
+
+        for future in done:
+            source_id, url = self.in_flight.pop(future)
+            try:
+                succeeded, bytes_fetched, error = future.result()
+            except Exception as e:
+                succeeded, bytes_fetched, error = False, 0, str(e)
+                logger.error(f"Refresh of {url} crashed: {e}", exc_info=True)
+
+            self.stats['succeeded' if succeeded else 'failed'] += 1
+            self.stats['bytes'] += bytes_fetched
+
+            source = URLSource.objects.select_related('trusted_source').filter(pk=source_id, active=True).first()
+            if source is None:
+                logger.info(f"Source {url} removed or deactivated, dropping from schedule")
+                continue
+
+            due = self.next_due_at(source, now)
+            heapq.heappush(self.heap, (due.timestamp(), self.ranks.get(source_id, 0), source_id, url))
+
+            if succeeded:
+                logger.info(f"Refreshed {url} ({bytes_fetched} bytes), next due {due:%Y-%m-%d %H:%M}")
+            else:
+                logger.warning(f"Refresh of {url} failed ({source.failure_count} consecutive: {error}), "
+                               f"backing off until {due:%Y-%m-%d %H:%M}")
+
+    def sleep_time(self, poll_interval):
+        wait_for = poll_interval
+        if self.heap:
+            wait_for = min(wait_for, max(0.0, self.heap[0][0] - time.time()))
+        if self.deferred_until:
+            wait_for = max(wait_for, self.deferred_until - time.monotonic())
+        return max(wait_for, 0.5)
+
+    def has_due(self):
+        return bool(self.heap) and self.heap[0][0] <= time.time()
+
+    def run(self, once=False, poll_interval=30):
+        """Vòng lặp chính; với once=True chỉ chạy các nguồn đang đến hạn rồi thoát"""
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='source-refresh')
+        self.load_queue()
+
+        try:
+            while not self.stop_event.is_set():
+                if not once and time.monotonic() - self.last_reload >= self.reload_interval:
+                    self.load_queue()
+
+                self.dispatch_due(executor)
+
+                if once and not self.in_flight and not self.has_due():
+                    break
+
+                self.collect(self.sleep_time(poll_interval))
+        finally:
+            while self.in_flight:
+                self.collect(poll_interval)
+            executor.shutdown(wait=True)
+
+        logger.info(f"Scheduler stopped: {self.stats}")
+        return self.stats
+
+    def stop(self):
+        self.stop_event.set()
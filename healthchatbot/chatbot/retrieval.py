@@ -0,0 +1,178 @@
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+
+# Backend mặc định cho tìm kiếm top-k (CHATBOT_RETRIEVAL_BACKEND): 'maxscore', 'bruteforce' hoặc 'lsa'
+DEFAULT_BACKEND = 'maxscore'
+
+# Số chiều của không gian LSA (CHATBOT_LSA_DIMENSIONS)
+DEFAULT_LSA_DIMENSIONS = 128
+
+
+def top_k(scores, k, min_score):
+    """(vị trí, điểm) của k điểm cao nhất > min_score, giảm dần, điểm bằng nhau theo vị trí tăng dần;
+    chỉ sắp xếp các phần tử từ điểm thứ k trở lên"""
+    if len(scores) > k:
+        top = np.flatnonzero(scores >= np.partition(scores, -k)[-k])
+    else:
+        top = np.arange(len(scores))
+    top = top[np.lexsort((top, -scores[top]))][:k]
+    return [(int(i), float(scores[i])) for i in top if scores[i] > min_score]
+
+
+class BruteForceRetriever:
+    """Tính cosine với mọi tài liệu rồi lấy top-k (O(N) mỗi truy vấn), dùng làm chuẩn để đối chiếu"""
+
+    def __init__(self, matrix):
+        # Hàng của matrix đã chuẩn hóa L2 (TfidfVectorizer mặc định), cosine = tích vô hướng
+        self.matrix = sparse.csr_matrix(matrix)
+
+    @property
+    def nbytes(self):
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def search(self, query_vector, k=3, min_score=0.0):
+        scores = (self.matrix @ query_vector.T).toarray().ravel()
+        return top_k(scores, k, min_score)
+
+
+class MaxScoreRetriever:
+    """Top-k trên chỉ mục ngược (postings theo term) với cắt tỉa MaxScore
+
+    Mỗi term có postings (id tài liệu tăng dần, trọng số) và impact lớn nhất, nên đóng góp tối đa của term
+    vào điểm một tài liệu là q_t * max_impact_t. Các term của truy vấn được duyệt theo đóng góp tối đa
+    giảm dần, cộng dồn điểm. Khi tổng đóng góp tối đa của các term còn lại không còn đủ để một tài liệu
+    chưa gặp vượt ngưỡng (điểm thứ k hiện tại, hoặc min_score), chỉ các ứng viên đã gặp còn được xét:
+    postings dài của các term phổ biến (idf thấp) không bị quét, chỉ tra trọng số của vài ứng viên.
+    Kết quả trùng với BruteForceRetriever (sai khác do làm tròn số thực).
+    """
+
+    def __init__(self, matrix):
+        self.matrix = sparse.csc_matrix(matrix, dtype=np.float64)
+        self.matrix.sort_indices()
+        self.size = self.matrix.shape[0]
+        indptr = self.matrix.indptr
+        data = self.matrix.data
+        self.max_impact = np.zeros(self.matrix.shape[1])
+        nonempty = np.diff(indptr) > 0
+        self.max_impact[nonempty] = np.maximum.reduceat(data, indptr[:-1][nonempty])
+
+    @property
+    def nbytes(self):
+        return (self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+                + self.max_impact.nbytes)
+
+    def postings(self, term):
+        start, end = self.matrix.indptr[term], self.matrix.indptr[term + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def search(self, query_vector, k=3, min_score=0.0):
+        query_vector = sparse.csr_matrix(query_vector)
+        terms = query_vector.indices
+        weights = query_vector.data
+        bounds = weights * self.max_impact[terms]
+        order = np.argsort(-bounds, kind='stable')
+        terms, weights, bounds = terms[order], weights[order], bounds[order]
+
+        scores = np.zeros(self.size)
+        remaining = float(bounds.sum())
+        seen = []
+        candidates = None
+        threshold = min_score
+
+        for term, weight, bound in zip(terms, weights, bounds):
+            if bound <= 0:
+                break
+            # Không để sai số làm tròn đưa về số âm, nếu không tài liệu đang đứng thứ k có thể tự loại chính nó
+            remaining = max(remaining - bound, 0.0)
+            docs, impacts = self.postings(term)
+
+            if candidates is None:
+                # Còn có thể có tài liệu mới lọt vào top-k: quét toàn bộ postings
+                scores[docs] += weight * impacts
+                seen.append(docs)
+                if len(docs) >= k:
+                    # Điểm hiện tại chỉ tăng thêm: điểm thứ k của bất kỳ k tài liệu nào là cận dưới của ngưỡng
+                    threshold = max(threshold, float(np.partition(scores[docs], -k)[-k]))
+                if remaining > threshold:
+                    continue
+                candidates = np.unique(np.concatenate(seen))
+            else:
+                # Chỉ tra trọng số của term cho các ứng viên (postings đã sắp xếp theo id tài liệu)
+                positions = np.searchsorted(docs, candidates)
+                positions[positions == len(docs)] = 0
+                found = docs[positions] == candidates
+                scores[candidates[found]] += weight * impacts[positions[found]]
+
+            # Điểm thứ k trong các ứng viên là cận dưới của điểm thứ k cuối cùng
+            candidate_scores = scores[candidates]
+            if len(candidates) >= k:
+                threshold = max(threshold, float(np.partition(candidate_scores, -k)[-k]))
+            candidates = candidates[candidate_scores + remaining >= threshold]
+            if remaining <= 0:
+                break
+
+        if candidates is None:
+            candidates = np.unique(np.concatenate(seen)) if seen else np.zeros(0, dtype=np.int32)
+        results = top_k(scores[candidates], k, min_score)
+        return [(int(candidates[i]), score) for i, score in results]
+
+
+class LsaRetriever:
+    """Tìm kiếm trong không gian LSA: TF-IDF được chiếu bằng TruncatedSVD xuống vài trăm chiều
+
+    Tài liệu thành ma trận dày float32 (N x d, hàng chuẩn hóa L2); điểm của mọi tài liệu là một phép nhân
+    ma trận-vector (BLAS), nhiều truy vấn cùng lúc là một phép nhân ma trận. Kích thước không phụ thuộc
+    số term, nên vocabulary của vectorizer có thể lớn hơn mà truy vấn không chậm đi. Điểm là cosine
+    trong không gian đã chiếu, gần đúng so với cosine TF-IDF.
+    """
+
+    def __init__(self, matrix, dimensions=None):
+        dimensions = dimensions or getattr(settings, 'CHATBOT_LSA_DIMENSIONS', DEFAULT_LSA_DIMENSIONS)
+        # TruncatedSVD cần số chiều nhỏ hơn cả số tài liệu và số term
+        self.dimensions = max(1, min(dimensions, min(matrix.shape) - 1))
+        svd = TruncatedSVD(n_components=self.dimensions, random_state=0)
+        self.vectors = self.normalize(svd.fit_transform(matrix))
+        # Chỉ giữ phép chiếu float32; không giữ mô hình SVD (components_ float64 chiếm gấp đôi bộ nhớ)
+        self.components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes + self.components.nbytes
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return np.ascontiguousarray(vectors / norms)
+
+    def project(self, query_matrix):
+        """Chiếu các truy vấn TF-IDF (sparse, q x V) sang không gian LSA"""
+        return self.normalize(sparse.csr_matrix(query_matrix, dtype=np.float32) @ self.components)
+
+    def search(self, query_vector, k=3, min_score=0.0):
+        scores = self.vectors @ self.project(query_vector)[0]
+        return top_k(scores, k, min_score)
+
+    def search_batch(self, query_matrix, k=3, min_score=0.0):
+        """Top-k cho nhiều truy vấn (mỗi hàng một truy vấn) bằng một phép nhân ma trận"""
+        scores = self.project(query_matrix) @ self.vectors.T
+        return [top_k(row, k, min_score) for row in scores]
+
+
+BACKENDS = {
+    'maxscore': MaxScoreRetriever,
+    'bruteforce': BruteForceRetriever,
+    'lsa': LsaRetriever,
+}
+
+
+def build_retriever(matrix, backend=None):
+    """Retriever cho ma trận tài liệu x term theo CHATBOT_RETRIEVAL_BACKEND"""
+    backend = backend or getattr(settings, 'CHATBOT_RETRIEVAL_BACKEND', DEFAULT_BACKEND)
+    if backend == 'lsa' and min(matrix.shape) < 2:
+        # Quá ít tài liệu để phân tích SVD
+        backend = 'bruteforce'
+    return BACKENDS[backend](matrix)
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .models import ChatMessage
+
+# Số bệnh/triệu chứng gần nhất giữ cho mỗi phiên (giới hạn kích thước mỗi mục trong store)
+MAX_RECENT = 5
+
+# Số tin nhắn người dùng gần nhất dùng để dựng lại ngữ cảnh khi phiên không có trong store
+REHYDRATE_MESSAGES = 10
+
+# Khoảng tối thiểu (giây) giữa hai lần cập nhật ChatSession.updated_at của một phiên đang có trong store
+TOUCH_INTERVAL = 60
+
+
+class SessionState:
+    """Ngữ cảnh hội thoại của một phiên: pk của ChatSession và các bệnh/triệu chứng vừa được nhắc tới"""
+
+    __slots__ = ('session_id', 'session_pk', 'disease_ids', 'symptom_ids', 'touched_at', 'expires_at')
+
+    def __init__(self, session_id, session_pk, disease_ids=(), symptom_ids=()):
+        self.session_id = session_id
+        self.session_pk = session_pk
+        self.disease_ids = list(disease_ids)[:MAX_RECENT]
+        self.symptom_ids = list(symptom_ids)[:MAX_RECENT]
+        self.touched_at = time.monotonic()
+        self.expires_at = 0.0
+
+    def remember(self, disease_ids=(), symptom_ids=()):
+        """Ghi nhận kết quả của một câu trả lời; câu không khớp gì giữ nguyên ngữ cảnh cũ để hỏi tiếp"""
+        if disease_ids:
+            self.disease_ids = list(disease_ids)[:MAX_RECENT]
+        if symptom_ids:
+            self.symptom_ids = list(symptom_ids)[:MAX_RECENT]
+
+
+class SessionStore:
+    """Store LRU có TTL cho ngữ cảnh phiên, riêng mỗi worker
+
+    Tra cứu không cần database. Bộ nhớ bị chặn: tối đa max_sessions mục, mỗi mục kích thước cố định
+    (MAX_RECENT id); mục lâu nhất không dùng bị loại khi đầy, mục quá ttl giây bị bỏ khi được tra.
+    TTL phải ngắn hơn nhiều so với thời gian lưu giữ phiên (archive_chat_sessions) để pk không trỏ
+    vào một phiên đã bị chuyển sang lưu trữ.
+    """
+
+    def __init__(self, max_sessions=None, ttl=None):
+        self.max_sessions = max_sessions or getattr(settings, 'CHATBOT_SESSION_CACHE_SIZE', 10000)
+        self.ttl = ttl or getattr(settings, 'CHATBOT_SESSION_TTL', 1800)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is None or state.expires_at < now:
+                if state is not None:
+                    del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            state.expires_at = now + self.ttl
+            return state
+
+    def put(self, state):
+        with self._lock:
+            state.expires_at = time.monotonic() + self.ttl
+            self._entries[state.session_id] = state
+            self._entries.move_to_end(state.session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
+
+
+def rehydrate(session, processor):
+    """Dựng lại ngữ cảnh của một phiên không có trong store từ các tin nhắn người dùng gần nhất
+
+    Chỉ dùng tra tên chính xác (không tìm kiếm vector); tin nhắn mới nhất có nhắc tới bệnh/triệu chứng thắng.
+    """
+    state = SessionState(session.session_id, session.pk)
+    if processor is None:
+        return state
+
+    messages = (ChatMessage.objects.filter(session=session, sender='user')
+                .order_by('-timestamp', '-pk').values_list('message', flat=True)[:REHYDRATE_MESSAGES])
+    for message in messages:
+        symptoms, diseases = processor.find_exact_matches(message)
+        if not state.disease_ids and diseases:
+            state.disease_ids = [disease.pk for disease, _ in diseases][:MAX_RECENT]
+        if not state.symptom_ids and symptoms:
+            state.symptom_ids = [symptom.pk for symptom, _ in symptoms][:MAX_RECENT]
+        if state.disease_ids and state.symptom_ids:
+            break
+    return state
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Mỗi worker (process) giữ một processor dùng chung thay vì dựng lại TF-IDF cho mỗi request.
+# Khi knowledge base thay đổi (kb_revision tăng, do bất kỳ process nào), processor mới được dựng
+# ở thread nền rồi hoán đổi nguyên tử.
+_lock = threading.Lock()
+_processor = None
+_loaded_stamp = None
+_last_check = 0.0
+_rebuilding = False
+
+# Số hiệu mới nhất đã thấy và thời điểm nó xuất hiện: chỉ dựng lại khi số hiệu đứng yên đủ lâu
+_seen_stamp = None
+_seen_since = 0.0
+_stale_since = None
+
+
+def _processor_class():
+    try:
+        from .nlp_processor import ImprovedNLPProcessor
+        return ImprovedNLPProcessor
+    except ImportError:
+        # Fallback to original processor if new one not available
+        try:
+            from .nlp_processor import NLPProcessor
+            return NLPProcessor
+        except ImportError as e:
+            logger.error(f"NLP Processor not available: {e}")
+            return None
+
+
+def _current_stamp():
+    # Số hiệu knowledge base dùng chung giữa các process (tăng khi có bất kỳ thay đổi nào)
+    from .kb_revision import current
+    return current()
+
+
+def _snapshot_stamp(stamp):
+    """Profile 'split': làm mới snapshot đọc (nếu đến hạn) và trả về phiên bản dữ liệu có trong snapshot,
+    index được dựng từ chính snapshot đó để index và truy vấn chat luôn nhìn cùng một phiên bản"""
+    if storage.read_database() is not None:
+        snapshot_stamp = storage.refresh_read_snapshot()
+        if snapshot_stamp is not None:
+            return snapshot_stamp
+    return stamp
+
+
+def _build(processor_class):
+    with storage.chat_reads():
+        return processor_class()
+
+
+def get_processor():
+    """Trả về processor dùng chung của worker, dựng lần đầu nếu cần"""
+    global _processor, _loaded_stamp, _last_check
+
+    if _processor is None:
+        with _lock:
+            if _processor is None:
+                processor_class = _processor_class()
+                if processor_class is None:
+                    return None
+                try:
+                    stamp = _current_stamp()
+                except Exception as e:
+                    logger.error(f"Error reading knowledge base stamp: {e}")
+                    stamp = None
+                _loaded_stamp = _snapshot_stamp(stamp)
+                _processor = _build(processor_class)
+                _last_check = time.monotonic()
+                logger.info("Shared NLP processor initialized")
+        return _processor
+
+    refresh_if_stale()
+    return _processor
+
+
+def refresh_if_stale():
+    """Kiểm tra (có giới hạn tần suất) xem knowledge base đã đổi chưa và dựng lại index ở nền"""
+    global _last_check, _rebuilding, _seen_stamp, _seen_since, _stale_since
+
+    interval = getattr(settings, 'CHATBOT_INDEX_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    if now - _last_check < interval or _rebuilding:
+        return False
+
+    _last_check = now
+    try:
+        stamp = _current_stamp()
+    except Exception as e:
+        logger.error(f"Error reading knowledge base stamp: {e}")
+        return False
+
+    if stamp == _loaded_stamp:
+        _stale_since = None
+        return False
+
+    # Trong lúc crawl dài số hiệu tăng liên tục: chờ nó đứng yên CHATBOT_INDEX_QUIET_PERIOD giây rồi mới
+    # dựng lại, nhưng không để index cũ quá CHATBOT_INDEX_MAX_STALENESS giây
+    if stamp != _seen_stamp:
+        _seen_stamp = stamp
+        _seen_since = now
+    if _stale_since is None:
+        _stale_since = now
+    quiet = now - _seen_since >= getattr(settings, 'CHATBOT_INDEX_QUIET_PERIOD', 30)
+    overdue = now - _stale_since >= getattr(settings, 'CHATBOT_INDEX_MAX_STALENESS', 600)
+    if not quiet and not overdue:
+        return False
+
+    with _lock:
+        if _rebuilding:
+            return False
+        _rebuilding = True
+
+    thread = threading.Thread(target=_rebuild, args=(stamp,), name='nlp-index-rebuild', daemon=True)
+    thread.start()
+    return True
+
+
+def _rebuild(stamp):
+    global _processor, _loaded_stamp, _rebuilding
+
+    try:
+        processor_class = _processor_class()
+        if processor_class is None:
+            return
+        started = time.monotonic()
+        stamp = _snapshot_stamp(stamp)
+        if stamp == _loaded_stamp:
+            # Snapshot đọc chưa được làm mới (giới hạn tần suất), index hiện tại vẫn khớp với nó
+            return
+        new_processor = _build(processor_class)
+        with _lock:
+            _processor = new_processor
+            _loaded_stamp = stamp
+        logger.info(f"Swapped NLP index (stamp {stamp}) in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Error rebuilding NLP index: {e}")
+    finally:
+        _rebuilding = False
+        connections.close_all()
+
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import (Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine,
+                     ChatSession, ChatMessage, URLSource)
+from . import kb_revision, stats_snapshot
+
+COUNTED_MODELS = {
+    Disease: 'total_diseases',
+    Symptom: 'total_symptoms',
+    ChatSession: 'total_sessions',
+    ChatMessage: 'total_messages',
+    URLSource: 'total_sources',
+}
+
+
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        stats_snapshot.adjust(COUNTED_MODELS[sender], 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    stats_snapshot.adjust(COUNTED_MODELS[sender], -1)
+
+
+for model in COUNTED_MODELS:
+    post_save.connect(count_created, sender=model, dispatch_uid=f'stats_created_{model.__name__}')
+    post_delete.connect(count_deleted, sender=model, dispatch_uid=f'stats_deleted_{model.__name__}')
+
+
+@receiver(post_init, sender=URLSource)
+def remember_source_active(sender, instance, **kwargs):
+    # Giữ trạng thái active lúc load để biết khi nào bộ đếm active_sources cần thay đổi
+    # (trường bị defer thì không đọc, tránh phát sinh truy vấn)
+    if 'active' not in instance.get_deferred_fields():
+        instance._stats_active = instance.active
+
+
+@receiver(post_save, sender=URLSource)
+def count_active_sources(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_stats_active', None)
+    if created:
+        stats_snapshot.adjust('active_sources', 1 if instance.active else 0)
+    elif previous is not None:
+        stats_snapshot.adjust('active_sources', int(instance.active) - int(previous))
+    instance._stats_active = instance.active
+
+
+@receiver(post_delete, sender=URLSource)
+def count_deleted_active_source(sender, instance, **kwargs):
+    if getattr(instance, '_stats_active', None):
+        stats_snapshot.adjust('active_sources', -1)
+
+
+# Mọi thay đổi nội dung knowledge base (import, admin, lệnh quản trị) làm tăng số hiệu, một lần cho mỗi
+# transaction/batch (không phải mỗi dòng); các worker khác thấy số hiệu mới sẽ dựng lại index ở nền
+# (xem shared_processor)
+KNOWLEDGE_MODELS = [Disease, Symptom, DiseaseSymptom, Complication, Treatment, Prevention, Vaccine]
+KNOWLEDGE_RELATIONS = [Complication.diseases.through, Treatment.diseases.through,
+                       Prevention.diseases.through, Vaccine.diseases.through]
+
+
+def knowledge_changed(sender, using=None, **kwargs):
+    kb_revision.changed(using or 'default')
+
+
+def knowledge_relation_changed(sender, action, using=None, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        kb_revision.changed(using or 'default')
+
+
+for model in KNOWLEDGE_MODELS:
+    post_save.connect(knowledge_changed, sender=model, dispatch_uid=f'kb_revision_saved_{model.__name__}')
+    post_delete.connect(knowledge_changed, sender=model, dispatch_uid=f'kb_revision_deleted_{model.__name__}')
+
+for through in KNOWLEDGE_RELATIONS:
+    m2m_changed.connect(knowledge_relation_changed, sender=through,
+                        dispatch_uid=f'kb_revision_relation_{through.__name__}')
@@ -0,0 +1,234 @@
+import gzip
+import io
+import logging
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from xml.etree.ElementTree import iterparse, ParseError
+import requests
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import URLSource, TrustedSource
+from .knowledge_jobs import enqueue_knowledge_update
+from .http_client import get_client
+from .source_discovery import normalize_url, create_sources
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_lastmod(value):
+    """Đọc <lastmod> (định dạng W3C: ngày hoặc ngày giờ), trả về datetime có timezone hoặc None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.combine(day, dt_time.min)
+    except ValueError:
+        return None
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def local_name(tag):
+    # Bỏ namespace: {http://www.sitemaps.org/schemas/sitemap/0.9}loc -> loc
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_sitemap_entries(stream):
+    """Duyệt sitemap từng phần tử một (iterparse), trả về (kind, loc, lastmod)
+
+    kind là 'url' (trang) hoặc 'sitemap' (sitemap con trong sitemapindex).
+    Phần tử đã xử lý được clear ngay nên bộ nhớ không tăng theo kích thước file.
+    """
+    root = None
+    for event, elem in iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = elem
+            continue
+        if event != 'end':
+            continue
+
+        kind = local_name(elem.tag)
+        if kind not in ('url', 'sitemap'):
+            continue
+
+        loc = lastmod = None
+        for child in elem:
+            name = local_name(child.tag)
+            if name == 'loc':
+                loc = (child.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = parse_lastmod(child.text)
+
+        elem.clear()
+        root.clear()
+
+        if loc:
+            yield kind, loc, lastmod
+
+
+def sitemaps_from_robots(site_url, client=None):
+    """Lấy danh sách sitemap khai báo trong robots.txt của site (mặc định /sitemap.xml)"""
+    client = client or get_client()
+    parsed = urlparse(site_url)
+    robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+    sitemaps = []
+    try:
+        response = client.get(robots_url)
+        if response.status_code < 400:
+            parser = RobotFileParser()
+            parser.parse(response.text.splitlines())
+            sitemaps = parser.site_maps() or []
+    except requests.RequestException as e:
+        logger.info(f"Could not fetch robots.txt for {site_url}: {e}")
+
+    return sitemaps or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+
+
+class SitemapIngester:
+    """Đọc sitemap (kể cả .xml.gz và sitemapindex) theo luồng và ghi URL y tế vào URLSource theo lô"""
+
+    def __init__(self, is_valid_url, batch_size=500, max_urls=None, max_sitemaps=200,
+                 since=None, enqueue=False, timeout=120, client=None):
+        self.is_valid_url = is_valid_url
+        self.batch_size = batch_size
+        self.max_urls = max_urls
+        self.max_sitemaps = max_sitemaps
+        self.since = since
+        self.enqueue = enqueue
+        self.timeout = timeout
+
+        self.client = client or get_client()
+
+        self.trusted_by_domain = {source.domain: source for source in TrustedSource.objects.all()}
+        self.batch = {}  # url -> lastmod
+        self.stats = {
+            'sitemaps': 0,
+            'entries': 0,
+            'skipped_invalid': 0,
+            'skipped_old': 0,
+            'created': 0,
+            'changed': 0,
+            'unchanged': 0,
+            'jobs': 0,
+        }
+
+    def open_stream(self, response):
+        """Stream đọc được nội dung sitemap; tự giải nén nếu file là gzip"""
+        response.raw.decode_content = True  # Content-Encoding: gzip do server nén khi truyền
+        response.raw.auto_close = False  # Để BufferedReader đọc tới EOF mà không lỗi "closed file"
+        stream = io.BufferedReader(response.raw)
+        if stream.peek(2)[:2] == GZIP_MAGIC:  # Bản thân file là .xml.gz
+            return gzip.GzipFile(fileobj=stream)
+        return stream
+
+    def ingest(self, sitemap_urls):
+        """Xử lý các sitemap (duyệt sitemapindex theo chiều rộng), trả về thống kê"""
+        pending = list(sitemap_urls)
+        visited = set()
+
+        while pending and self.stats['sitemaps'] < self.max_sitemaps and not self.limit_reached():
+            sitemap_url = pending.pop(0)
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+
+            try:
+                pending.extend(self.ingest_one(sitemap_url))
+            except (requests.RequestException, ParseError, OSError, EOFError) as e:
+                logger.error(f"Error reading sitemap {sitemap_url}: {e}")
+
+        self.flush()
+        logger.info(f"Sitemap ingestion finished: {self.stats}")
+        return self.stats
+
+    def ingest_one(self, sitemap_url):
+        """Đọc một sitemap; trả về các sitemap con cần đọc tiếp"""
+        children = []
+        self.stats['sitemaps'] += 1
+        logger.info(f"Reading sitemap {sitemap_url}")
+
+        with self.client.get(sitemap_url, total_timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+
+            for kind, loc, lastmod in iter_sitemap_entries(self.open_stream(response)):
+                if kind == 'sitemap':
+                    # Sitemap con không đổi từ lần chạy trước thì bỏ qua cả file
+                    if self.since and lastmod and lastmod <= self.since:
+                        continue
+                    children.append(loc)
+                    continue
+
+                self.add(loc, lastmod)
+                if self.limit_reached():
+                    break
+
+        return children
+
+    def limit_reached(self):
+        return self.max_urls is not None and self.stats['entries'] >= self.max_urls
+
+    def add(self, loc, lastmod):
+        self.stats['entries'] += 1
+
+        if self.since and lastmod and lastmod <= self.since:
+            self.stats['skipped_old'] += 1
+            return
+
+        url = normalize_url(loc)
+        if not url or not self.is_valid_url(url):
+            self.stats['skipped_invalid'] += 1
+            return
+
+        previous = self.batch.get(url)
+        if url not in self.batch or (lastmod and (previous is None or lastmod > previous)):
+            self.batch[url] = lastmod
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Ghi một lô: tạo nguồn mới, cập nhật sitemap_lastmod cho trang đã thay đổi"""
+        if not self.batch:
+            return
+
+        batch, self.batch = self.batch, {}
+        existing = {
+            source.url: source
+            for source in URLSource.objects.filter(url__in=batch).only('id', 'url', 'last_updated', 'sitemap_lastmod')
+        }
+
+        new_urls = [url for url in batch if url not in existing]
+        changed = []
+        for url, source in existing.items():
+            lastmod = batch[url]
+            if lastmod is None or (source.sitemap_lastmod and lastmod <= source.sitemap_lastmod):
+                self.stats['unchanged'] += 1
+                continue
+            source.sitemap_lastmod = lastmod
+            changed.append(source)
+
+        with transaction.atomic():
+            created = create_sources(new_urls, self.trusted_by_domain,
+                                     {url: {'sitemap_lastmod': batch[url]} for url in new_urls})
+            URLSource.objects.bulk_update(changed, ['sitemap_lastmod'])
+
+        # Chỉ trang đã cập nhật trước lastmod mới cần crawl lại
+        to_refresh = [source.url for source in changed if source.changed_since_update]
+        self.stats['created'] += created
+        self.stats['changed'] += len(to_refresh)
+        self.stats['unchanged'] += len(changed) - len(to_refresh)
+
+        if self.enqueue and (new_urls or to_refresh):
+            enqueue_knowledge_update(new_urls + to_refresh)
+            self.stats['jobs'] += 1
@@ -0,0 +1,257 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+import requests
+from bs4 import BeautifulSoup
+from django.db import transaction
+from .models import URLSource, TrustedSource
+from .trusted_sources import normalize_domain, match_domain
+from .http_client import USER_AGENT, get_client
+from . import page_cache, stats_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Từ khóa y tế trong href hoặc nội dung link
+HEALTH_LINK_KEYWORDS = ['benh', 'suc-khoe', 'y-te', 'dieu-tri', 'phong-ngua', 'vaccine']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url, base_url=None):
+    """Chuẩn hóa URL để khử trùng lặp: bỏ fragment, query, port mặc định và dấu / cuối"""
+    if base_url:
+        url = urljoin(base_url, url)
+
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return None
+
+    host = parsed.hostname.lower().rstrip('.')
+    if parsed.port and parsed.port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parsed.port}"
+
+    path = parsed.path or '/'
+    while '//' in path:
+        path = path.replace('//', '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    return urlunparse((scheme, host, path, '', '', ''))
+
+
+class RobotsCache:
+    """Cache robots.txt theo host; mỗi host chỉ tải một lần trong thời gian ttl"""
+
+    def __init__(self, client, user_agent=USER_AGENT, ttl=3600, timeout=10):
+        self.client = client
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.timeout = timeout
+        self.parsers = {}  # host -> (fetched_at, parser or None)
+        self.lock = threading.Lock()
+        self.host_locks = {}
+
+    def _host_lock(self, host):
+        with self.lock:
+            return self.host_locks.setdefault(host, threading.Lock())
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+
+        with self._host_lock(host):
+            cached = self.parsers.get(host)
+            if cached is None or time.monotonic() - cached[0] > self.ttl:
+                cached = (time.monotonic(), self._fetch(host))
+                self.parsers[host] = cached
+
+        parser = cached[1]
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def _fetch(self, host):
+        parser = RobotFileParser()
+        try:
+            response = self.client.get(f"{host}/robots.txt", total_timeout=self.timeout, retries=0)
+        except requests.RequestException as e:
+            logger.info(f"Could not fetch robots.txt for {host}: {e}")
+            return None
+
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            return None
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+
+class DiscoveryFrontier:
+    """Khám phá nguồn y tế theo chiều rộng với hàng đợi theo host, ngân sách độ sâu/số trang và tải song song"""
+
+    def __init__(self, is_valid_url, max_depth=2, max_pages=200, max_pages_per_host=100,
+                 max_discovered=5000, max_workers=8, respect_robots=True, timeout=15,
+                 max_page_bytes=2 * 1024 * 1024, client=None):
+        self.is_valid_url = is_valid_url
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_pages_per_host = max_pages_per_host
+        self.max_discovered = max_discovered
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_page_bytes = max_page_bytes
+
+        self.client = client or get_client()
+        self.robots = RobotsCache(self.client, timeout=timeout) if respect_robots else None
+
+        self.seen = set()
+        self.host_queues = {}  # host -> deque[(url, depth)]
+        self.pages_per_host = {}
+        self.allowed_hosts = set()
+        self.discovered = {}  # url -> info
+        self.pages_fetched = 0
+
+    def enqueue(self, url, depth):
+        host = urlparse(url).netloc
+        self.host_queues.setdefault(host, deque()).append((url, depth))
+
+    def crawl(self, seed_urls):
+        """Chạy khám phá từ các URL gốc, trả về danh sách nguồn đã tìm thấy"""
+        for seed in seed_urls:
+            url = normalize_url(seed)
+            if url and url not in self.seen:
+                self.seen.add(url)
+                self.allowed_hosts.add(urlparse(url).netloc)
+                self.enqueue(url, 0)
+
+        in_flight = {}  # future -> (host, url, depth)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='discovery') as executor:
+            while True:
+                busy_hosts = {host for host, _, _ in in_flight.values()}
+                # Mỗi host tối đa một request đang chạy để lịch sự với server
+                for host, queue in self.host_queues.items():
+                    if len(in_flight) >= self.max_workers or self.pages_fetched >= self.max_pages:
+                        break
+                    if host in busy_hosts or not queue:
+                        continue
+                    if self.pages_per_host.get(host, 0) >= self.max_pages_per_host:
+                        queue.clear()
+                        continue
+
+                    url, depth = queue.popleft()
+                    self.pages_fetched += 1
+                    self.pages_per_host[host] = self.pages_per_host.get(host, 0) + 1
+                    in_flight[executor.submit(self.fetch_links, url)] = (host, url, depth)
+                    busy_hosts.add(host)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    host, url, depth = in_flight.pop(future)
+                    try:
+                        links = future.result()
+                    except Exception as e:
+                        logger.error(f"Error discovering sources from {url}: {e}")
+                        continue
+                    self.process_links(url, depth, links)
+
+        logger.info(f"Discovery finished: {self.pages_fetched} pages fetched, "
+                    f"{len(self.discovered)} sources discovered across {len(self.host_queues)} hosts")
+        return list(self.discovered.values())
+
+    def fetch_links(self, url):
+        """Chạy trong thread: tải trang (có kiểm tra robots.txt) và trả về các link (href, text)"""
+        if self.robots and not self.robots.allowed(url):
+            logger.info(f"Skipping {url} (disallowed by robots.txt)")
+            return []
+
+        with self.client.get(url, total_timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return []
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_page_bytes:
+                    break
+            # Chỉ dùng charset khi server khai báo rõ, còn lại để BeautifulSoup tự nhận dạng
+            content_type = response.headers.get('Content-Type', '')
+            encoding = response.encoding if 'charset' in content_type.lower() else None
+
+        body = b''.join(chunks)
+        soup = BeautifulSoup(body, 'html.parser', from_encoding=encoding)
+        page_cache.store_page(url, body.decode(soup.original_encoding or 'utf-8', errors='replace'))
+        return [(link['href'], link.get_text().strip()) for link in soup.find_all('a', href=True)]
+
+    def process_links(self, page_url, depth, links):
+        source_domain = urlparse(page_url).netloc
+
+        for href, text in links:
+            # Kiểm tra xem link có liên quan đến y tế không
+            text_lower = text.lower()
+            if not any(keyword in href.lower() or keyword in text_lower for keyword in HEALTH_LINK_KEYWORDS):
+                continue
+
+            url = normalize_url(href, page_url)
+            if not url or url in self.seen:
+                continue
+            self.seen.add(url)
+
+            if not self.is_valid_url(url):
+                continue
+
+            if len(self.discovered) < self.max_discovered:
+                self.discovered[url] = {
+                    'url': url,
+                    'title': text,
+                    'source_domain': source_domain,
+                    'depth': depth + 1
+                }
+
+            host = urlparse(url).netloc
+            if depth + 1 <= self.max_depth and host in self.allowed_hosts:
+                self.enqueue(url, depth + 1)
+
+
+def create_sources(urls, trusted_by_domain=None, extra_fields=None):
+    """bulk_create các URLSource mới (đã gán domain/trusted_source) và cập nhật bộ đếm thống kê"""
+    if trusted_by_domain is None:
+        trusted_by_domain = {source.domain: source for source in TrustedSource.objects.all()}
+    extra_fields = extra_fields or {}
+
+    new_sources = []
+    for url in urls:
+        domain = normalize_domain(url)
+        new_sources.append(URLSource(url=url, domain=domain, trusted_source=match_domain(domain, trusted_by_domain),
+                                     **extra_fields.get(url, {})))
+
+    with transaction.atomic():
+        URLSource.objects.bulk_create(new_sources, ignore_conflicts=True)
+        # bulk_create không gửi signal nên tự cập nhật bộ đếm thống kê
+        stats_snapshot.adjust('total_sources', len(new_sources))
+        stats_snapshot.adjust('active_sources', len(new_sources))
+    return len(new_sources)
+
+
+def save_discovered_sources(discovered, batch_size=500):
+    """Upsert các nguồn đã khám phá vào URLSource theo lô, trả về số nguồn mới"""
+    trusted_by_domain = {source.domain: source for source in TrustedSource.objects.all()}
+    urls = [item['url'] for item in discovered]
+    created = 0
+
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        existing = set(URLSource.objects.filter(url__in=batch).values_list('url', flat=True))
+        created += create_sources([url for url in batch if url not in existing], trusted_by_domain)
+
+    logger.info(f"Saved {created} new sources out of {len(urls)} discovered")
+    return created
@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.utils import timezone
+from .models import URLSource
+from .vietnamese_medical_processor import VietnameseMedicalProcessor
+from .http_client import get_client
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+AUTHOR_INDICATORS = ['tác giả', 'bác sĩ', 'bs.', 'ths.', 'pgs.', 'gs.']
+DATE_PATTERN = re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{4}|\d{4}[/-]\d{1,2}[/-]\d{1,2}')
+INVISIBLE_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'head']
+
+# Dưới số trang này chấm điểm ngay trong tiến trình hiện tại (khởi động process pool tốn hơn)
+MIN_PAGES_FOR_PROCESS_POOL = 4
+
+_medical_processor = None
+
+
+def get_medical_processor():
+    # Mỗi tiến trình (kể cả worker của process pool) tạo một lần
+    global _medical_processor
+    if _medical_processor is None:
+        _medical_processor = VietnameseMedicalProcessor()
+    return _medical_processor
+
+
+def reliability_from_score(quality_score):
+    if quality_score >= 70:
+        return 'high'
+    elif quality_score >= 40:
+        return 'medium'
+    return 'low'
+
+
+def score_page(html):
+    """Chấm điểm chất lượng một trang dựa trên văn bản hiển thị (không phải markup)
+
+    Hàm thuần, không dùng database, để chạy được trong process pool.
+    """
+    quality_score = 0
+    issues = []
+    recommendations = []
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(INVISIBLE_TAGS):
+        tag.decompose()
+
+    has_headings = soup.find(['h1', 'h2']) is not None
+    has_lists = soup.find(['ul', 'ol']) is not None
+    text = soup.get_text(' ', strip=True)
+    text_lower = text.lower()
+
+    # Kiểm tra độ dài nội dung
+    if len(text) < 1000:
+        issues.append("Nội dung quá ngắn")
+        quality_score -= 20
+    else:
+        quality_score += 10
+
+    # Kiểm tra có phải nội dung y tế không
+    medical_entities = get_medical_processor().extract_medical_entities(text_lower)
+    total_entities = sum(len(entities) for entities in medical_entities.values())
+
+    if total_entities > 10:
+        quality_score += 30
+        recommendations.append("Nguồn chứa nhiều thông tin y tế hữu ích")
+    elif total_entities > 5:
+        quality_score += 15
+    else:
+        quality_score -= 10
+        issues.append("Ít thông tin y tế")
+
+    # Kiểm tra cấu trúc HTML
+    if has_headings:
+        quality_score += 10
+    if has_lists:
+        quality_score += 10
+
+    # Kiểm tra có thông tin tác giả/nguồn không
+    if any(indicator in text_lower for indicator in AUTHOR_INDICATORS):
+        quality_score += 15
+        recommendations.append("Có thông tin về tác giả/chuyên gia")
+
+    # Kiểm tra ngày cập nhật
+    if DATE_PATTERN.search(text):
+        quality_score += 10
+        recommendations.append("Có thông tin về ngày đăng/cập nhật")
+
+    # Xác định mức độ tin cậy
+    reliability = reliability_from_score(quality_score)
+    if reliability == 'low':
+        issues.append("Chất lượng nội dung cần cải thiện")
+
+    return {
+        'quality_score': quality_score,
+        'reliability': reliability,
+        'issues': issues,
+        'recommendations': recommendations,
+        'medical_entities_count': total_entities
+    }
+
+
+def error_result(error):
+    return {
+        'quality_score': 0,
+        'reliability': 'unknown',
+        'issues': [f"Lỗi khi đánh giá: {error}"],
+        'recommendations': [],
+        'medical_entities_count': 0
+    }
+
+
+def fetch_page(url, client=None):
+    response = (client or get_client()).get(url)
+    response.raise_for_status()
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        # requests mặc định ISO-8859-1 khi server không khai báo charset; các trang y tế tiếng Việt dùng UTF-8
+        response.encoding = 'utf-8'
+    page_cache.store_page(url, response.text)
+    return response.text
+
+
+def fetch_pages(urls, max_workers=8, client=None):
+    """Lấy HTML cho các URL: ưu tiên cache của crawler, chỉ tải các trang chưa có"""
+    pages = page_cache.get_pages(urls)
+    errors = {}
+    missing = [url for url in urls if url not in pages]
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quality-fetch') as executor:
+            futures = {url: executor.submit(fetch_page, url, client) for url in missing}
+            for url, future in futures.items():
+                try:
+                    pages[url] = future.result()
+                except Exception as e:
+                    errors[url] = str(e)
+
+    logger.info(f"Quality scoring: {len(urls) - len(missing)} pages from cache, "
+                f"{len(missing) - len(errors)} fetched, {len(errors)} failed")
+    return pages, errors
+
+
+def score_pages(pages, max_workers=None):
+    """Chấm điểm nhiều trang song song bằng process pool, trả về dict url -> kết quả"""
+    urls = list(pages)
+    max_workers = max_workers or getattr(settings, 'CHATBOT_QUALITY_WORKERS', None) or os.cpu_count() or 1
+
+    if len(urls) < MIN_PAGES_FOR_PROCESS_POOL or max_workers <= 1:
+        scores = [score_page(pages[url]) for url in urls]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            scores = list(executor.map(score_page, (pages[url] for url in urls),
+                                       chunksize=max(1, len(urls) // (max_workers * 4))))
+
+    return dict(zip(urls, scores))
+
+
+def save_scores(results):
+    """Ghi điểm chất lượng vào các URLSource tương ứng (một lần bulk_update)"""
+    now = timezone.now()
+    sources = list(URLSource.objects.filter(url__in=list(results)).only('id', 'url'))
+    for source in sources:
+        result = results[source.url]
+        source.quality_score = result['quality_score']
+        source.quality_reliability = result['reliability']
+        source.quality_checked_at = now
+
+    URLSource.objects.bulk_update(sources, ['quality_score', 'quality_reliability', 'quality_checked_at'],
+                                  batch_size=500)
+    return len(sources)
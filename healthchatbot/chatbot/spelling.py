@@ -0,0 +1,129 @@
+from collections import Counter
+
+# Khoảng cách sửa tối đa theo độ dài từ: từ ngắn chỉ sửa 1 lỗi, từ rất ngắn không sửa
+# (tránh "toi" -> "tai", "bi" -> "ho" ...)
+MIN_CORRECTABLE_LENGTH = 4
+LONG_WORD_LENGTH = 5
+MAX_EDIT_DISTANCE = 2
+
+# Số từ đã sửa được nhớ lại (lỗi gõ lặp lại nhiều giữa các người dùng)
+CACHE_SIZE = 10000
+
+# Từ thường gặp trong câu hỏi (đã bỏ dấu) có thể không nằm trong từ vựng của vectorizer;
+# thiếu chúng, các từ này sẽ bị "sửa" sang một từ y khoa gần giống
+COMMON_QUERY_WORDS = (
+    'toi', 'minh', 'con', 'chau', 'nguoi', 'benh', 'trieu', 'chung', 'dau', 'hieu', 'cach', 'phong',
+    'ngua', 'dieu', 'nguyen', 'nhan', 'thuoc', 'uong', 'khong', 'nhung', 'thang', 'tuan', 'ngay', 'muon',
+    'biet', 'hoi', 'tuong', 'lieu', 'nhieu', 'bao', 'nhu', 'nao', 'sao', 'lam', 'the', 'khi', 'nen',
+)
+
+
+def max_distance(word):
+    if len(word) < MIN_CORRECTABLE_LENGTH:
+        return 0
+    return 1 if len(word) < LONG_WORD_LENGTH else MAX_EDIT_DISTANCE
+
+
+def deletes(word, distance):
+    """Tất cả các dạng xóa tối đa `distance` ký tự của word (kể cả chính nó)"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - result
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b, limit):
+    """Khoảng cách Damerau-Levenshtein (hoán vị kề nhau tính 1 lỗi); trả về limit + 1 khi vượt limit"""
+    # Bỏ phần đầu và phần cuối chung: lỗi gõ thường chỉ ở một chỗ, bảng quy hoạch động còn rất nhỏ
+    while a and b and a[0] == b[0]:
+        a, b = a[1:], b[1:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return len(a) or len(b)
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            value = previous[j - 1] + (a[i - 1] != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SpellingCorrector:
+    """Sửa lỗi gõ theo kiểu SymSpell trên từ vựng đã bỏ dấu
+
+    Khi dựng: mỗi từ trong từ vựng sinh các dạng xóa 1-2 ký tự, lưu dạng xóa -> [từ]. Khi sửa: sinh các
+    dạng xóa của từ cần sửa và tra bảng băm, chỉ tính khoảng cách chỉnh sửa với vài ứng viên tìm được,
+    nên mỗi từ chỉ tốn vài chục micro giây (từ đã gặp: tra cache), không phụ thuộc kích thước từ vựng.
+    """
+
+    def __init__(self, words):
+        # words: iterable các từ (đã qua preprocess_text), từ xuất hiện nhiều lần có tần suất cao hơn
+        self.frequency = Counter(w for w in words if w.isalpha())
+        self.frequency.update(w for w in COMMON_QUERY_WORDS if w not in self.frequency)
+        self.index = {}
+        self._cache = {}
+        for word in self.frequency:
+            for variant in deletes(word, MAX_EDIT_DISTANCE):
+                self.index.setdefault(variant, []).append(word)
+
+    def __len__(self):
+        return len(self.frequency)
+
+    def correct_word(self, word):
+        """Từ gần nhất trong từ vựng (ít lỗi nhất, rồi phổ biến nhất), hoặc None nếu không cần/không thể sửa"""
+        limit = max_distance(word)
+        if not limit or word in self.frequency or not word.isalpha():
+            return None
+        if word in self._cache:
+            return self._cache[word]
+
+        candidates = set()
+        for variant in deletes(word, limit):
+            candidates.update(self.index.get(variant, ()))
+
+        best = None
+        best_key = (limit + 1,)
+        for candidate in candidates:
+            # Chỉ tính khoảng cách khi ứng viên còn có thể tốt hơn kết quả hiện tại
+            if abs(len(candidate) - len(word)) > best_key[0]:
+                continue
+            distance = edit_distance(word, candidate, best_key[0])
+            key = (distance, -self.frequency[candidate], candidate)
+            if key < best_key:
+                best, best_key = candidate, key
+
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[word] = best
+        return best
+
+    def correct(self, text):
+        """Sửa từng từ của text đã preprocess; trả về (text đã sửa, [(từ gốc, từ sửa)])"""
+        words = text.split()
+        corrections = []
+        for i, word in enumerate(words):
+            fixed = self.correct_word(word)
+            if fixed:
+                corrections.append((word, fixed))
+                words[i] = fixed
+        return ' '.join(words), corrections
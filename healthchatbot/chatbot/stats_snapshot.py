@@ -0,0 +1,58 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Disease, Symptom, ChatSession, ChatMessage, URLSource, StatsCounter
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'chatbot:stats_snapshot'
+
+# Tên bộ đếm -> truy vấn dùng để đối soát (reconcile)
+COUNTER_QUERIES = {
+    'total_diseases': lambda: Disease.objects.count(),
+    'total_symptoms': lambda: Symptom.objects.count(),
+    'total_sessions': lambda: ChatSession.objects.count(),
+    'total_messages': lambda: ChatMessage.objects.count(),
+    'total_sources': lambda: URLSource.objects.count(),
+    'active_sources': lambda: URLSource.objects.filter(active=True).count(),
+}
+
+
+def adjust(name, delta):
+    """Cộng/trừ một bộ đếm (nguyên tử trong database); bỏ qua nếu bộ đếm chưa được khởi tạo"""
+    if not delta:
+        return
+    StatsCounter.objects.filter(name=name).update(value=F('value') + delta, updated_at=timezone.now())
+
+
+def get_stats():
+    """Snapshot thống kê: đọc cache, nếu hết hạn thì đọc bảng bộ đếm (kích thước cố định)"""
+    stats = cache.get(CACHE_KEY)
+    if stats is not None:
+        return stats
+
+    values = dict(StatsCounter.objects.filter(name__in=COUNTER_QUERIES).values_list('name', 'value'))
+    if len(values) < len(COUNTER_QUERIES):
+        # Lần đầu chạy (hoặc bộ đếm bị xóa): khởi tạo bằng COUNT(*)
+        stats = reconcile()
+    else:
+        stats = {name: values[name] for name in COUNTER_QUERIES}
+
+    cache.set(CACHE_KEY, stats, getattr(settings, 'CHATBOT_STATS_CACHE_TTL', 5))
+    return stats
+
+
+def reconcile():
+    """Đếm lại toàn bộ và ghi đè các bộ đếm (sửa sai lệch do bulk update/delete bỏ qua signal)"""
+    stats = {}
+    with transaction.atomic():
+        for name, query in COUNTER_QUERIES.items():
+            stats[name] = query()
+            StatsCounter.objects.update_or_create(name=name, defaults={'value': stats[name]})
+
+    cache.delete(CACHE_KEY)
+    logger.info(f"Reconciled stats counters: {stats}")
+    return stats
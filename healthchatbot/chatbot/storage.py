@@ -0,0 +1,127 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Alias database chỉ đọc cho đường chat (bản sao snapshot SQLite hoặc replica), xem profile 'split' trong settings
+READ_ALIAS = 'chat_read'
+
+# Các bảng knowledge base mà câu trả lời chat đọc tới; bảng chat (session, message) luôn ở primary
+KNOWLEDGE_TABLES = {
+    'disease', 'symptom', 'diseasesymptom', 'complication', 'treatment', 'prevention', 'vaccine',
+    'complication_diseases', 'treatment_diseases', 'prevention_diseases', 'vaccine_diseases',
+}
+
+_chat_reads = ContextVar('chatbot_chat_reads', default=False)
+_refresh_lock = threading.Lock()
+
+
+def read_database():
+    return settings.DATABASES.get(READ_ALIAS)
+
+
+def is_sqlite(database):
+    return database['ENGINE'] == 'django.db.backends.sqlite3'
+
+
+def read_snapshot_available():
+    """Có alias đọc và (với SQLite) file snapshot đã được tạo"""
+    database = read_database()
+    if database is None:
+        return False
+    return not is_sqlite(database) or os.path.exists(database['NAME'])
+
+
+@contextmanager
+def chat_reads():
+    """Trong khối này, truy vấn đọc knowledge base được chuyển sang alias đọc (nếu có cấu hình)
+
+    Ingestion vẫn ghi vào primary; chat không phải chờ khóa ghi của một lần crawl dài.
+    """
+    token = _chat_reads.set(read_snapshot_available())
+    try:
+        yield
+    finally:
+        _chat_reads.reset(token)
+
+
+class ChatReadRouter:
+    """Router: đọc knowledge base trong chat_reads() -> READ_ALIAS, mọi thứ khác -> default"""
+
+    def db_for_read(self, model, **hints):
+        if _chat_reads.get() and model._meta.app_label == 'chatbot' and model._meta.model_name in KNOWLEDGE_TABLES:
+            return READ_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Cùng một dữ liệu (snapshot là bản sao của default)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ALIAS
+
+
+def snapshot_revision(path):
+    """kb_revision chứa trong file snapshot (được sao chép cùng dữ liệu), None nếu chưa có snapshot"""
+    if not os.path.exists(path):
+        return None
+    from .kb_revision import REVISION_COUNTER
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=5)
+        try:
+            row = conn.execute('SELECT value FROM chatbot_statscounter WHERE name = ?', (REVISION_COUNTER,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+    except sqlite3.Error:
+        return None
+
+
+def refresh_read_snapshot(force=False):
+    """Sao chép primary sang file snapshot đọc bằng SQLite backup API khi kb_revision đã đổi
+
+    Giới hạn tối đa một lần mỗi CHATBOT_READ_SNAPSHOT_INTERVAL giây (theo mtime của file, dùng chung
+    giữa các process) để một lần recrawl không gây sao chép liên tục. Trả về kb_revision có trong
+    snapshot, hoặc None nếu không dùng snapshot SQLite.
+    """
+    database = read_database()
+    if database is None or not is_sqlite(database):
+        return None
+
+    from .kb_revision import current
+    primary = str(settings.DATABASES['default']['NAME'])
+    path = str(database['NAME'])
+    interval = getattr(settings, 'CHATBOT_READ_SNAPSHOT_INTERVAL', 30)
+
+    with _refresh_lock:
+        revision = snapshot_revision(path)
+        if not force and revision is not None:
+            if revision == current():
+                return revision
+            if time.time() - os.path.getmtime(path) < interval:
+                return revision
+
+        started = time.monotonic()
+        source = sqlite3.connect(primary, timeout=30)
+        target = sqlite3.connect(path, timeout=30)
+        try:
+            # Một bước duy nhất: bản sao nhất quán tại một thời điểm, reader đang mở sẽ thấy dữ liệu mới
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        os.utime(path)
+
+        revision = snapshot_revision(path)
+        logger.info(f"Refreshed read snapshot {path} at kb revision {revision} "
+                    f"in {time.monotonic() - started:.2f}s")
+        return revision
@@ -0,0 +1,268 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from unidecode import unidecode
+from .models import Symptom, SymptomCandidate
+from .vietnamese_medical_processor import VietnameseMedicalProcessor
+from . import kb_revision
+
+logger = logging.getLogger(__name__)
+
+# Bổ sung cho danh sách triệu chứng của VietnameseMedicalProcessor (các cách gọi hay gặp trên trang y tế)
+EXTRA_SYMPTOMS = [
+    'sốt cao', 'sốt nhẹ', 'ớn lạnh', 'ho khan', 'ho có đờm', 'ho ra máu', 'sổ mũi', 'đau mỏi người',
+    'nôn mửa', 'chán ăn', 'sụt cân', 'vàng da', 'xuất huyết', 'nổi hạch', 'phát ban đỏ', 'mụn nước',
+    'đau mắt', 'đỏ mắt', 'khó nuốt', 'tiêu chảy ra máu', 'đau tai', 'khó ngủ', 'đổ mồ hôi', 'đau cơ thể',
+    'đau nhức', 'đau nhức cơ thể', 'thiếu máu', 'rụng tóc', 'nước tiểu sẫm màu',
+]
+
+# Từ đơn dễ nằm trong cụm không phải triệu chứng ("chủ yếu", "lẫn nhau"): chỉ khớp khi cả cụm đúng bằng từ đó
+AMBIGUOUS_SINGLE_WORDS = {'yếu', 'lẫn', 'run'}
+
+MAX_TERM_WORDS = 6
+
+_vocabulary = None
+_vocabulary_loaded = 0.0
+_lock = threading.Lock()
+
+
+def curated_symptoms():
+    terms = VietnameseMedicalProcessor().medical_terms['symptoms'] + EXTRA_SYMPTOMS
+    return list(dict.fromkeys(terms))
+
+
+def normalize_words(text):
+    """Chữ thường, chuẩn Unicode NFC (giữ dấu tiếng Việt), bỏ dấu câu và số"""
+    text = unicodedata.normalize('NFC', (text or '').lower())
+    return re.sub(r'[^\w\s]|\d|_', ' ', text).split()
+
+
+def normalize(text):
+    return ' '.join(normalize_words(text))
+
+
+def fold(text):
+    """Dạng không dấu, dùng cho tra cứu mờ (người viết thiếu dấu, gõ sai)"""
+    return unidecode(text)
+
+
+def edit_distance(a, b, max_distance):
+    """Khoảng cách Levenshtein, dừng sớm khi chắc chắn vượt max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """Cây BK theo khoảng cách Levenshtein: tra cứu mờ chỉ duyệt một phần nhỏ của từ điển"""
+
+    def __init__(self):
+        self.root = None  # (word, {distance: child})
+        self.size = 0
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0], len(word) + len(node[0]))
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Trả về [(distance, word)] trong phạm vi max_distance, gần nhất trước"""
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word, max_distance)
+            if distance <= max_distance:
+                results.append((distance, node_word))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results)
+
+
+def fuzzy_tolerance(text):
+    if len(text) < 5:
+        return 0
+    if len(text) < 12:
+        return 1
+    return 2
+
+
+class SymptomVocabulary:
+    """Từ điển triệu chứng chuẩn: khớp chính xác theo cụm từ dài nhất, không được thì tra mờ bằng BK-tree"""
+
+    def __init__(self, terms):
+        self.terms = {}   # dạng chuẩn hóa (có dấu) -> tên hiển thị
+        self.folded = {}  # dạng không dấu -> tên hiển thị
+        self.tree = BKTree()
+        self.max_words = 1
+
+        for term in terms:
+            key = normalize(term)
+            if not key or key in self.terms:
+                continue
+            self.terms[key] = term
+            self.max_words = max(self.max_words, min(len(key.split()), MAX_TERM_WORDS))
+            folded = fold(key)
+            self.folded.setdefault(folded, term)
+            self.tree.add(folded)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def lookup(self, phrase):
+        """Tên chuẩn của đúng cụm này (chính xác hoặc gần đúng), None nếu không có"""
+        key = normalize(phrase)
+        if key in self.terms:
+            return self.terms[key]
+
+        folded = fold(key)
+        if folded in self.folded:
+            return self.folded[folded]
+
+        tolerance = fuzzy_tolerance(folded)
+        if tolerance and len(key.split()) <= self.max_words + 1:
+            matches = self.tree.search(folded, tolerance)
+            if matches:
+                return self.folded[matches[0][1]]
+        return None
+
+    def canonicalize(self, phrase):
+        """Các triệu chứng chuẩn có trong một cụm trích xuất (ví dụ 'sốt cao kéo dài, đau đầu')"""
+        words = normalize_words(phrase)
+        if not words:
+            return []
+
+        whole = self.lookup(phrase)
+        if whole:
+            return [whole]
+
+        found = []
+        i = 0
+        while i < len(words):
+            # Khớp cụm dài nhất bắt đầu tại vị trí i
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                key = ' '.join(words[i:i + size])
+                if size == 1 and key in AMBIGUOUS_SINGLE_WORDS:
+                    continue
+                term = self.terms.get(key)
+                if term:
+                    found.append(term)
+                    i += size
+                    break
+            else:
+                i += 1
+        return list(dict.fromkeys(found))
+
+    def canonicalize_all(self, phrases):
+        """Chuẩn hóa danh sách cụm, trả về (triệu chứng chuẩn, các cụm không khớp)"""
+        canonical = []
+        unmatched = []
+        for phrase in phrases:
+            terms = self.canonicalize(phrase)
+            if terms:
+                canonical.extend(terms)
+            elif phrase and phrase.strip():
+                unmatched.append(phrase.strip())
+        return list(dict.fromkeys(canonical)), unmatched
+
+
+def get_vocabulary():
+    """Từ điển dùng chung trong tiến trình (curated + Symptom chuẩn trong database), tải lại định kỳ"""
+    global _vocabulary, _vocabulary_loaded
+    ttl = getattr(settings, 'CHATBOT_SYMPTOM_VOCABULARY_TTL', 300)
+
+    with _lock:
+        if _vocabulary is None or time.monotonic() - _vocabulary_loaded > ttl:
+            learned = Symptom.objects.filter(is_canonical=True).values_list('name', flat=True)
+            _vocabulary = SymptomVocabulary(curated_symptoms() + list(learned))
+            _vocabulary_loaded = time.monotonic()
+            logger.info(f"Loaded symptom vocabulary with {len(_vocabulary)} terms")
+        return _vocabulary
+
+
+def invalidate():
+    global _vocabulary
+    with _lock:
+        _vocabulary = None
+
+
+def canonical_symptom(name):
+    """Symptom chuẩn cho một tên trong từ điển (tạo nếu chưa có)"""
+    symptom = Symptom.objects.filter(name=name).order_by('-is_canonical', 'pk').first()
+    if symptom is None:
+        return Symptom.objects.create(name=name, is_canonical=True)
+    if not symptom.is_canonical:
+        Symptom.objects.filter(pk=symptom.pk).update(is_canonical=True)
+        symptom.is_canonical = True
+        kb_revision.changed()
+    return symptom
+
+
+def observe_unmatched(phrases, disease_id):
+    """Ghi nhận cụm chưa có trong từ điển, trích xuất từ trang của bệnh disease_id
+
+    Chỉ bằng chứng độc lập mới được tính: cụm ngắn xuất hiện ở đủ CHATBOT_SYMPTOM_PROMOTE_MIN bệnh khác
+    nhau được thêm vào từ điển (learned); crawl lại cùng một trang không làm tăng số đếm.
+    """
+    min_occurrences = getattr(settings, 'CHATBOT_SYMPTOM_PROMOTE_MIN', 3)
+    promoted = []
+
+    for phrase in dict.fromkeys(phrases):
+        key = normalize(phrase)
+        if not key or len(key.split()) > 4 or len(key) > 60:
+            continue
+
+        with transaction.atomic():
+            candidate, created = SymptomCandidate.objects.select_for_update().get_or_create(
+                normalized=key, defaults={'phrase': phrase[:200], 'disease_ids': [disease_id]}
+            )
+            if not created:
+                if disease_id in candidate.disease_ids:
+                    SymptomCandidate.objects.filter(pk=candidate.pk).update(last_seen=timezone.now())
+                    continue
+                candidate.disease_ids.append(disease_id)
+                candidate.occurrences = len(candidate.disease_ids)
+                candidate.save(update_fields=['disease_ids', 'occurrences', 'last_seen'])
+
+            if candidate.occurrences >= min_occurrences:
+                canonical_symptom(candidate.phrase)
+                candidate.delete()
+                promoted.append(candidate.phrase)
+
+    if promoted:
+        logger.info(f"Promoted {len(promoted)} phrases into the symptom vocabulary: {promoted}")
+        invalidate()
+    return promoted
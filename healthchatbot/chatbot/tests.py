@@ -1,3 +1,1293 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from unidecode import unidecode
+
+from django.contrib.auth.models import User
+from django.core.cache import CacheHandler
+from django.core.management import call_command
+from django.conf import settings
+from django.db import router, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import (admission, chat_archive, hashed_index, kb_revision, kb_snapshot, metrics, near_duplicates, page_cache,
+               session_state, shared_processor, stats_snapshot, storage, symptom_vocabulary)
+from .models import (ChatMessage, ChatSession, Disease, DiseaseSignature, DiseaseSymptom, KnowledgeBaseSnapshot,
+                     StatsCounter, Symptom, SymptomCandidate, TrustedSource, URLSource)
+from .autocomplete import MAX_SUGGESTIONS, SuggestionTrie, normalize
+from .health_source_manager import HealthSourceManager
+from .http_client import CircuitOpenError, FetchClient
+from .name_index import DISEASE, MIN_FOLDED_KEY_LENGTH, SYMPTOM, NameIndex, name_keys
+from .liveness import LivenessChecker
+from .source_discovery import DiscoveryFrontier, normalize_url
+from .sitemap_ingest import SitemapIngester, iter_sitemap_entries
+from .refresh_scheduler import BandwidthBudget, RefreshScheduler
+from .retrieval import BruteForceRetriever, MaxScoreRetriever
+from .nlp_processor import ImprovedNLPProcessor
+from .session_state import SessionState
+from .spelling import SpellingCorrector, edit_distance, max_distance
+
+
+def reset_chat_state(test):
+    """Trạng thái trong bộ nhớ của worker (processor, phiên, token bucket, câu trả lời dự phòng) tạo ra từ
+    database của test khác không được dùng lại"""
+    processor = mock.patch.object(shared_processor, '_processor', None)
+    processor.start()
+    test.addCleanup(processor.stop)
+    for entries in (session_state.get_store()._entries, admission.get_throttle()._buckets,
+                    admission.get_fallbacks()._answers):
+        entries.clear()
+        test.addCleanup(entries.clear)
+
+
+class ExportPermissionTests(TestCase):
+    def setUp(self):
+        ChatSession.objects.create(session_id='private-session')
+
+    def test_anonymous_client_cannot_export_chat_data(self):
+        for kind in ('sessions', 'messages', 'diseases'):
+            response = self.client.get(f'/api/export/{kind}/')
+            self.assertEqual(response.status_code, 403)
+
+    def test_staff_can_export_sessions(self):
+        User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.login(username='admin', password='secret')
+        response = self.client.get('/api/export/sessions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'private-session', b''.join(response.streaming_content))
+
+
+class FollowUpTests(TestCase):
+    def setUp(self):
+        fever = Symptom.objects.create(name='sốt', is_canonical=True)
+        flu = Disease.objects.create(name='Cúm', description='Bệnh cúm do virus cúm gây sốt, ho, đau họng',
+                                     causes='Virus cúm lây qua đường hô hấp')
+        DiseaseSymptom.objects.create(disease=flu, symptom=fever)
+        Disease.objects.create(name='Migraine',
+                               description='Đau nửa đầu (migraine) là cơn đau đầu dữ dội ở một bên đầu, '
+                                           'nguyên nhân đau nửa đầu liên quan đến rối loạn mạch máu não')
+        self.processor = ImprovedNLPProcessor()
+        self.state = SessionState('s', 1)
+        result = self.processor.answer_query('cúm', self.state)
+        self.state.remember(result['diseases'], result['symptoms'])
+
+    def test_bare_aspect_question_uses_session_disease(self):
+        result = self.processor.answer_query('còn nguyên nhân thì sao?', self.state)
+        self.assertTrue(result['follow_up'])
+        self.assertIn('Virus cúm lây qua đường hô hấp', result['response'])
+
+    def test_new_question_with_aspect_word_is_searched(self):
+        result = self.processor.answer_query('nguyên nhân đau nửa đầu', self.state)
+        self.assertFalse(result['follow_up'])
+        self.assertIn('Migraine', result['response'])
+
+
+class KnowledgeRevisionTests(TestCase):
+    def test_one_bump_per_transaction(self):
+        before = kb_revision.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for i in range(20):
+                    Disease.objects.create(name=f'Bệnh {i}', description='mô tả')
+        self.assertEqual(kb_revision.current(), before + 1)
+
+    def test_rolled_back_savepoint_does_not_swallow_later_changes(self):
+        before = kb_revision.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        Disease.objects.create(name='Bệnh A', description='mô tả')
+                        raise ValueError
+                except ValueError:
+                    pass
+                Disease.objects.create(name='Bệnh B', description='mô tả')
+        self.assertEqual(kb_revision.current(), before + 1)
+
+    def test_batch_bumps_once_at_the_end(self):
+        before = kb_revision.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            with kb_revision.batch():
+                for i in range(5):
+                    Symptom.objects.create(name=f'triệu chứng {i}')
+                self.assertEqual(kb_revision.current(), before)
+        self.assertEqual(kb_revision.current(), before + 1)
+
+
+@override_settings(CHATBOT_INDEX_CHECK_INTERVAL=0, CHATBOT_INDEX_QUIET_PERIOD=30, CHATBOT_INDEX_MAX_STALENESS=600)
+class KnowledgeBaseSnapshotTests(TestCase):
+    def test_imported_index_is_used_by_the_processor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cough = Symptom.objects.create(name='ho khan', is_canonical=True)
+            measles = Disease.objects.create(name='Sởi', description='Bệnh sởi gây sốt, ho và phát ban')
+            DiseaseSymptom.objects.create(disease=measles, symptom=cough)
+        data, _ = kb_snapshot.export_snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Disease.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            snapshot, _ = kb_snapshot.import_snapshot(data)
+
+        self.assertEqual(KnowledgeBaseSnapshot.objects.get().revision, kb_revision.current())
+        self.assertEqual(snapshot.revision, kb_revision.current())
+        with mock.patch.object(ImprovedNLPProcessor, 'fit_vectorizer') as fit_vectorizer:
+            processor = ImprovedNLPProcessor()
+        fit_vectorizer.assert_not_called()
+        self.assertEqual([d.name for d in processor.diseases], ['Sởi'])
+        self.assertEqual(processor.disease_vectors.shape[0], 1)
+        self.assertEqual(processor.disease_vectorizer.max_features, 1000)
+
+        with override_settings(CHATBOT_TFIDF_MAX_FEATURES=50), \
+                mock.patch.object(ImprovedNLPProcessor, 'fit_vectorizer', return_value=(None, None)) as fit_vectorizer:
+            ImprovedNLPProcessor()
+        self.assertEqual(fit_vectorizer.call_count, 2)
+
+
+class SnapshotContainerTests(SimpleTestCase):
+    def setUp(self):
+        self.sections = {'table.x': {'columns': ['id'], 'rows': [[1], [2]]},
+                         'index.x.data': np.arange(6, dtype=np.float64).reshape(2, 3)}
+        self.data = kb_snapshot.write_container({'kb_version': 'v1'}, self.sections)
+
+    def test_round_trip(self):
+        self.assertTrue(self.data.startswith(kb_snapshot.MAGIC))
+        header, body_start = kb_snapshot.read_header(self.data)
+        self.assertEqual(header['kb_version'], 'v1')
+        self.assertEqual(header['format_version'], kb_snapshot.FORMAT_VERSION)
+        self.assertEqual(header['sha256'], hashlib.sha256(self.data[body_start:]).hexdigest())
+        _, body = kb_snapshot.pack_sections(self.sections)
+        self.assertEqual(zlib.decompress(self.data[body_start:]), body)
+
+        _, sections = kb_snapshot.read_container(self.data)
+        self.assertEqual(sections['table.x'], self.sections['table.x'])
+        np.testing.assert_array_equal(sections['index.x.data'], self.sections['index.x.data'])
+        self.assertEqual(list(kb_snapshot.read_container(self.data, prefix='index.')[1]), ['index.x.data'])
+
+    def test_rejects_corrupted_files(self):
+        corrupted = bytearray(self.data)
+        corrupted[-5] ^= 0xFF
+        with self.assertRaisesRegex(kb_snapshot.SnapshotError, 'checksum'):
+            kb_snapshot.read_container(bytes(corrupted))
+        with self.assertRaisesRegex(kb_snapshot.SnapshotError, 'checksum'):
+            kb_snapshot.read_container(self.data[:-10])
+        with self.assertRaisesRegex(kb_snapshot.SnapshotError, 'magic'):
+            kb_snapshot.read_container(b'X' + self.data[1:])
+
+        header, body_start = kb_snapshot.read_header(self.data)
+        header_bytes = json.dumps(dict(header, format_version=99)).encode('utf-8')
+        newer = self.data[:len(kb_snapshot.MAGIC)] + len(header_bytes).to_bytes(4, 'little') + header_bytes
+        with self.assertRaisesRegex(kb_snapshot.SnapshotError, 'version'):
+            kb_snapshot.read_container(newer + self.data[body_start:])
+
+
+@override_settings(CHATBOT_SYMPTOM_PROMOTE_MIN=3)
+class SymptomPromotionTests(TestCase):
+    def setUp(self):
+        self.diseases = [Disease.objects.create(name=f'Bệnh {i}', description='') for i in range(3)]
+        self.addCleanup(symptom_vocabulary.invalidate)
+
+    def test_reimporting_the_same_disease_does_not_promote(self):
+        for _ in range(5):
+            self.assertEqual(symptom_vocabulary.observe_unmatched(['lưỡi dâu tây'], self.diseases[0].pk), [])
+        candidate = SymptomCandidate.objects.get(normalized='lưỡi dâu tây')
+        self.assertEqual(candidate.occurrences, 1)
+        self.assertEqual(candidate.disease_ids, [self.diseases[0].pk])
+        self.assertFalse(Symptom.objects.filter(name='lưỡi dâu tây').exists())
+
+    def test_distinct_diseases_promote(self):
+        for disease in self.diseases[:2]:
+            symptom_vocabulary.observe_unmatched(['lưỡi dâu tây'], disease.pk)
+            symptom_vocabulary.observe_unmatched(['lưỡi dâu tây'], disease.pk)
+        self.assertEqual(SymptomCandidate.objects.get().occurrences, 2)
+
+        promoted = symptom_vocabulary.observe_unmatched(['lưỡi dâu tây'], self.diseases[2].pk)
+        self.assertEqual(promoted, ['lưỡi dâu tây'])
+        self.assertTrue(Symptom.objects.get(name='lưỡi dâu tây').is_canonical)
+        self.assertFalse(SymptomCandidate.objects.exists())
+
+
+class NearDuplicateTests(TestCase):
+    DENGUE = ('Sốt xuất huyết Dengue là bệnh truyền nhiễm cấp tính do virus Dengue gây ra, lây truyền qua muỗi '
+              'vằn Aedes aegypti đốt, gây sốt cao đột ngột, đau đầu, đau hốc mắt, đau cơ khớp và xuất huyết dưới da')
+
+    def disease(self, name, description):
+        return Disease.objects.create(name=name, description=description)
+
+    def test_register_marks_near_duplicates_of_the_earliest_disease(self):
+        first = self.disease('Sốt xuất huyết', self.DENGUE)
+        other = self.disease('Thủy đậu', 'Thủy đậu là bệnh do virus Varicella zoster gây nổi mụn nước khắp người')
+        second = self.disease('Sốt xuất huyết', self.DENGUE + ' ở trẻ em')
+        self.assertIsNone(near_duplicates.register(first))
+        self.assertIsNone(near_duplicates.register(other))
+        self.assertEqual(near_duplicates.register(second), first.pk)
+        self.assertEqual(Disease.objects.get(pk=second.pk).duplicate_of_id, first.pk)
+        self.assertEqual(DiseaseSignature.objects.count(), 3)
+
+    def test_disease_that_becomes_canonical_is_saved_as_such(self):
+        first = self.disease('Sốt xuất huyết', self.DENGUE)
+        other = self.disease('Thủy đậu', 'Thủy đậu là bệnh do virus Varicella zoster gây nổi mụn nước khắp người')
+        later = self.disease('Sốt xuất huyết Dengue', self.DENGUE + ' ở trẻ em')
+        for disease in (first, other, later):
+            near_duplicates.register(disease)
+        # Trước đây first bị đánh dấu là bản trùng của other (nội dung cũ)
+        Disease.objects.filter(pk=first.pk).update(duplicate_of=other)
+        first.duplicate_of_id = other.pk
+
+        self.assertIsNone(near_duplicates.register(first))
+        self.assertIsNone(Disease.objects.get(pk=first.pk).duplicate_of_id)
+        self.assertEqual(Disease.objects.get(pk=later.pk).duplicate_of_id, first.pk)
+
+    def test_rebuild_index_groups_and_dry_run_writes_nothing(self):
+        first = self.disease('Sốt xuất huyết', self.DENGUE)
+        self.disease('Thủy đậu', 'Thủy đậu là bệnh do virus Varicella zoster gây nổi mụn nước khắp người')
+        second = self.disease('Sốt xuất huyết Dengue', self.DENGUE + ' ở trẻ em')
+
+        self.assertEqual(near_duplicates.rebuild_index(save=False), {first.pk: [second.pk]})
+        output = StringIO()
+        call_command('merge_duplicate_diseases', '--rebuild', '--dry-run', stdout=output)
+        self.assertIn(f'(#{second.pk})', output.getvalue())
+        self.assertFalse(DiseaseSignature.objects.exists())
+        self.assertFalse(Disease.objects.exclude(duplicate_of=None).exists())
+        self.assertEqual(Disease.objects.count(), 3)
+
+        self.assertEqual(near_duplicates.rebuild_index(), {first.pk: [second.pk]})
+        self.assertEqual(DiseaseSignature.objects.count(), 3)
+        self.assertEqual(Disease.objects.get(pk=second.pk).duplicate_of_id, first.pk)
+
+    def test_merge_into_moves_links_and_deletes_the_duplicate(self):
+        canonical = self.disease('Sốt xuất huyết', '')
+        duplicate = Disease.objects.create(name='Sốt xuất huyết Dengue', description=self.DENGUE,
+                                           causes='Virus Dengue', is_contagious=True)
+        fever = Symptom.objects.create(name='sốt cao')
+        rash = Symptom.objects.create(name='phát ban')
+        DiseaseSymptom.objects.create(disease=canonical, symptom=fever, relevance_score=2)
+        DiseaseSymptom.objects.create(disease=duplicate, symptom=fever, relevance_score=7)
+        DiseaseSymptom.objects.create(disease=duplicate, symptom=rash, relevance_score=3)
+
+        near_duplicates.merge_into(duplicate, canonical)
+
+        canonical.refresh_from_db()
+        self.assertFalse(Disease.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(dict(canonical.symptoms_link.values_list('symptom__name', 'relevance_score')),
+                         {'sốt cao': 7, 'phát ban': 3})
+        self.assertEqual((canonical.description, canonical.causes, canonical.is_contagious),
+                         (self.DENGUE, 'Virus Dengue', True))
+
+
+class IndexRebuildDebounceTests(TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(shared_processor, '_loaded_stamp', 1),
+            mock.patch.object(shared_processor, '_last_check', 0.0),
+            mock.patch.object(shared_processor, '_seen_stamp', None),
+            mock.patch.object(shared_processor, '_stale_since', None),
+            mock.patch.object(shared_processor, '_rebuilding', False),
+            mock.patch.object(shared_processor, '_rebuild'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.now = 1000.0
+        clock = mock.patch.object(shared_processor.time, 'monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def check(self, stamp, at):
+        self.now = at
+        with mock.patch.object(shared_processor, '_current_stamp', return_value=stamp):
+            return shared_processor.refresh_if_stale()
+
+    def test_waits_for_revision_to_settle(self):
+        self.assertFalse(self.check(2, 1000))
+        self.assertFalse(self.check(3, 1020))
+        self.assertFalse(self.check(3, 1040))
+        self.assertTrue(self.check(3, 1051))
+
+    def test_rebuilds_when_revision_keeps_moving_for_too_long(self):
+        for step in range(0, 600, 20):
+            self.assertFalse(self.check(2 + step, 1000 + step))
+        self.assertTrue(self.check(1000, 1600))
+
+
+class PageCacheTests(TestCase):
+    def test_pages_are_visible_to_other_processes(self):
+        with tempfile.TemporaryDirectory() as location:
+            pages = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                                           'pages': pages}):
+                page_cache.store_page('https://example.com/a', '<html>a</html>')
+                # Một CacheHandler mới dựng lại backend từ settings như ở process khác
+                other = CacheHandler()[page_cache.CACHE_ALIAS]
+                self.assertEqual(other.get(page_cache.cache_key('https://example.com/a')), '<html>a</html>')
+
+
+class ChatArchiveTests(TestCase):
+    def test_archiving_deletes_rows_and_keeps_counters_in_sync(self):
+        old = ChatSession.objects.create(session_id='old')
+        for text in ('xin chào', 'bệnh sởi'):
+            ChatMessage.objects.create(session=old, sender='user', message=text)
+        recent = ChatSession.objects.create(session_id='recent')
+        ChatMessage.objects.create(session=recent, sender='user', message='cúm')
+        ChatSession.objects.filter(pk=old.pk).update(updated_at=timezone.now() - timedelta(days=100))
+        ChatMessage.objects.filter(session=old).update(timestamp=timezone.now() - timedelta(days=100))
+        stats_snapshot.reconcile()
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(CHATBOT_ARCHIVE_DIR=directory):
+            result = chat_archive.ChatArchiver(days=90).run()
+            messages, archived = chat_archive.session_history('old')
+
+        self.assertEqual(result['sessions'], 1)
+        self.assertTrue(archived)
+        self.assertEqual([m['message'] for m in messages], ['xin chào', 'bệnh sởi'])
+        self.assertEqual(list(ChatSession.objects.values_list('session_id', flat=True)), ['recent'])
+        self.assertEqual(ChatMessage.objects.count(), 1)
+        counters = dict(StatsCounter.objects.values_list('name', 'value'))
+        self.assertEqual(counters['total_sessions'], 1)
+        self.assertEqual(counters['total_messages'], 1)
+
+
+class ClientKeyTests(TestCase):
+    def request(self, **meta):
+        return RequestFactory().post('/api/chatbot/message/', REMOTE_ADDR='10.0.0.1', **meta)
+
+    def test_remote_addr_by_default(self):
+        self.assertEqual(admission.client_key(self.request(HTTP_X_FORWARDED_FOR='1.2.3.4')), '10.0.0.1')
+
+    @override_settings(CHATBOT_CLIENT_IP_HEADER='X-Forwarded-For', CHATBOT_TRUSTED_PROXIES=1)
+    def test_trusted_forwarded_header_ignores_client_supplied_entries(self):
+        request = self.request(HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(admission.client_key(request), '203.0.113.7')
+        self.assertEqual(admission.client_key(self.request()), '10.0.0.1')
+
+
+class FallbackAnswerTests(TestCase):
+    def setUp(self):
+        Disease.objects.create(name='Sởi', description='Bệnh sởi là bệnh truyền nhiễm do virus sởi gây ra')
+        reset_chat_state(self)
+
+    def post(self, message):
+        return self.client.post('/api/chatbot/message/', {'message': message}, content_type='application/json')
+
+    def test_only_real_answers_are_kept_as_fallback(self):
+        self.assertEqual(self.post('bệnh sởi').status_code, 200)
+        self.assertIn('Sởi', admission.get_fallbacks().get('bệnh sởi'))
+
+        self.post('xyz không liên quan')
+        self.assertIsNone(admission.get_fallbacks().get('xyz không liên quan'))
+
+        with mock.patch('chatbot.nlp_processor.ImprovedNLPProcessor.find_exact_matches', side_effect=RuntimeError):
+            response = self.post('bệnh sởi nặng không')
+        self.assertIn('đã xảy ra lỗi', response.json()['response'])
+        self.assertIsNone(admission.get_fallbacks().get('bệnh sởi nặng không'))
+
+
+class DeadlineTests(TestCase):
+    def setUp(self):
+        reset_chat_state(self)
+
+    def post(self, timeout):
+        return self.client.post('/api/chatbot/message/', {'message': 'cúm', 'session_id': 'deadline'},
+                                content_type='application/json', HTTP_X_REQUEST_TIMEOUT=timeout)
+
+    def test_expired_request_stores_nothing(self):
+        response = self.post('0')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['reason'], admission.DEADLINE)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_deadline_passing_during_insert_stores_bot_error(self):
+        checks = iter([None, admission.Shed(admission.DEADLINE)])
+
+        def check_deadline():
+            error = next(checks)
+            if error:
+                raise error
+
+        with mock.patch.object(admission, 'check_deadline', side_effect=check_deadline):
+            response = self.post('5')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(list(ChatMessage.objects.order_by('pk').values_list('sender', flat=True)), ['user', 'bot'])
+
+
+class MetricsFlushTests(TestCase):
+    def setUp(self):
+        for name, value in (('_pending', Counter()), ('_last_flush', 0.0), ('_flushing', False)):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(CHATBOT_METRICS_FLUSH_INTERVAL=0)
+    def test_flush_runs_off_the_request_thread(self):
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread())
+            flushed.set()
+
+        with mock.patch.object(metrics, 'flush', flush):
+            metrics.incr('queries')
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertEqual(metrics._pending['queries'], 1)
+
+    def test_failed_flush_keeps_only_unwritten_deltas(self):
+        metrics._pending.update({'a': 1, 'b': 2, 'c': 3})
+        write = metrics._write
+
+        def fail_on_b(name, delta):
+            if name == 'b':
+                raise RuntimeError('database is locked')
+            write(name, delta)
+
+        with mock.patch.object(metrics, '_write', fail_on_b):
+            metrics.flush()
+        self.assertEqual(metrics._pending, {'b': 2, 'c': 3})
+
+        metrics.flush()
+        self.assertEqual(metrics._pending, {})
+        self.assertEqual(dict(StatsCounter.objects.filter(name__startswith=metrics.PREFIX).values_list('name', 'value')),
+                         {'metric.a': 1, 'metric.b': 2, 'metric.c': 3})
+
+
+class SymptomRankingTests(TestCase):
+    def setUp(self):
+        names = ['sốt', 'ho', 'ho khan', 'sổ mũi', 'đau họng', 'đau đầu', 'phát ban', 'buồn nôn', 'nôn mửa']
+        self.symptoms = {name: Symptom.objects.create(name=name, is_canonical=True) for name in names}
+        # Cùng thứ tự nhập như knowledge base thật: Sởi trước
+        for name, symptoms in [('Sởi', ['sốt', 'ho khan', 'sổ mũi', 'đau họng']),
+                               ('Zika', ['sốt', 'đau đầu', 'phát ban']),
+                               ('Nhiễm nấm Cryptococcus', ['sốt', 'buồn nôn', 'nôn mửa'])]:
+            disease = Disease.objects.create(name=name, description=f'Bệnh {name}')
+            for symptom in symptoms:
+                DiseaseSymptom.objects.create(disease=disease, symptom=self.symptoms[symptom])
+        self.processor = ImprovedNLPProcessor()
+
+    def rank(self, *names):
+        ranked = self.processor.rank_diseases_by_symptoms([(self.symptoms[name], 1.0) for name in names])
+        return [disease.name for disease, _ in ranked]
+
+    def test_diseases_with_more_symptoms_are_not_pushed_down(self):
+        # "tôi bị ho và sốt": cả ba bệnh chỉ khớp "sốt"
+        self.assertEqual(self.rank('ho', 'sốt'), ['Sởi', 'Zika', 'Nhiễm nấm Cryptococcus'])
+
+    def test_coverage_of_matched_symptoms_comes_first(self):
+        self.assertEqual(self.rank('sốt', 'phát ban', 'ho khan')[:2], ['Sởi', 'Zika'])
+        self.assertEqual(self.rank('sốt', 'phát ban', 'đau đầu')[0], 'Zika')
+
+    def test_relevance_breaks_ties_between_equal_coverage(self):
+        DiseaseSymptom.objects.filter(symptom=self.symptoms['sốt'], disease__name='Zika').update(relevance_score=9)
+        self.processor = ImprovedNLPProcessor()
+        self.assertEqual(self.rank('ho', 'sốt')[0], 'Zika')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/ok: 200; /no-head: HEAD 405, GET 200; /gone: 404; /slow: 200 sau 0.2 s, ghi nhận số request đồng thời"""
+
+    active = 0
+    peak = 0
+    requests_seen = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        with StubHandler.lock:
+            StubHandler.requests_seen.append((self.command, self.path))
+        if self.path == '/no-head' and self.command == 'HEAD':
+            status = 405
+        elif self.path == '/gone':
+            status = 404
+        elif self.path.startswith('/slow'):
+            with StubHandler.lock:
+                StubHandler.active += 1
+                StubHandler.peak = max(StubHandler.peak, StubHandler.active)
+            time.sleep(0.2)
+            with StubHandler.lock:
+                StubHandler.active -= 1
+            status = 200
+        else:
+            status = 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_HEAD = respond
+    do_GET = respond
+
+
+class LivenessCheckerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHandler.active = StubHandler.peak = 0
+        StubHandler.requests_seen = []
+        session = requests.Session()
+        session.trust_env = False  # không đi qua proxy của môi trường
+        self.client = FetchClient(max_retries=0, connect_timeout=1, read_timeout=2, session=session)
+
+    def test_head_falls_back_to_get_on_405(self):
+        result = LivenessChecker(client=self.client).check(f'{self.base}/no-head')
+        self.assertTrue(result.alive)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(StubHandler.requests_seen, [('HEAD', '/no-head'), ('GET', '/no-head')])
+
+    def test_dead_urls(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed_port = sock.getsockname()[1]
+        results = LivenessChecker(client=self.client).check_many(
+            [f'{self.base}/ok', f'{self.base}/gone', f'http://127.0.0.1:{closed_port}/'])
+        self.assertEqual([result.alive for result in results.values()], [True, False, False])
+        self.assertEqual(results[f'{self.base}/gone'].reason, 'HTTP 404')
+        self.assertTrue(results[f'http://127.0.0.1:{closed_port}/'].error)
+
+    def test_per_host_limit(self):
+        checker = LivenessChecker(max_workers=8, per_host=2, client=self.client)
+        results = checker.check_many([f'{self.base}/slow/{i}' for i in range(6)])
+        self.assertTrue(all(result.alive for result in results.values()))
+        self.assertEqual(StubHandler.peak, 2)
+
+
+class MaxScoreRetrieverTests(SimpleTestCase):
+    def random_matrix(self, rng, docs, terms, density):
+        matrix = sparse.random(docs, terms, density=density, format='csr', random_state=rng, dtype=np.float64)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+    def random_query(self, rng, terms, size):
+        columns = rng.choice(terms, size=size, replace=False)
+        return sparse.csr_matrix((rng.random(size) + 0.05, (np.zeros(size, dtype=int), columns)), shape=(1, terms))
+
+    def assertSameResults(self, expected, actual, scores):
+        """Cùng số kết quả, cùng điểm ở mỗi vị trí; tài liệu chỉ được khác nhau khi điểm bằng nhau
+        (điểm của tài liệu trả về phải đúng điểm thật của nó)"""
+        self.assertEqual(len(expected), len(actual))
+        for (_, expected_score), (doc, actual_score) in zip(expected, actual):
+            self.assertAlmostEqual(expected_score, actual_score, places=9)
+            self.assertAlmostEqual(actual_score, scores[doc], places=9)
+
+    def test_matches_brute_force_on_random_matrices(self):
+        rng = np.random.default_rng(0)
+        for docs, terms, density in [(200, 50, 0.1), (1000, 300, 0.02), (50, 500, 0.01)]:
+            matrix = self.random_matrix(rng, docs, terms, density)
+            brute, maxscore = BruteForceRetriever(matrix), MaxScoreRetriever(matrix)
+            for _ in range(50):
+                query = self.random_query(rng, terms, int(rng.integers(1, 8)))
+                scores = (matrix @ query.T).toarray().ravel()
+                for k in (1, 3, 10):
+                    for min_score in (0.0, 0.1, 0.3):
+                        with self.subTest(docs=docs, k=k, min_score=min_score):
+                            self.assertSameResults(brute.search(query, k, min_score),
+                                                   maxscore.search(query, k, min_score), scores)
+
+    def test_k_larger_than_hits_and_min_score_cut_off(self):
+        matrix = sparse.csr_matrix(np.array([
+            [1.0, 0.0, 0.0],
+            [0.6, 0.8, 0.0],
+            [0.0, 0.0, 1.0],
+            [0.0, 1.0, 0.0],
+        ]))
+        query = sparse.csr_matrix(np.array([[1.0, 0.0, 0.0]]))
+        retriever = MaxScoreRetriever(matrix)
+        self.assertEqual([doc for doc, _ in retriever.search(query, k=10)], [0, 1])
+        self.assertEqual([doc for doc, _ in retriever.search(query, k=10, min_score=0.7)], [0])
+        self.assertEqual(retriever.search(query, k=10, min_score=1.0), [])
+        self.assertEqual(retriever.search(sparse.csr_matrix((1, 3)), k=3), [])
+
+
+class SuggestionTrieTests(SimpleTestCase):
+    def expected(self, trie, prefix):
+        """Tìm tuyến tính: mọi mục có khóa (có dấu hoặc không dấu) bắt đầu bằng prefix, theo thứ hạng của build()"""
+        return [entry['text'] for entry in trie._items
+                if normalize(entry['text']).startswith(prefix) or unidecode(normalize(entry['text'])).startswith(prefix)
+                ][:MAX_SUGGESTIONS]
+
+    def assertMatchesLinearScan(self, trie, keys):
+        prefixes = {variant[:i] for key in keys for variant in (key, unidecode(key)) for i in range(2, len(variant) + 1)}
+        for prefix in sorted(prefixes):
+            with self.subTest(prefix=prefix):
+                fragment, entries = trie.complete(prefix)
+                self.assertEqual([entry['text'] for entry in entries], self.expected(trie, prefix))
+
+    def test_edge_splits_keep_subtree_top_lists(self):
+        rng = np.random.default_rng(1)
+        trie = SuggestionTrie()
+        keys = set()
+        while len(keys) < 300:
+            keys.add(''.join(rng.choice(list('abcdeđô'), size=int(rng.integers(2, 9)))))
+        for key in keys:
+            trie.add(key, 'symptom', popularity=int(rng.integers(0, 5)))
+        trie.build()
+        self.assertMatchesLinearScan(trie, keys)
+
+    def test_accent_insensitive_and_ranked_by_popularity(self):
+        trie = SuggestionTrie()
+        trie.add('Sốt', 'symptom', popularity=5)
+        trie.add('Sốt xuất huyết', 'disease', popularity=9)
+        trie.add('Sổ mũi', 'symptom', popularity=1)
+        trie.add('sởi', 'disease', popularity=3)
+        trie.build()
+        self.assertEqual([e['text'] for e in trie.complete('so')[1]], ['Sốt xuất huyết', 'Sốt', 'sởi', 'Sổ mũi'])
+        self.assertEqual([e['text'] for e in trie.complete('sot')[1]], ['Sốt xuất huyết', 'Sốt'])
+        self.assertEqual(trie.complete('tôi bị sốt x'), ('sốt x', [trie._items[0]]))
+        self.assertEqual(trie.complete('x'), ('', []))
+
+
+def osa_distance(a, b):
+    """Khoảng cách Damerau-Levenshtein (optimal string alignment) bằng bảng đầy đủ, làm chuẩn đối chiếu"""
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        table[i][0] = i
+    for j in range(len(b) + 1):
+        table[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                              table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+    return table[-1][-1]
+
+
+class SpellingCorrectorTests(SimpleTestCase):
+    def random_words(self, rng, count, alphabet='abcdehnotu'):
+        return [''.join(rng.choice(list(alphabet), size=int(rng.integers(2, 9)))) for _ in range(count)]
+
+    def test_edit_distance_matches_full_table(self):
+        rng = np.random.default_rng(2)
+        words = self.random_words(rng, 300)
+        for a, b in zip(words, reversed(words)):
+            for limit in (1, 2):
+                with self.subTest(a=a, b=b, limit=limit):
+                    self.assertEqual(edit_distance(a, b, limit), min(osa_distance(a, b), limit + 1))
+
+    def test_corrections_match_linear_scan_of_the_vocabulary(self):
+        rng = np.random.default_rng(3)
+        vocabulary = self.random_words(rng, 400)
+        corrector = SpellingCorrector(vocabulary)
+        for word in self.random_words(rng, 500):
+            limit = max_distance(word)
+            expected = None
+            if limit and word not in corrector.frequency:
+                ranked = sorted((osa_distance(word, candidate), -count, candidate)
+                                for candidate, count in corrector.frequency.items())
+                if ranked[0][0] <= limit:
+                    expected = ranked[0][2]
+            with self.subTest(word=word):
+                self.assertEqual(corrector.correct_word(word), expected)
+                # Lần hai lấy từ cache
+                self.assertEqual(corrector.correct_word(word), expected)
+
+    def test_query_corrections(self):
+        corrector = SpellingCorrector('sot xuat huyet viem hong dau dau sot cao'.split())
+        self.assertEqual(corrector.correct('toi bi sot xuat huyt'),
+                         ('toi bi sot xuat huyet', [('huyt', 'huyet')]))
+        self.assertEqual(corrector.correct('viem hongg'), ('viem hong', [('hongg', 'hong')]))
+        # Từ ngắn và từ hỏi thường gặp không bị "sửa" sang từ y khoa
+        self.assertEqual(corrector.correct('toi muon biet'), ('toi muon biet', []))
+
+
+URLSET = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc> https://benhvien.vn/benh/cum </loc><lastmod>2024-05-01</lastmod></url>
+  <url><loc>https://benhvien.vn/benh/soi</loc><lastmod>2024-05-02T10:30:00+07:00</lastmod></url>
+  <url><loc>https://benhvien.vn/benh/zika</loc><lastmod>hôm qua</lastmod></url>
+  <url><loc>https://benhvien.vn/benh/thuy-dau</loc></url>
+  <url><lastmod>2024-05-01</lastmod></url>
+</urlset>"""
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://benhvien.vn/sitemap-old.xml</loc><lastmod>2023-01-01</lastmod></sitemap>
+  <sitemap><loc>https://benhvien.vn/sitemap-new.xml.gz</loc><lastmod>2024-06-01</lastmod></sitemap>
+</sitemapindex>"""
+
+
+class SitemapResponse:
+    def __init__(self, body):
+        self.raw = io.BytesIO(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+
+class SitemapClient:
+    def __init__(self, sitemaps):
+        self.sitemaps = sitemaps
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        return SitemapResponse(self.sitemaps[url])
+
+
+class SitemapIngestTests(TestCase):
+    def utc(self, *args):
+        return datetime(*args, tzinfo=dt_timezone.utc)
+
+    def test_namespaced_urlset_and_lastmod_parsing(self):
+        entries = list(iter_sitemap_entries(io.BytesIO(URLSET.encode('utf-8'))))
+        self.assertEqual(entries, [
+            ('url', 'https://benhvien.vn/benh/cum', self.utc(2024, 5, 1)),
+            ('url', 'https://benhvien.vn/benh/soi', self.utc(2024, 5, 2, 3, 30)),
+            ('url', 'https://benhvien.vn/benh/zika', None),
+            ('url', 'https://benhvien.vn/benh/thuy-dau', None),
+        ])
+
+    def test_sitemap_index(self):
+        entries = list(iter_sitemap_entries(io.BytesIO(SITEMAP_INDEX.encode('utf-8'))))
+        self.assertEqual([(kind, loc) for kind, loc, _ in entries],
+                         [('sitemap', 'https://benhvien.vn/sitemap-old.xml'),
+                          ('sitemap', 'https://benhvien.vn/sitemap-new.xml.gz')])
+
+    def ingester(self, sitemaps, **kwargs):
+        client = SitemapClient(sitemaps)
+        return SitemapIngester(lambda url: True, client=client, **kwargs), client
+
+    def test_gzipped_child_sitemaps_and_since_filter(self):
+        ingester, client = self.ingester({
+            'https://benhvien.vn/sitemap.xml': SITEMAP_INDEX.encode('utf-8'),
+            'https://benhvien.vn/sitemap-new.xml.gz': gzip.compress(URLSET.encode('utf-8')),
+        }, since=self.utc(2024, 5, 1, 12))
+        stats = ingester.ingest(['https://benhvien.vn/sitemap.xml'])
+
+        # Sitemap con cũ hơn --since không được tải; trang cũ hơn --since bị bỏ qua
+        self.assertEqual(client.requested, ['https://benhvien.vn/sitemap.xml',
+                                            'https://benhvien.vn/sitemap-new.xml.gz'])
+        self.assertEqual(stats['skipped_old'], 1)
+        self.assertEqual(set(URLSource.objects.values_list('url', flat=True)),
+                         {'https://benhvien.vn/benh/soi', 'https://benhvien.vn/benh/zika',
+                          'https://benhvien.vn/benh/thuy-dau'})
+        self.assertEqual(URLSource.objects.get(url='https://benhvien.vn/benh/soi').sitemap_lastmod,
+                         self.utc(2024, 5, 2, 3, 30))
+
+    def test_never_crawled_source_with_new_lastmod_is_refreshed(self):
+        URLSource.objects.create(url='https://benhvien.vn/benh/cum')
+        URLSource.objects.create(url='https://benhvien.vn/benh/soi', last_updated=self.utc(2024, 6, 1))
+        ingester, _ = self.ingester({'https://benhvien.vn/sitemap.xml': URLSET.encode('utf-8')}, enqueue=True)
+        with mock.patch('chatbot.sitemap_ingest.enqueue_knowledge_update') as enqueue:
+            stats = ingester.ingest(['https://benhvien.vn/sitemap.xml'])
+
+        self.assertEqual((stats['created'], stats['changed'], stats['unchanged']), (2, 1, 1))
+        enqueue.assert_called_once()
+        self.assertEqual(set(enqueue.call_args.args[0]),
+                         {'https://benhvien.vn/benh/cum', 'https://benhvien.vn/benh/zika',
+                          'https://benhvien.vn/benh/thuy-dau'})
+
+
+class HashedIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        words = ['sot', 'ho', 'dau', 'dau dau', 'met', 'moi', 'phat', 'ban', 'non', 'tieu', 'chay', 'virus', 'cum']
+        self.texts = [' '.join(rng.choice(words, size=int(rng.integers(1, 12)))) for _ in range(45)]
+
+    def single_pass(self, n_features):
+        """TF-IDF của cả tập trong một lần, không chia shard"""
+        tf = hashed_index.make_hasher(n_features).transform(self.texts)
+        df = np.asarray((tf > 0).sum(axis=0)).ravel()
+        tfidf = tf.multiply((np.log((1 + len(self.texts)) / (1 + df)) + 1).reshape(1, -1)).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1))).reshape(-1, 1)
+        return tfidf.multiply(1 / norms).toarray()
+
+    def test_sharded_build_matches_single_pass(self):
+        expected = self.single_pass(2 ** 12)
+        for workers in (1, 2):
+            with self.subTest(workers=workers), mock.patch.object(hashed_index, 'SHARD_SIZE', 7):
+                index = hashed_index.HashedTfidfIndex.build(self.texts, workers=workers, n_features=2 ** 12)
+                self.assertEqual(index.n_docs, len(self.texts))
+                np.testing.assert_allclose(index.matrix.toarray(), expected, rtol=1e-5, atol=1e-6)
+
+    def test_incremental_add_matches_build(self):
+        built = hashed_index.HashedTfidfIndex.build(self.texts, n_features=2 ** 12)
+        added = hashed_index.HashedTfidfIndex.build(self.texts[:20], n_features=2 ** 12)
+        added.add(self.texts[20:31])
+        added.add(self.texts[31:])
+        np.testing.assert_array_equal(added.df, built.df)
+        np.testing.assert_allclose(added.matrix.toarray(), built.matrix.toarray(), rtol=1e-6)
+
+    def test_similarities_match_tfidf_vectorizer(self):
+        index = hashed_index.HashedTfidfIndex.build(self.texts)
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2))
+        tfidf = vectorizer.fit_transform(self.texts)
+        queries = ['sot ho', 'dau dau met moi', 'phat ban virus']
+        np.testing.assert_allclose((index.matrix @ index.matrix.T).toarray(), (tfidf @ tfidf.T).toarray(),
+                                   rtol=1e-4, atol=1e-5)
+        # n-gram chưa gặp vẫn có cột băm (TfidfVectorizer bỏ qua), chỉ làm điểm cả truy vấn đổi cùng một tỉ lệ
+        hashed_scores = (index.transform(queries) @ index.matrix.T).toarray()
+        tfidf_scores = (vectorizer.transform(queries) @ tfidf.T).toarray()
+        np.testing.assert_allclose(hashed_scores / hashed_scores.max(axis=1, keepdims=True),
+                                   tfidf_scores / tfidf_scores.max(axis=1, keepdims=True), rtol=1e-4, atol=1e-5)
+
+
+class ChatReadRouterTests(TestCase):
+    @override_settings(DATABASE_ROUTERS=['chatbot.storage.ChatReadRouter'])
+    def test_knowledge_reads_go_to_the_snapshot_inside_chat_reads(self):
+        with mock.patch.object(storage, 'read_snapshot_available', return_value=True):
+            self.assertEqual(Disease.objects.all().db, 'default')
+            with storage.chat_reads():
+                self.assertEqual(Disease.objects.all().db, storage.READ_ALIAS)
+                self.assertEqual(DiseaseSymptom.objects.all().db, storage.READ_ALIAS)
+                # Bảng chat và mọi lệnh ghi luôn ở primary
+                self.assertEqual(ChatMessage.objects.all().db, 'default')
+                self.assertEqual(router.db_for_write(Disease), 'default')
+                self.assertFalse(router.allow_migrate(storage.READ_ALIAS, 'chatbot', model_name='disease'))
+            self.assertEqual(Disease.objects.all().db, 'default')
+
+        with mock.patch.object(storage, 'read_snapshot_available', return_value=False), storage.chat_reads():
+            self.assertEqual(Disease.objects.all().db, 'default')
+
+
+class ReadSnapshotRefreshTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.primary = os.path.join(directory.name, 'db.sqlite3')
+        self.snapshot = os.path.join(directory.name, 'db.read.sqlite3')
+        self.write_primary('CREATE TABLE chatbot_statscounter (name TEXT UNIQUE, value INTEGER)',
+                           'CREATE TABLE chatbot_disease (name TEXT)',
+                           f"INSERT INTO chatbot_statscounter VALUES ('{kb_revision.REVISION_COUNTER}', 1)",
+                           "INSERT INTO chatbot_disease VALUES ('Cúm')")
+        self.revision = 1
+
+        for patcher in (mock.patch.object(storage, 'read_database', return_value={
+                            'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.snapshot}),
+                        mock.patch.dict(settings.DATABASES['default'], NAME=self.primary),
+                        mock.patch.object(kb_revision, 'current', lambda: self.revision)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_primary(self, *statements):
+        conn = sqlite3.connect(self.primary)
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+        conn.close()
+
+    def snapshot_diseases(self):
+        conn = sqlite3.connect(self.snapshot)
+        try:
+            return [name for name, in conn.execute('SELECT name FROM chatbot_disease ORDER BY name')]
+        finally:
+            conn.close()
+
+    def add_disease(self, name):
+        self.revision += 1
+        self.write_primary(f"INSERT INTO chatbot_disease VALUES ('{name}')",
+                           f"UPDATE chatbot_statscounter SET value = {self.revision}")
+
+    def test_refreshes_after_a_knowledge_base_write(self):
+        self.assertEqual(storage.refresh_read_snapshot(), 1)
+        self.assertEqual(self.snapshot_diseases(), ['Cúm'])
+
+        with override_settings(CHATBOT_READ_SNAPSHOT_INTERVAL=0):
+            self.add_disease('Sởi')
+            self.assertEqual(storage.refresh_read_snapshot(), 2)
+        self.assertEqual(self.snapshot_diseases(), ['Cúm', 'Sởi'])
+
+    def test_refresh_is_rate_limited_and_skipped_when_current(self):
+        storage.refresh_read_snapshot()
+        os.utime(self.snapshot, (0, 0))
+        with override_settings(CHATBOT_READ_SNAPSHOT_INTERVAL=0):
+            self.assertEqual(storage.refresh_read_snapshot(), 1)
+        # Snapshot đã ở số hiệu hiện tại: không sao chép lại
+        self.assertEqual(os.path.getmtime(self.snapshot), 0)
+        os.utime(self.snapshot)
+
+        with override_settings(CHATBOT_READ_SNAPSHOT_INTERVAL=3600):
+            self.add_disease('Sởi')
+            self.assertEqual(storage.refresh_read_snapshot(), 1)
+            self.assertEqual(self.snapshot_diseases(), ['Cúm'])
+            self.assertEqual(storage.refresh_read_snapshot(force=True), 2)
+        self.assertEqual(self.snapshot_diseases(), ['Cúm', 'Sởi'])
+
+
+def linear_name_scan(entries, text):
+    """Quét không dùng index: mỗi vị trí thử từng cụm (dài trước) với lần lượt mọi tên, mục thêm trước thắng"""
+    keys = [(kind, obj_id, name_keys(name)) for kind, obj_id, name in entries]
+    max_words = max([len(key.split()) for _, _, names in keys for key in names] + [1])
+
+    def lookup(phrase):
+        for kind, obj_id, names in keys:
+            if phrase in names:
+                return kind, obj_id
+        if phrase.isascii() and len(phrase) >= MIN_FOLDED_KEY_LENGTH:
+            for kind, obj_id, names in keys:
+                if phrase in {unidecode(key) for key in names}:
+                    return kind, obj_id
+        return None
+
+    words = symptom_vocabulary.normalize_words(text)
+    found = []
+    i = 0
+    while i < len(words):
+        for size in range(min(max_words, len(words) - i), 0, -1):
+            phrase = ' '.join(words[i:i + size])
+            if size == 1 and phrase in symptom_vocabulary.AMBIGUOUS_SINGLE_WORDS:
+                continue
+            hit = lookup(phrase)
+            if hit:
+                found.append(hit)
+                i += size
+                break
+        else:
+            i += 1
+    return list(dict.fromkeys(found))
+
+
+class NameIndexTests(SimpleTestCase):
+    NAMES = [
+        (DISEASE, 1, 'Bệnh viêm gan B (Hepatitis B)'), (DISEASE, 2, 'Cúm'), (DISEASE, 3, 'Lao'),
+        (DISEASE, 4, 'Sốt xuất huyết / Dengue'), (DISEASE, 5, 'Bệnh tay chân miệng'), (DISEASE, 6, 'Sởi'),
+        (DISEASE, 7, 'Sốt'), (DISEASE, 8, '<b>Zika</b>'), (SYMPTOM, 1, 'sốt'), (SYMPTOM, 2, 'ho'),
+        (SYMPTOM, 3, 'đau đầu'), (SYMPTOM, 4, 'sốt cao'), (SYMPTOM, 5, 'yếu'), (SYMPTOM, 6, 'phát ban'),
+    ]
+
+    def index(self, entries):
+        index = NameIndex()
+        for kind, obj_id, name in entries:
+            index.add(kind, obj_id, name)
+        return index
+
+    def test_examples(self):
+        index = self.index(self.NAMES)
+        self.assertEqual(index.scan('tôi bị sốt cao và ho, có phải viêm gan b không?'),
+                         [(SYMPTOM, 4), (SYMPTOM, 2), (DISEASE, 1)])
+        self.assertEqual(index.scan('sot xuat huyet'), [(DISEASE, 4)])
+        self.assertEqual(index.scan('hepatitis b'), [(DISEASE, 1)])
+        # Tên một từ trùng từ thông dụng chỉ khớp kèm "bệnh"; tên lẫn markup không được index
+        self.assertEqual(index.scan('lao động'), [])
+        self.assertEqual(index.scan('bệnh lao'), [(DISEASE, 3)])
+        self.assertEqual(index.scan('zika'), [])
+
+    def test_matches_linear_scan(self):
+        rng = np.random.default_rng(5)
+        words = [word for _, _, name in self.NAMES for word in symptom_vocabulary.normalize_words(name)]
+        words += ['tôi', 'bị', 'và', 'không', 'bệnh', 'chủ', 'yếu']
+        for _ in range(300):
+            entries = [self.NAMES[i] for i in rng.permutation(len(self.NAMES))[:int(rng.integers(1, 15))]]
+            text = ' '.join(rng.choice(words, size=int(rng.integers(1, 10))))
+            if rng.random() < 0.5:
+                text = unidecode(text)
+            with self.subTest(text=text):
+                self.assertEqual(self.index(entries).scan(text), linear_name_scan(entries, text))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class StubSession:
+    """Session trả lần lượt các kết quả đã định (mã trạng thái, exception hoặc hàm gọi lúc gửi)"""
+
+    def __init__(self, *outcomes):
+        self.headers = {}
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if callable(outcome):
+            outcome = outcome()
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(b'')
+        return response
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    URL = 'https://benhvien.vn/benh/cum'
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple('chatbot.http_client.time', monotonic=self.clock.monotonic,
+                                      sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch_client(self, *outcomes, **kwargs):
+        options = dict(max_retries=0, failure_threshold=3, reset_timeout=60)
+        options.update(kwargs)
+        return FetchClient(session=StubSession(*outcomes), **options)
+
+    def open_circuit(self, client):
+        for _ in range(3):
+            self.assertEqual(client.get(self.URL).status_code, 503)
+        self.assertTrue(client.is_open(self.URL))
+
+    def test_opens_after_consecutive_failures(self):
+        client = self.fetch_client(200, 503, 503, 200, 503, requests.ConnectionError('refused'), 503)
+        # Thành công ở giữa đặt lại số lỗi liên tiếp
+        for _ in range(4):
+            client.get(self.URL)
+        self.assertFalse(client.is_open(self.URL))
+        client.get(self.URL)
+        with self.assertRaises(requests.ConnectionError):
+            client.get(self.URL)
+        self.assertFalse(client.is_open(self.URL))
+        client.get(self.URL)
+        self.assertTrue(client.is_open(self.URL))
+
+        with self.assertRaisesRegex(CircuitOpenError, 'open'):
+            client.get(self.URL)
+        self.assertEqual(client.session.calls, 7)
+        # Host khác không bị ảnh hưởng
+        self.assertFalse(client.is_open('https://vnvc.vn/'))
+
+    def test_half_open_probe_closes_on_success(self):
+        client = self.fetch_client(503, 503, 503)
+        self.open_circuit(client)
+        self.clock.now += 59
+        with self.assertRaises(CircuitOpenError):
+            client.get(self.URL)
+
+        self.clock.now += 1
+
+        def probe():
+            # Trong lúc request thăm dò đang chạy, request khác tới host vẫn bị từ chối
+            with self.assertRaisesRegex(CircuitOpenError, 'half-open'):
+                client.get(self.URL)
+            return 200
+
+        client.session.outcomes += [probe, 200]
+        self.assertEqual(client.get(self.URL).status_code, 200)
+        self.assertFalse(client.is_open(self.URL))
+        self.assertEqual(client.get(self.URL).status_code, 200)
+        self.assertEqual(client.circuit('benhvien.vn').failures, 0)
+
+    def test_failed_probe_reopens_for_another_cooldown(self):
+        client = self.fetch_client(503, 503, 503, requests.Timeout('slow'))
+        self.open_circuit(client)
+        self.clock.now += 60
+        with self.assertRaises(requests.Timeout):
+            client.get(self.URL)
+        self.assertTrue(client.is_open(self.URL))
+        self.clock.now += 59
+        with self.assertRaises(CircuitOpenError):
+            client.get(self.URL)
+
+    def test_retry_after_extends_the_cooldown(self):
+        client = self.fetch_client(503, 503, (503, {'Retry-After': '300'}))
+        self.open_circuit(client)
+        self.clock.now += 120
+        self.assertTrue(client.is_open(self.URL))
+        self.clock.now += 180
+        self.assertFalse(client.is_open(self.URL))
+
+    def test_errors_not_caused_by_the_host_release_the_probe(self):
+        client = self.fetch_client(503, 503, 503, requests.exceptions.InvalidURL('bad url'), 200)
+        self.open_circuit(client)
+        self.clock.now += 60
+        with self.assertRaises(requests.exceptions.InvalidURL):
+            client.get(self.URL)
+        self.assertEqual(client.get(self.URL).status_code, 200)
+
+    def test_retries_with_backoff_within_the_budget(self):
+        client = self.fetch_client(requests.ConnectionError('reset'), 502, 200, max_retries=2, total_timeout=45)
+        with mock.patch('chatbot.http_client.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual(client.get(self.URL).status_code, 200)
+        self.assertEqual(self.clock.now, 1000.0 + 0.5 + 1.0)
+        self.assertEqual(client.circuit('benhvien.vn').failures, 0)
+
+
+class NormalizeUrlTests(SimpleTestCase):
+    def test_normalize_url(self):
+        cases = {
+            'https://VinMec.com/vi/Benh-Cum/?utm_source=fb#trieu-chung': 'https://vinmec.com/vi/Benh-Cum',
+            'HTTPS://vinmec.com:443/': 'https://vinmec.com/',
+            'http://vinmec.com:80': 'http://vinmec.com/',
+            'https://vinmec.com:8443//vi//benh/': 'https://vinmec.com:8443/vi/benh',
+            'https://vinmec.com./benh': 'https://vinmec.com/benh',
+            '  https://vinmec.com/benh  ': 'https://vinmec.com/benh',
+            'mailto:info@vinmec.com': None,
+            'javascript:void(0)': None,
+            '/vi/benh': None,
+        }
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(normalize_url(url), expected)
+        self.assertEqual(normalize_url('../benh-soi/#top', 'https://vinmec.com/vi/benh/cum'),
+                         'https://vinmec.com/vi/benh-soi')
+
+
+class DiscoveryFrontierTests(SimpleTestCase):
+    def crawl(self, pages, seeds, **kwargs):
+        """Khám phá trên đồ thị trang giả: pages là {url: [href]}"""
+        fetched = []
+
+        def fetch_links(url):
+            fetched.append(url)
+            return [(href, 'bệnh') for href in pages.get(url, [])]
+
+        frontier = DiscoveryFrontier(lambda url: True, respect_robots=False, max_workers=2, client=object(), **kwargs)
+        with mock.patch.object(frontier, 'fetch_links', fetch_links):
+            discovered = frontier.crawl(seeds)
+        return frontier, fetched, {item['url'] for item in discovered}
+
+    def test_per_host_page_limit_and_allowed_hosts(self):
+        pages = {
+            'https://a.vn/': [f'/benh-{i}' for i in range(10)] + ['https://b.vn/benh', 'https://c.vn/'],
+            'https://c.vn/': ['/benh-1', '/benh-2', 'https://a.vn/benh-1#x'],
+        }
+        pages.update({f'https://a.vn/benh-{i}': ['/benh-0', f'/benh-{i}/chi-tiet'] for i in range(10)})
+        frontier, fetched, discovered = self.crawl(pages, ['https://a.vn', 'https://c.vn/'], max_pages_per_host=3)
+
+        self.assertEqual(frontier.pages_per_host, {'a.vn': 3, 'c.vn': 3})
+        self.assertEqual(len(fetched), len(set(fetched)))
+        # Link tới host không phải seed được ghi nhận nhưng không được crawl
+        self.assertIn('https://b.vn/benh', discovered)
+        self.assertNotIn('b.vn', {url.split('/')[2] for url in fetched})
+        self.assertIn('https://a.vn/benh-9', discovered)
+
+    def test_total_page_budget_and_depth(self):
+        pages = {
+            'https://a.vn/': ['/benh-1', '/benh-2'],
+            'https://a.vn/benh-1': ['/benh-1/sau'],
+            'https://a.vn/benh-1/sau': ['/benh-1/sau/hon'],
+            'https://x.vn/': ['/benh-3'],
+        }
+        _, fetched, discovered = self.crawl(pages, ['https://a.vn/'], max_depth=1)
+        self.assertEqual(sorted(fetched), ['https://a.vn/', 'https://a.vn/benh-1', 'https://a.vn/benh-2'])
+        self.assertIn('https://a.vn/benh-1/sau', discovered)
+        self.assertNotIn('https://a.vn/benh-1/sau/hon', discovered)
+
+        _, fetched, _ = self.crawl(pages, ['https://a.vn/', 'https://x.vn/'], max_pages=2)
+        self.assertEqual(len(fetched), 2)
+
+
+class StubSourceManager:
+    nlp_processor = None
+    update_interval_for = HealthSourceManager.update_interval_for
+
+
+class RefreshSchedulerTests(TestCase):
+    NOW = datetime(2024, 6, 1, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.scheduler = RefreshScheduler(StubSourceManager(), max_concurrency=2)
+
+    def source(self, pk=1, **fields):
+        return URLSource(pk=pk, url=f'https://benhvien.vn/benh/{pk}', **fields)
+
+    def test_due_time_follows_update_frequency(self):
+        daily = TrustedSource(domain='benhvien.vn', update_frequency='daily')
+        updated = self.NOW - timedelta(hours=3)
+        due = self.scheduler.next_due_at
+        self.assertEqual(due(self.source(), self.NOW), self.NOW)  # chưa crawl lần nào
+        self.assertEqual(due(self.source(last_updated=updated), self.NOW), updated + timedelta(days=7))
+        self.assertEqual(due(self.source(last_updated=updated, trusted_source=daily), self.NOW),
+                         updated + timedelta(days=1))
+        # Sitemap báo trang đã đổi sau lần cập nhật cuối: đến hạn ngay
+        self.assertEqual(due(self.source(last_updated=updated, sitemap_lastmod=self.NOW - timedelta(hours=1)),
+                             self.NOW), self.NOW)
+
+    def test_failure_backoff_doubles_with_fixed_jitter_and_cap(self):
+        failed_at = self.NOW - timedelta(minutes=5)
+        delays = []
+        for failures in range(1, 13):
+            source = self.source(pk=7, failure_count=failures, last_failure_at=failed_at,
+                                 last_updated=self.NOW - timedelta(days=30))
+            due = self.scheduler.next_due_at(source, self.NOW)
+            self.assertEqual(self.scheduler.next_due_at(source, self.NOW), due)
+            delays.append(due - failed_at)
+
+        for failures, delay in enumerate(delays, 1):
+            expected = min(timedelta(minutes=15) * 2 ** (failures - 1), timedelta(days=1))
+            with self.subTest(failures=failures):
+                self.assertGreaterEqual(delay, expected * 0.9)
+                self.assertLessEqual(delay, expected * 1.1)
+        self.assertLess(delays[0], delays[1])
+        # Jitter khác nhau giữa các nguồn lỗi cùng lúc
+        other = self.scheduler.next_due_at(self.source(pk=8, failure_count=1, last_failure_at=failed_at), self.NOW)
+        self.assertNotEqual(other - failed_at, delays[0])
+
+    def test_dispatches_only_due_sources_within_concurrency(self):
+        submitted = []
+        executor = mock.Mock(submit=lambda func, source_id, url: submitted.append(source_id) or Future())
+        now_ts = self.NOW.timestamp()
+        self.scheduler.heap = [(now_ts - 60, 0, 1, 'a'), (now_ts - 30, 1, 2, 'b'), (now_ts - 10, 2, 3, 'c'),
+                               (now_ts + 60, 3, 4, 'd')]
+        with mock.patch('chatbot.refresh_scheduler.time.time', return_value=now_ts):
+            self.scheduler.dispatch_due(executor)
+            self.assertEqual(submitted, [1, 2])
+            self.scheduler.in_flight.clear()
+            self.scheduler.dispatch_due(executor)
+        self.assertEqual(submitted, [1, 2, 3])
+        self.assertEqual([entry[2] for entry in self.scheduler.heap], [4])
+
+    def test_bandwidth_budget_defers_dispatch(self):
+        clock = FakeClock()
+        with mock.patch('chatbot.refresh_scheduler.time.monotonic', clock.monotonic):
+            budget = BandwidthBudget(1000, burst_seconds=2)
+            budget.consume(5000)
+            self.assertEqual(budget.wait_time(), 3.0)
+            clock.now += 1
+            self.assertEqual(budget.wait_time(), 2.0)
+            clock.now += 2
+            self.assertEqual(budget.wait_time(), 0.0)
+
+    def test_failed_refresh_is_requeued_with_backoff(self):
+        source = URLSource.objects.create(url='https://benhvien.vn/benh/cum', last_updated=self.NOW,
+                                          failure_count=1, last_failure_at=self.NOW)
+        future = Future()
+        future.set_result((False, 0, 'HTTP 503'))
+        self.scheduler.in_flight[future] = (source.pk, source.url)
+        with mock.patch('chatbot.refresh_scheduler.timezone.now', return_value=self.NOW):
+            self.scheduler.collect(0)
+
+        (due_ts, _, source_id, _), = self.scheduler.heap
+        self.assertEqual(source_id, source.pk)
+        self.assertGreaterEqual(due_ts - self.NOW.timestamp(), 15 * 60 * 0.9)
+        self.assertLessEqual(due_ts - self.NOW.timestamp(), 15 * 60 * 1.1)
+        self.assertEqual(self.scheduler.stats['failed'], 1)
@@ -0,0 +1,127 @@
+from urllib.parse import urlparse
+
+# Danh sách nguồn đáng tin cậy cho y tế Việt Nam.
+# Được đồng bộ vào bảng TrustedSource (xem HealthSourceManager.sync_trusted_sources).
+TRUSTED_SOURCES = {
+    'government': [
+        {
+            'url': 'https://moh.gov.vn/tin-tuc-su-kien',
+            'name': 'Bộ Y tế Việt Nam',
+            'reliability': 5,
+            'update_frequency': 'daily',
+            'content_types': ['news', 'guidelines', 'health_alerts']
+        },
+        {
+            'url': 'https://kcb.vn/',
+            'name': 'Cổng thông tin khám chữa bệnh',
+            'reliability': 5,
+            'update_frequency': 'daily',
+            'content_types': ['healthcare_facilities', 'medical_procedures']
+        }
+    ],
+    'medical_centers': [
+        {
+            'url': 'https://vnvc.vn/cac-benh-truyen-nhiem-thuong-gap/',
+            'name': 'VNVC - Trung tâm tiêm chủng',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['infectious_diseases', 'vaccines', 'prevention']
+        },
+        {
+            'url': 'https://www.vinmec.com/vi/bai-viet/cac-benh-truyen-nhiem-thuong-gap-175',
+            'name': 'Vinmec International Hospital',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['diseases', 'treatments', 'health_tips']
+        },
+        {
+            'url': 'https://benhvienbachmai.vn/tin-tuc-su-kien/',
+            'name': 'Bệnh viện Bạch Mai',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_news', 'treatments', 'specialties']
+        },
+        {
+            'url': 'https://www.108.vn/benh-vien/danh-sach-benh-vien',
+            'name': 'Bệnh viện Trung ương Quân đội 108',
+            'reliability': 4,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_services', 'health_information']
+        }
+    ],
+    'health_portals': [
+        {
+            'url': 'https://suckhoedoisong.vn/benh-truyen-nhiem/',
+            'name': 'Sức khỏe đời sống',
+            'reliability': 3,
+            'update_frequency': 'daily',
+            'content_types': ['health_news', 'lifestyle', 'disease_info']
+        },
+        {
+            'url': 'https://hellobacsi.com/benh-truyen-nhiem/',
+            'name': 'Hello Bacsi',
+            'reliability': 3,
+            'update_frequency': 'daily',
+            'content_types': ['health_articles', 'medical_advice', 'symptoms']
+        },
+        {
+            'url': 'https://nhathuoclongchau.com.vn/bai-viet/cac-benh-truyen-nhiem-thuong-gap.html',
+            'name': 'Nhà thuốc Long Châu',
+            'reliability': 3,
+            'update_frequency': 'weekly',
+            'content_types': ['medications', 'health_tips', 'disease_prevention']
+        }
+    ],
+    'international': [
+        {
+            'url': 'https://medlineplus.gov/languages/vietnamese.html',
+            'name': 'MedlinePlus Vietnamese',
+            'reliability': 5,
+            'update_frequency': 'weekly',
+            'content_types': ['medical_encyclopedia', 'health_topics', 'drug_information']
+        },
+        {
+            'url': 'https://www.who.int/vietnam/health-topics',
+            'name': 'WHO Vietnam',
+            'reliability': 5,
+            'update_frequency': 'weekly',
+            'content_types': ['global_health', 'disease_outbreaks', 'health_guidelines']
+        }
+    ]
+}
+
+
+def normalize_domain(url):
+    """Chuẩn hóa domain của URL: chữ thường, bỏ port và tiền tố www."""
+    netloc = urlparse(url).netloc.lower()
+    if '@' in netloc:
+        netloc = netloc.rsplit('@', 1)[1]
+    netloc = netloc.split(':', 1)[0].rstrip('.')
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc
+
+
+def domain_candidates(domain):
+    """Domain và các domain cha (tin.moh.gov.vn -> moh.gov.vn), dùng để tra cứu bằng index"""
+    parts = domain.split('.')
+    return ['.'.join(parts[i:]) for i in range(len(parts) - 1)] or [domain]
+
+
+def match_domain(domain, by_domain):
+    """Tìm giá trị trong dict {domain: ...} khớp domain hoặc domain cha gần nhất"""
+    for candidate in domain_candidates(domain):
+        if candidate in by_domain:
+            return by_domain[candidate]
+    return None
+
+
+def reliability_label(reliability):
+    if reliability is None:
+        return 'unknown'
+    if reliability >= 4:
+        return 'high'
+    elif reliability >= 3:
+        return 'medium'
+    else:
+        return 'low'
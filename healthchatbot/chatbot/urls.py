@@ -11,12 +11,14 @@ try:
     router.register(r'symptoms', views.SymptomViewSet)
     router.register(r'chatbot', views.ChatbotViewSet, basename='chatbot')
     router.register(r'sources', views.SourceViewSet, basename='sources')
+    router.register(r'jobs', views.KnowledgeJobViewSet, basename='jobs')
 except AttributeError as e:
     print(f"Warning: Some ViewSets not available: {e}")
 
 urlpatterns = [
     path('api/', include(router.urls)),
     path('', views.chatbot_view, name='chatbot'),
+    path('api/export/<str:kind>/', views.export_data, name='export_data'),
     
     # Test endpoint (optional)
     path('api/test-extraction/', views.test_extraction, name='test_extraction'),
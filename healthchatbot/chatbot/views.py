@@ -1,37 +1,38 @@
 # chatbot/views.py - Version cơ bản để fix lỗi
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+import time
 import uuid
 import logging
+from django.db import IntegrityError
 
 # Import models
-from .models import Disease, Symptom, ChatSession, ChatMessage, URLSource
+from .models import Disease, Symptom, ChatSession, ChatMessage, URLSource, KnowledgeUpdateJob
 
 # Import serializers
 from .serializers import DiseaseSerializer, SymptomSerializer, ChatSessionSerializer, ChatMessageSerializer
 
-# Import processors (with error handling)
-try:
-    from .nlp_processor import ImprovedNLPProcessor
-except ImportError:
-    # Fallback to original processor if new one not available
-    try:
-        from .nlp_processor import NLPProcessor as ImprovedNLPProcessor
-    except ImportError:
-        ImprovedNLPProcessor = None
+# Processor dùng chung cho cả worker, tự hoán đổi index khi knowledge base thay đổi
+from . import shared_processor, stats_snapshot, chat_archive, data_export, storage, metrics, session_state, admission
+from .knowledge_jobs import enqueue_knowledge_update, serialize_job
+from .autocomplete import MAX_SUGGESTIONS
 
 logger = logging.getLogger(__name__)
 
+OVERLOADED_MESSAGE = 'Hệ thống đang quá tải, vui lòng thử lại sau giây lát'
+
 # ViewSet cho Disease
 class DiseaseViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Disease.objects.all()
+    queryset = Disease.objects.filter(duplicate_of__isnull=True)
     serializer_class = DiseaseSerializer
     
     def get_queryset(self):
-        queryset = Disease.objects.all()
+        queryset = Disease.objects.filter(duplicate_of__isnull=True)
         name = self.request.query_params.get('name')
         if name:
             queryset = queryset.filter(name__icontains=name)
@@ -51,22 +52,72 @@ class SymptomViewSet(viewsets.ReadOnlyModelViewSet):
 
 # ViewSet cho Chatbot
 class ChatbotViewSet(viewsets.ViewSet):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
+    @property
+    def nlp_processor(self):
         try:
-            if ImprovedNLPProcessor:
-                self.nlp_processor = ImprovedNLPProcessor()
-                logger.info("ImprovedNLPProcessor initialized successfully")
-            else:
-                self.nlp_processor = None
+            processor = shared_processor.get_processor()
+            if processor is None:
                 logger.warning("NLP Processor not available")
+            return processor
         except Exception as e:
             logger.error(f"Error initializing NLP Processor: {e}")
-            self.nlp_processor = None
+            return None
         
+    def session_state(self, session_id):
+        """Ngữ cảnh của phiên từ store trong bộ nhớ; khi không có thì lấy/tạo ChatSession và dựng lại từ tin nhắn cũ"""
+        store = session_state.get_store()
+        state = store.get(session_id)
+        if state is not None:
+            metrics.incr('session_cache_hits')
+            # Ghi nhận lần hoạt động cuối (dùng để chọn phiên cần lưu trữ), tối đa một lần mỗi TOUCH_INTERVAL giây
+            now = time.monotonic()
+            if now - state.touched_at >= session_state.TOUCH_INTERVAL:
+                ChatSession.objects.filter(pk=state.session_pk).update(updated_at=timezone.now())
+                state.touched_at = now
+            return state
+        
+        metrics.incr('session_cache_misses')
+        session, created = ChatSession.objects.get_or_create(session_id=session_id)
+        if not created:
+            ChatSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+            state = session_state.rehydrate(session, self.nlp_processor)
+        else:
+            state = session_state.SessionState(session_id, session.pk)
+        store.put(state)
+        return state
+    
     @action(detail=False, methods=['post'])
     def message(self, request):
-        """Xử lý tin nhắn từ người dùng"""
+        """Xử lý tin nhắn từ người dùng, qua kiểm soát tải (token bucket theo client, giới hạn đồng thời, deadline)"""
+        try:
+            with admission.admit(request):
+                return self.handle_message(request)
+        except admission.Shed as shed:
+            return self.shed_response(request, shed)
+    
+    def shed_response(self, request, shed):
+        """Trả lời ngay request bị từ chối, kèm câu trả lời gần đây cho cùng tin nhắn nếu có"""
+        fallback = admission.get_fallbacks().get(request.data.get('message'))
+        if fallback is not None:
+            metrics.incr('admission_fallback_answers')
+        
+        response = Response({
+            'session_id': request.data.get('session_id'),
+            'error': OVERLOADED_MESSAGE,
+            'reason': shed.reason,
+            'response': fallback,
+            'fallback': fallback is not None
+        }, status=shed.status_code)
+        response['Retry-After'] = str(shed.retry_after)
+        return response
+    
+    def is_reusable_answer(self, result):
+        """Câu trả lời thật (tìm thấy bệnh/triệu chứng), không phụ thuộc ngữ cảnh phiên: dùng lại được khi phải
+        từ chối request; thông báo lỗi và câu "không đủ thông tin" không được lưu làm câu trả lời dự phòng"""
+        return (not result.get('error') and not result['follow_up']
+                and bool(result['diseases'] or result['symptoms']))
+    
+    def handle_message(self, request):
         try:
             session_id = request.data.get('session_id')
             message = request.data.get('message')
@@ -74,27 +125,51 @@ class ChatbotViewSet(viewsets.ViewSet):
             if not message:
                 return Response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Tạo hoặc lấy session
+            # Ngữ cảnh phiên lấy từ store trong bộ nhớ; chỉ chạm database khi phiên chưa có trong store
             if not session_id:
                 session_id = str(uuid.uuid4())
-                session = ChatSession.objects.create(session_id=session_id)
-            else:
-                try:
-                    session = ChatSession.objects.get(session_id=session_id)
-                except ChatSession.DoesNotExist:
-                    session = ChatSession.objects.create(session_id=session_id)
+            state = self.session_state(session_id)
+            
+            # Client đã hết thời gian chờ (hàng đợi, khóa SQLite khi lấy phiên): từ chối trước khi lưu gì,
+            # không để lại tin nhắn người dùng không có câu trả lời
+            admission.check_deadline()
             
             # Lưu tin nhắn người dùng
-            user_message = ChatMessage.objects.create(
-                session=session,
-                sender='user',
-                message=message
-            )
+            try:
+                user_message = ChatMessage.objects.create(
+                    session_id=state.session_pk,
+                    sender='user',
+                    message=message
+                )
+            except IntegrityError:
+                # Phiên đã bị xóa/chuyển sang lưu trữ ở process khác: lấy lại từ database
+                session_state.get_store().discard(session_id)
+                state = self.session_state(session_id)
+                user_message = ChatMessage.objects.create(
+                    session_id=state.session_pk,
+                    sender='user',
+                    message=message
+                )
+            
+            # Hết thời gian chờ trong lúc lưu tin nhắn: không xử lý tiếp, nhưng lưu câu trả lời lỗi để
+            # lịch sử phiên không có tin nhắn bị bỏ lửng
+            try:
+                admission.check_deadline()
+            except admission.Shed:
+                ChatMessage.objects.create(session_id=state.session_pk, sender='bot', message=OVERLOADED_MESSAGE)
+                raise
             
             # Xử lý tin nhắn và tạo phản hồi
-            if self.nlp_processor:
+            nlp_processor = self.nlp_processor
+            if nlp_processor:
                 try:
-                    response_text = self.nlp_processor.process_query(message)
+                    # Đọc knowledge base từ snapshot/replica (profile 'split'), không chờ khóa ghi của ingestion
+                    with storage.chat_reads():
+                        result = nlp_processor.answer_query(message, state)
+                    response_text = result['response']
+                    state.remember(result['diseases'], result['symptoms'])
+                    if self.is_reusable_answer(result):
+                        admission.get_fallbacks().put(message, response_text)
                 except Exception as e:
                     logger.error(f"Error processing query: {e}")
                     response_text = "Xin lỗi, đã xảy ra lỗi khi xử lý tin nhắn của bạn. Vui lòng thử lại."
@@ -103,7 +178,7 @@ class ChatbotViewSet(viewsets.ViewSet):
             
             # Lưu tin nhắn bot
             bot_message = ChatMessage.objects.create(
-                session=session,
+                session_id=state.session_pk,
                 sender='bot',
                 message=response_text
             )
@@ -113,15 +188,70 @@ class ChatbotViewSet(viewsets.ViewSet):
                 'response': response_text
             })
             
+        except admission.Shed:
+            raise
         except Exception as e:
             logger.error(f"Error in message endpoint: {e}")
             return Response({
                 'error': 'Đã xảy ra lỗi hệ thống'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """Lịch sử một phiên chat, gồm cả phần đã chuyển sang lưu trữ"""
+        try:
+            session_id = request.query_params.get('session_id')
+            if not session_id:
+                return Response({"error": "No session_id provided"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            history = chat_archive.session_history(session_id)
+            if history is None:
+                return Response({"error": "Session not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            messages, archived = history
+            return Response({
+                'session_id': session_id,
+                'archived': archived,
+                'messages': messages
+            })
+            
+        except Exception as e:
+            logger.error(f"Error getting chat history: {e}")
+            return Response({
+                'error': 'Lỗi khi lấy lịch sử hội thoại'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Gợi ý tên bệnh/triệu chứng cho đoạn cuối đang gõ (có dấu hoặc không dấu)"""
+        try:
+            query = request.query_params.get('q', '')
+            try:
+                limit = min(max(int(request.query_params.get('limit', 8)), 1), MAX_SUGGESTIONS)
+            except ValueError:
+                return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            nlp_processor = self.nlp_processor
+            if not query.strip() or nlp_processor is None:
+                fragment, suggestions = '', []
+            else:
+                fragment, suggestions = nlp_processor.suggest(query, limit)
+            
+            return Response({
+                'query': query,
+                'fragment': fragment,
+                'suggestions': suggestions
+            })
+            
+        except Exception as e:
+            logger.error(f"Error getting suggestions: {e}")
+            return Response({
+                'error': 'Lỗi khi lấy gợi ý'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
     @action(detail=False, methods=['post'])
     def update_knowledge(self, request):
-        """Cập nhật knowledge base từ URL"""
+        """Đưa yêu cầu cập nhật knowledge base từ URL vào hàng đợi"""
         try:
             urls = request.data.get('urls', [])
             
@@ -146,41 +276,19 @@ class ChatbotViewSet(viewsets.ViewSet):
                     'message': 'Không có URL hợp lệ nào được cung cấp'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Lưu URL vào database nếu chưa có
-            for url in clean_urls:
-                URLSource.objects.get_or_create(url=url)
-            
-            # Cập nhật knowledge base
-            if self.nlp_processor:
-                try:
-                    total_diseases = self.nlp_processor.fetch_and_update_knowledge_base(clean_urls)
-                except Exception as e:
-                    logger.error(f"Error updating knowledge base: {e}")
-                    total_diseases = 0
-            else:
-                return Response({
-                    'success': False,
-                    'message': 'NLP Processor chưa được khởi tạo'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            # Cập nhật thông tin URLs
-            for url in clean_urls:
-                try:
-                    source = URLSource.objects.get(url=url)
-                    source.last_updated = timezone.now()
-                    source.save()
-                except URLSource.DoesNotExist:
-                    logger.warning(f"URL source not found: {url}")
+            # Đưa vào hàng đợi, worker (manage.py run_knowledge_worker) sẽ xử lý
+            job = enqueue_knowledge_update(clean_urls)
             
-            message = f'Đã cập nhật thành công knowledge base với {total_diseases} bệnh từ {len(clean_urls)} URL'
+            message = f'Đã đưa {len(clean_urls)} URL vào hàng đợi cập nhật (job #{job.pk})'
             logger.info(message)
             
             return Response({
                 'success': True,
                 'message': message,
-                'imported_diseases': total_diseases,
+                'job_id': job.pk,
+                'status': job.status,
                 'processed_urls': len(clean_urls)
-            })
+            }, status=status.HTTP_202_ACCEPTED)
             
         except Exception as e:
             error_message = f'Lỗi khi cập nhật knowledge base: {str(e)}'
@@ -194,14 +302,8 @@ class ChatbotViewSet(viewsets.ViewSet):
     def stats(self, request):
         """Lấy thống kê về knowledge base"""
         try:
-            stats = {
-                'total_diseases': Disease.objects.count(),
-                'total_symptoms': Symptom.objects.count(),
-                'total_sessions': ChatSession.objects.count(),
-                'total_messages': ChatMessage.objects.count(),
-                'total_sources': URLSource.objects.count(),
-                'active_sources': URLSource.objects.filter(active=True).count(),
-            }
+            # Snapshot được duy trì bởi signal và cache ngắn hạn, không COUNT(*) trên mỗi request
+            stats = stats_snapshot.get_stats()
             
             return Response(stats)
             
@@ -211,6 +313,25 @@ class ChatbotViewSet(viewsets.ViewSet):
                 'error': 'Lỗi khi lấy thống kê'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'])
+    def metrics(self, request):
+        """Bộ đếm vận hành của đường chat (cộng dồn từ mọi worker) và các tỉ lệ suy ra"""
+        try:
+            values = metrics.snapshot()
+
+            return Response({
+                'counters': values,
+                'correction_rate': metrics.rate(values, 'queries_corrected', 'queries'),
+                # Trạng thái hàng đợi của worker trả lời request này
+                'admission': admission.get_limiter().snapshot()
+            })
+
+        except Exception as e:
+            logger.error(f"Error getting metrics: {e}")
+            return Response({
+                'error': 'Lỗi khi lấy số liệu vận hành'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # ViewSet cho Source management
 class SourceViewSet(viewsets.ViewSet):
     def list(self, request):
@@ -266,11 +387,64 @@ class SourceViewSet(viewsets.ViewSet):
                 'message': f'Error deleting source: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# ViewSet cho trạng thái các job cập nhật knowledge base
+class KnowledgeJobViewSet(viewsets.ViewSet):
+    def list(self, request):
+        """Lấy danh sách các job gần đây"""
+        try:
+            jobs = KnowledgeUpdateJob.objects.all()[:20]
+            return Response([serialize_job(job) for job in jobs])
+            
+        except Exception as e:
+            logger.error(f"Error listing jobs: {e}")
+            return Response({
+                'error': 'Lỗi khi lấy danh sách job'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def retrieve(self, request, pk=None):
+        """Lấy trạng thái và tiến độ theo từng URL của một job"""
+        try:
+            job = KnowledgeUpdateJob.objects.get(pk=pk)
+            return Response(serialize_job(job))
+            
+        except (KnowledgeUpdateJob.DoesNotExist, ValueError):
+            return Response({
+                'error': f'Job not found: {pk}'
+            }, status=status.HTTP_404_NOT_FOUND)
+
 # View cho Template
 def chatbot_view(request):
     """Render trang chatbot"""
     return render(request, 'chatbot/chatbot.html')
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, kind):
+    """Xuất dữ liệu dạng NDJSON theo luồng (sessions, messages, diseases, symptoms, sources)
+
+    Chỉ dành cho tài khoản staff: sessions/messages chứa toàn bộ hội thoại sức khỏe của người dùng.
+    Tham số: after=<id> để tiếp tục từ bản ghi cuối đã nhận, chunk_size=<n> số dòng mỗi truy vấn.
+    """
+    if kind not in data_export.EXPORTERS:
+        return Response({
+            'error': f'Loại dữ liệu không hợp lệ, chọn một trong: {", ".join(data_export.EXPORTERS)}'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        after = int(request.query_params.get('after', 0))
+        chunk_size = int(request.query_params.get('chunk_size', 0)) or None
+    except ValueError:
+        return Response({'error': 'after và chunk_size phải là số nguyên'}, status=status.HTTP_400_BAD_REQUEST)
+    if chunk_size is not None:
+        chunk_size = max(1, min(chunk_size, 5000))
+    
+    response = StreamingHttpResponse(
+        data_export.export_lines(kind, chunk_size=chunk_size, after=after),
+        content_type='application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.ndjson"'
+    return response
+
 # Test endpoints (optional - có thể thêm sau)
 @api_view(['POST'])
 def test_extraction(request):
@@ -292,14 +466,14 @@ def test_extraction(request):
             }, status=400)
         
         # Simple test implementation
-        import requests
         from bs4 import BeautifulSoup
+        from .http_client import get_client
         
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=30)
+        response = get_client().get(url, headers=headers)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -59,6 +59,56 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+
+# Cache: 'default' trong bộ nhớ của từng process (bộ đếm thống kê, TTL ngắn); 'pages' lưu HTML đã tải
+# (chatbot/page_cache.py) trên đĩa để mọi process dùng chung: discover_sources, importer, knowledge worker
+# ghi vào, score_sources và các process trong pool đọc lại thay vì tải lại trang
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CHATBOT_PAGE_CACHE_DIR', BASE_DIR / 'cache' / 'pages'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Giới hạn tần suất theo client ở /api/chatbot/message/ (chatbot/admission.py) dùng REMOTE_ADDR. Khi chạy
+# sau reverse proxy, mọi người dùng có cùng REMOTE_ADDR (địa chỉ proxy): đặt CHATBOT_CLIENT_IP_HEADER là
+# header proxy ghi địa chỉ client vào (vd. X-Forwarded-For, X-Real-IP) và CHATBOT_TRUSTED_PROXIES là số
+# proxy tin cậy nối tiếp. Chỉ bật khi app chỉ nhận request qua proxy, nếu không client tự đặt được header.
+CHATBOT_CLIENT_IP_HEADER = os.environ.get('CHATBOT_CLIENT_IP_HEADER') or None
+CHATBOT_TRUSTED_PROXIES = int(os.environ.get('CHATBOT_TRUSTED_PROXIES', 1))
+
+# Storage profile (biến môi trường CHATBOT_STORAGE_PROFILE):
+# - 'default': SQLite với cấu hình mặc định
+# - 'concurrent': WAL (reader không chờ writer), busy timeout, giữ kết nối giữa các request
+# - 'split': như 'concurrent', thêm bản sao snapshot chỉ đọc cho đường chat (xem chatbot/storage.py),
+#   được làm mới khi kb_revision thay đổi; ingestion vẫn ghi vào primary
+CHATBOT_STORAGE_PROFILE = os.environ.get('CHATBOT_STORAGE_PROFILE', 'default')
+
+if CHATBOT_STORAGE_PROFILE in ('concurrent', 'split'):
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # busy timeout (giây) khi chờ khóa ghi
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+        },
+    })
+
+if CHATBOT_STORAGE_PROFILE == 'split':
+    DATABASES['chat_read'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('CHATBOT_READ_DATABASE', BASE_DIR / 'db.read.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 5, 'init_command': 'PRAGMA query_only=1'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['chatbot.storage.ChatReadRouter']
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True  # Đặt là True trong môi trường phát triển
 